@@ -0,0 +1,4 @@
+"""
+PurpleBrain-AI Enhanced Backend
+Agent platform package - servers, registry and shared runtime services
+"""
@@ -0,0 +1,258 @@
+"""
+PurpleBrain-AI Resource Accounting
+Per-request CPU, memory, token, upstream, cache, database and queueing costs, rolled up through nested agents
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import tracemalloc
+import contextvars
+import collections.abc
+from contextlib import contextmanager
+from typing import Any, Callable, Coroutine, Dict, Iterator, Optional
+from weakref import WeakKeyDictionary
+
+logger = logging.getLogger(__name__)
+
+ACCOUNTING_ENABLED = os.environ.get('PURPLEBRAIN_ACCOUNTING', '1') == '1'
+# Peak memory needs tracemalloc, which slows every allocation down; only for capacity tests
+ACCOUNTING_MEMORY = os.environ.get('PURPLEBRAIN_ACCOUNTING_MEMORY', '0') == '1'
+
+if ACCOUNTING_ENABLED and ACCOUNTING_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+_current: contextvars.ContextVar[Optional['ResourceUsage']] = contextvars.ContextVar(
+    'purplebrain_usage', default=None
+)
+# Usage trees are small and updates are a few additions, so one lock serves them all
+_lock = threading.Lock()
+# Tasks whose steps are already being timed, and by which wrapper; a nested agent run in the same task is not timed twice
+_metered_tasks: 'WeakKeyDictionary[asyncio.Task, _Metered]' = WeakKeyDictionary()
+
+
+class _NoopUsage:
+    """Stands in for a usage scope while accounting is disabled"""
+
+    recording = False
+
+    def to_dict(self) -> None:
+        return None
+
+
+NOOP_USAGE = _NoopUsage()
+
+
+class ResourceUsage:
+    """What one request or agent run has cost so far; every addition also counts for the enclosing runs"""
+
+    recording = True
+
+    def __init__(self, parent: Optional['ResourceUsage'] = None):
+        self.parent = parent
+        self.cpu_s = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.db_write_bytes = 0
+        self.queue_wait_s = 0.0
+        self.upstream_calls: Dict[str, int] = {}
+        self.cache_hits: Dict[str, int] = {}
+        self._memory_base = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self.peak_memory_bytes = 0 if self._memory_base is not None else None
+
+    def _chain(self) -> Iterator['ResourceUsage']:
+        usage = self
+        while usage is not None:
+            yield usage
+            usage = usage.parent
+
+    def add(self, **amounts):
+        with _lock:
+            for usage in self._chain():
+                for name, amount in amounts.items():
+                    setattr(usage, name, getattr(usage, name) + amount)
+
+    def count(self, field: str, name: str, n: int = 1):
+        with _lock:
+            for usage in self._chain():
+                counts = getattr(usage, field)
+                counts[name] = counts.get(name, 0) + n
+
+    def observe_memory(self, traced: int):
+        """Raise the peak of every enclosing scope that started below `traced` bytes"""
+        with _lock:
+            for usage in self._chain():
+                if usage._memory_base is not None:
+                    usage.peak_memory_bytes = max(usage.peak_memory_bytes, traced - usage._memory_base)
+
+    def merge(self, snapshot: Dict):
+        """Add a run accounted elsewhere (a process-pool worker); its peak memory is not ours to add"""
+        self.add(cpu_s=snapshot['cpu_ms'] / 1000, prompt_tokens=snapshot['prompt_tokens'],
+                 completion_tokens=snapshot['completion_tokens'], db_write_bytes=snapshot['db_write_bytes'],
+                 queue_wait_s=snapshot['queue_wait_ms'] / 1000)
+        for name, n in snapshot['upstream_calls'].items():
+            self.count('upstream_calls', name, n)
+        for name, n in snapshot['cache_hits'].items():
+            self.count('cache_hits', name, n)
+
+    def to_dict(self) -> Dict:
+        with _lock:
+            return {
+                'cpu_ms': round(self.cpu_s * 1000, 3),
+                'peak_memory_bytes': self.peak_memory_bytes,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'upstream_calls': dict(self.upstream_calls),
+                'cache_hits': dict(self.cache_hits),
+                'db_write_bytes': self.db_write_bytes,
+                'queue_wait_ms': round(self.queue_wait_s * 1000, 3)
+            }
+
+
+def current() -> Optional[ResourceUsage]:
+    return _current.get()
+
+
+@contextmanager
+def usage_scope() -> Iterator[Any]:
+    """Account everything run inside (sub-agents included) to a new scope, which also counts for the enclosing one"""
+    if not ACCOUNTING_ENABLED:
+        yield NOOP_USAGE
+        return
+    usage = ResourceUsage(_current.get())
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+        if usage._memory_base is not None:
+            usage.observe_memory(tracemalloc.get_traced_memory()[0])
+
+
+def snapshot() -> Optional[Dict]:
+    """The current scope's usage so far, including the step still running (None outside a scope)"""
+    usage = _current.get()
+    if usage is None:
+        return None
+    try:
+        meter = _metered_tasks.get(asyncio.current_task())
+    except RuntimeError:  # no running loop (a worker thread)
+        meter = None
+    if meter is not None:
+        meter.checkpoint()
+    return usage.to_dict()
+
+
+def add(**amounts):
+    usage = _current.get()
+    if usage is not None:
+        usage.add(**amounts)
+
+
+def count_upstream(name: str):
+    usage = _current.get()
+    if usage is not None:
+        usage.count('upstream_calls', name)
+
+
+def count_cache_hit(kind: str):
+    usage = _current.get()
+    if usage is not None:
+        usage.count('cache_hits', kind)
+
+
+def merge(snapshot: Optional[Dict]):
+    usage = _current.get()
+    if usage is not None and snapshot:
+        usage.merge(snapshot)
+
+
+def _charge(cpu_s: float):
+    usage = _current.get()
+    if usage is None:
+        return
+    usage.add(cpu_s=cpu_s)
+    if usage._memory_base is not None:
+        usage.observe_memory(tracemalloc.get_traced_memory()[0])
+
+
+class _Metered(collections.abc.Coroutine):
+    """Coroutine wrapper that charges the thread CPU time of each step to the scope current after the step
+
+    Other requests' work on a shared loop runs between steps, so it is never
+    counted; child tasks (branches, hedged calls) are timed when they run an
+    agent or a completion.
+    """
+
+    __slots__ = ('_coroutine', '_timed', '_started')
+
+    def __init__(self, coroutine: Coroutine):
+        self._coroutine = coroutine
+        self._timed = None
+        self._started = 0.0
+
+    def _step(self, method: Callable, *args) -> Any:
+        if self._timed is None:
+            task = asyncio.current_task()
+            self._timed = task is not None and task not in _metered_tasks
+            if self._timed:
+                _metered_tasks[task] = self
+        if not self._timed:
+            return method(*args)
+        self._started = time.thread_time()
+        try:
+            return method(*args)
+        except BaseException:
+            # StopIteration included: the coroutine is done
+            _metered_tasks.pop(asyncio.current_task(), None)
+            raise
+        finally:
+            _charge(time.thread_time() - self._started)
+
+    def checkpoint(self):
+        """Charge the running step so far (for a snapshot taken mid-step)"""
+        now = time.thread_time()
+        _charge(now - self._started)
+        self._started = now
+
+    def send(self, value: Any) -> Any:
+        return self._step(self._coroutine.send, value)
+
+    def throw(self, *args) -> Any:
+        return self._step(self._coroutine.throw, *args)
+
+    def close(self):
+        self._coroutine.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Any:
+        return self.send(None)
+
+
+def metered(coroutine: Coroutine) -> Coroutine:
+    """`coroutine`, with its CPU time charged to the current usage scope"""
+    if not ACCOUNTING_ENABLED:
+        return coroutine
+    return _Metered(coroutine)
+
+
+def _timed_call(func: Callable, args: tuple, kwargs: Dict) -> Any:
+    started = time.thread_time()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _charge(time.thread_time() - started)
+
+
+async def to_thread(func: Callable, *args, **kwargs) -> Any:
+    """asyncio.to_thread, with the worker thread's CPU time charged to the current usage scope"""
+    if not ACCOUNTING_ENABLED or _current.get() is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await asyncio.to_thread(_timed_call, func, args, kwargs)
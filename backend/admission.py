@@ -0,0 +1,135 @@
+"""
+PurpleBrain-AI Admission Control
+Priority-aware load shedding in front of the agent registry, answered with 503 + Retry-After
+"""
+
+import os
+import math
+import logging
+import threading
+from typing import Dict, Optional
+
+from backend import deadlines
+from backend.registry import AgentRegistry
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_OPTION = 'priority'
+DEFAULT_PRIORITY = 'interactive'
+
+# Queue delay the head of an agent's queue may reach before interactive requests are shed
+QUEUE_TARGET_MS = float(os.environ.get('PURPLEBRAIN_ADMISSION_TARGET_MS', 1000))
+ADMISSION_ENABLED = os.environ.get('PURPLEBRAIN_ADMISSION', '1') == '1'
+MAX_RETRY_AFTER_S = 60
+
+# Lower classes give up earlier: a smaller share of the wait queue and a tighter queue-delay target.
+# Critical requests are only refused by the registry's hard queue limit (or a deadline they cannot meet).
+PRIORITY_CLASSES = {
+    'critical': {'queue_share': 1.0, 'delay_factor': None},
+    'interactive': {'queue_share': 0.75, 'delay_factor': 1.0},
+    'batch': {'queue_share': 0.25, 'delay_factor': 0.25},
+}
+
+
+class Overloaded(RuntimeError):
+    """Request refused before queueing; the client should retry after `retry_after` seconds"""
+
+    def __init__(self, key: str, priority: str, reason: str, retry_after: int):
+        super().__init__(f"Agent {key} is overloaded ({reason}); {priority} request shed, retry in {retry_after}s")
+        self.key = key
+        self.priority = priority
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_priority(options: Optional[Dict] = None, default: str = DEFAULT_PRIORITY) -> str:
+    """Priority class from task options; unknown classes are a client error"""
+    priority = (options or {}).get(PRIORITY_OPTION) or default
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority '{priority}', expected one of {', '.join(PRIORITY_CLASSES)}")
+    return priority
+
+
+class AdmissionController:
+    """Decides per request whether an agent can still serve it within its latency targets
+
+    Uses what the registry already tracks: slots in use, queued requests,
+    how long the head of the queue has waited and recent service times.
+    Shedding at the door keeps accepted requests fast, so goodput holds
+    under overload instead of every request timing out in a long queue.
+    """
+
+    def __init__(self, registry: AgentRegistry, target_ms: float = QUEUE_TARGET_MS,
+                 enabled: bool = ADMISSION_ENABLED):
+        self.registry = registry
+        self.target = target_ms / 1000
+        self.enabled = enabled
+        self._counts: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, priority: str, outcome: str):
+        with self._lock:
+            counts = self._counts.setdefault(key, {}).setdefault(priority, {'admitted': 0, 'shed': 0})
+            counts[outcome] += 1
+
+    def expected_wait(self, key: str) -> Optional[float]:
+        """Seconds a request arriving now would queue, from recent service times (None before any)"""
+        runtime = self.registry.runtime(key)
+        service = runtime.service_time.percentile(50)
+        if service is None:
+            return None
+        slots = runtime.slots
+        if slots.in_use < slots.limit and not slots.queued:
+            return 0.0
+        return (slots.queued + 1) * service / slots.limit
+
+    def retry_after(self, key: str) -> int:
+        """Whole seconds until the current backlog should have drained"""
+        runtime = self.registry.runtime(key)
+        drain = max(self.expected_wait(key) or 0.0, runtime.slots.oldest_wait())
+        return max(1, min(MAX_RETRY_AFTER_S, math.ceil(drain)))
+
+    def admit(self, key: str, priority: str = DEFAULT_PRIORITY, deadline_ms: Optional[float] = None):
+        """Raise Overloaded if `key` cannot take a `priority` request now
+
+        Without `deadline_ms`, the enclosing request scope's deadline (if any) applies.
+        """
+        reason = self._shed_reason(key, priority, deadline_ms) if self.enabled else None
+        if reason is None:
+            self._count(key, priority, 'admitted')
+            return
+        self._count(key, priority, 'shed')
+        retry_after = self.retry_after(key)
+        logger.info(f"Shedding {priority} request for {key}: {reason}")
+        raise Overloaded(key, priority, reason, retry_after)
+
+    def _shed_reason(self, key: str, priority: str, deadline_ms: Optional[float]) -> Optional[str]:
+        runtime = self.registry.runtime(key)
+        slots = runtime.slots
+        if slots.in_use < slots.limit and not slots.queued:
+            return None
+        policy = PRIORITY_CLASSES[priority]
+        if policy['delay_factor'] is not None:
+            waited = slots.oldest_wait()
+            if waited > self.target * policy['delay_factor']:
+                return f"queue delay {waited * 1000:.0f}ms"
+            if slots.queued >= slots.max_queue * policy['queue_share']:
+                return f"{slots.queued} requests queued"
+        budget = deadline_ms / 1000 if deadline_ms else deadlines.remaining()
+        expected = self.expected_wait(key)
+        if budget is not None and expected is not None:
+            finish = expected + runtime.service_time.percentile(50)
+            if finish > budget:
+                # It would only time out and take a slot from a request that can finish
+                return f"expected to finish in {finish * 1000:.0f}ms, after its deadline"
+        return None
+
+    def stats(self, key: str) -> Dict:
+        with self._lock:
+            classes = {priority: dict(counts) for priority, counts in self._counts.get(key, {}).items()}
+        return {
+            'enabled': self.enabled,
+            'queue_delay_ms': round(self.registry.runtime(key).slots.oldest_wait() * 1000, 1),
+            'expected_wait_s': self.expected_wait(key),
+            'priorities': classes
+        }
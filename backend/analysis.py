@@ -0,0 +1,199 @@
+"""
+PurpleBrain-AI Analysis Kernels
+CPU-bound data profiling and text scoring, run in the process pool via cpu_stage
+"""
+
+import re
+import math
+from collections import Counter
+from typing import Any, Dict, List, Sequence
+
+from backend.cpu_tasks import cpu_stage
+from backend.payloads import TextColumn
+
+# Sentence ends that are not really sentence ends
+_ABBREVIATIONS = {
+    'dr', 'mr', 'mrs', 'ms', 'prof', 'inc', 'ltd', 'co', 'corp', 'vs', 'etc',
+    'e.g', 'i.e', 'u.s', 'u.k', 'no', 'fig', 'approx', 'est', 'jan', 'feb',
+    'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec'
+}
+_SENTENCE_END = re.compile(r'([.!?]+)(["\')\]]*)\s+(?=["\'(\[]?[A-Z0-9*#])')
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_STOPWORDS = {
+    'the', 'a', 'an', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'with', 'is',
+    'are', 'was', 'were', 'be', 'by', 'as', 'at', 'that', 'this', 'it', 'its',
+    'from', 'has', 'have', 'had', 'will', 'can', 'their', 'which', 'these'
+}
+
+# Distinct values tracked per text column before we stop counting exactly
+_MAX_TRACKED_DISTINCT = 10000
+
+
+def table_columns(data: Dict) -> Dict[str, Sequence]:
+    """Columns of a task.data payload, columnar ({'col': [...]}) or records ({'rows': [{...}]})"""
+    records = data.get('rows') or data.get('records')
+    if isinstance(records, list) and records and isinstance(records[0], dict):
+        columns: Dict[str, List] = {}
+        for index, record in enumerate(records):
+            # A record that is not an object is an empty row
+            for key, value in (record.items() if isinstance(record, dict) else ()):
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = [None] * index
+                column.append(value)
+            for key, column in columns.items():
+                if len(column) <= index:
+                    column.append(None)
+        return columns
+    return {
+        key: value for key, value in data.items()
+        if isinstance(value, (list, tuple, memoryview, TextColumn)) and len(value) > 0
+    }
+
+
+def _is_null(value: Any) -> bool:
+    return value is None or value == '' or (isinstance(value, float) and math.isnan(value))
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    position = (len(sorted_values) - 1) * q
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return sorted_values[lower]
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def profile_column(values: Sequence) -> Dict:
+    """Single-column profile: completeness, numeric moments and quantiles, top values"""
+    count = len(values)
+    numbers: List[float] = []
+    text_counts: Counter = Counter()
+    nulls = 0
+    mean = 0.0
+    m2 = 0.0
+
+    for value in values:
+        if _is_null(value):
+            nulls += 1
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            numbers.append(value)
+            # Welford's running variance
+            delta = value - mean
+            mean += delta / len(numbers)
+            m2 += delta * (value - mean)
+        elif len(text_counts) < _MAX_TRACKED_DISTINCT or value in text_counts:
+            text_counts[str(value)] += 1
+
+    profile = {
+        'count': count,
+        'nulls': nulls,
+        'completeness': (count - nulls) / count if count else 0.0,
+    }
+    if numbers and len(numbers) >= len(text_counts):
+        numbers.sort()
+        profile.update({
+            'kind': 'numeric',
+            'min': numbers[0],
+            'max': numbers[-1],
+            'mean': mean,
+            'std': math.sqrt(m2 / len(numbers)) if len(numbers) > 1 else 0.0,
+            'quantiles': {
+                'p25': _quantile(numbers, 0.25),
+                'p50': _quantile(numbers, 0.5),
+                'p75': _quantile(numbers, 0.75),
+            },
+        })
+    else:
+        profile.update({
+            'kind': 'categorical',
+            'distinct': len(text_counts),
+            'distinct_is_exact': len(text_counts) < _MAX_TRACKED_DISTINCT,
+            'top_values': text_counts.most_common(5),
+        })
+    return profile
+
+
+@cpu_stage
+def profile_data(data: Dict) -> Dict:
+    """Profile every column of a task.data payload"""
+    columns = table_columns(data)
+    profiles = {name: profile_column(values) for name, values in columns.items()}
+    rows = max((p['count'] for p in profiles.values()), default=0)
+    completeness = (
+        sum(p['completeness'] for p in profiles.values()) / len(profiles) if profiles else 0.0
+    )
+    return {
+        'rows': rows,
+        'columns': profiles,
+        'numeric_columns': [n for n, p in profiles.items() if p['kind'] == 'numeric'],
+        'categorical_columns': [n for n, p in profiles.items() if p['kind'] == 'categorical'],
+        'completeness': completeness
+    }
+
+
+def split_sentences(text: str) -> List[str]:
+    """Rule-based sentence segmentation that survives abbreviations and decimals"""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        candidate = text[start:match.end(2)]
+        last_word = candidate[:match.start(1) - start].rsplit(None, 1)[-1:] or ['']
+        if match.group(1) == '.' and last_word[0].lower().rstrip('.') in _ABBREVIATIONS:
+            continue
+        if match.group(1) == '.' and len(last_word[0]) == 1 and last_word[0].isupper():
+            continue  # initials such as "J. Smith"
+        sentences.append(candidate.strip())
+        start = match.end()
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+@cpu_stage
+def segment_claims(text: str, min_length: int = 20, limit: int = 5) -> List[str]:
+    """Sentences long enough to carry a factual claim"""
+    claims = []
+    for sentence in split_sentences(text):
+        cleaned = sentence.strip(' *#-\n\t')
+        if len(cleaned) > min_length:
+            claims.append(cleaned)
+            if len(claims) >= limit:
+                break
+    return claims
+
+
+def _terms(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+@cpu_stage
+def score_claims(claims: List[str], references: List[str]) -> List[Dict]:
+    """TF-IDF cosine similarity of each claim against its best supporting reference"""
+    documents = [Counter(_terms(text)) for text in list(claims) + list(references)]
+    document_frequency: Counter = Counter()
+    for terms in documents:
+        document_frequency.update(terms.keys())
+    total = len(documents)
+
+    def weigh(terms: Counter) -> Dict[str, float]:
+        vector = {t: c * (math.log((1 + total) / (1 + document_frequency[t])) + 1) for t, c in terms.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {t: w / norm for t, w in vector.items()}
+
+    claim_vectors = [weigh(terms) for terms in documents[:len(claims)]]
+    reference_vectors = [weigh(terms) for terms in documents[len(claims):]]
+
+    scores = []
+    for vector in claim_vectors:
+        best_score, best_index = 0.0, None
+        for index, reference in enumerate(reference_vectors):
+            if len(reference) < len(vector):
+                score = sum(w * vector.get(t, 0.0) for t, w in reference.items())
+            else:
+                score = sum(w * reference.get(t, 0.0) for t, w in vector.items())
+            if score > best_score:
+                best_score, best_index = score, index
+        scores.append({'similarity': best_score, 'reference_index': best_index})
+    return scores
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+PurpleBrain-AI Bulk Runner
+Offline agent runs over JSONL/CSV query files with checkpoint/resume and compressed output
+
+    python -m backend.bulk_cli queries.jsonl --agent research --output results.jsonl.gz --workers 32
+    python -m backend.bulk_cli queries.csv --agent visualization --output results_parquet/ --format parquet
+
+Re-running the same command after a crash (or Ctrl-C) skips every item already
+committed to the output. Each input line/row is either a JSON object with at
+least a "query" (optional "id", "agent", "data", "style", "options") or a bare
+JSON string; CSV files need a "query" column ("data" and "options" cells hold
+JSON). Lines and rows that cannot be parsed are recorded as failed items.
+"""
+
+import os
+import csv
+import sys
+import glob
+import gzip
+import json
+import time
+import asyncio
+import argparse
+import logging
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import zstandard
+except ImportError:  # .jsonl.zst output is optional; gzip is always available
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # Parquet output is optional
+    pyarrow = None
+
+from backend import deadlines
+from backend.server import AgentTask, agents, history
+from backend.registry import AgentBusyError
+from backend.payloads import payload_store, to_wire
+from backend.datasets import datasets
+
+logger = logging.getLogger('purplebrain.bulk')
+
+TASK_FIELDS = ('data', 'style', 'format', 'options')
+JSON_CELLS = ('data', 'options')
+# Marks an input line/row that could not be parsed; it is recorded as a failed item
+INVALID = '__invalid__'
+PARQUET_COLUMNS = ('id', 'agent', 'query', 'success', 'execution_time', 'error')
+
+# A busy agent queue is back-pressure, not a failure
+BUSY_RETRY_DELAY = 0.5
+
+
+# Input --------------------------------------------------------------------
+
+def _decode_cells(row: Dict, number: int) -> Dict:
+    """CSV cells of structured task fields hold JSON text"""
+    for field in JSON_CELLS:
+        if field in row:
+            try:
+                row[field] = json.loads(row[field])
+            except ValueError as e:
+                row[INVALID] = f"row {number}: '{field}' is not valid JSON ({e})"
+    return row
+
+
+def read_items(path: str) -> Iterator[Tuple[str, Dict]]:
+    """(key, item) pairs; the key is the item's id or its 1-based line/row number
+
+    A line or row that cannot be parsed is still yielded, marked INVALID,
+    so it fails on its own instead of stopping the run.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as source:
+        if '.csv' in os.path.basename(path):
+            for number, row in enumerate(csv.DictReader(source), 1):
+                row = _decode_cells({k: v for k, v in row.items() if v not in (None, '')}, number)
+                yield str(row.get('id') or f"#{number}"), row
+            return
+        for number, line in enumerate(source, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                yield f"#{number}", {'query': line[:200], INVALID: f"line {number} is not valid JSON ({e})"}
+                continue
+            if isinstance(item, str):
+                item = {'query': item}
+            elif not isinstance(item, dict):
+                yield f"#{number}", {INVALID: f"line {number} is neither a JSON object nor a string"}
+                continue
+            yield str(item.get('id') or f"#{number}"), item
+
+
+# Progress -----------------------------------------------------------------
+
+class Checkpoint:
+    """Append-only progress log: a header line, then one line per committed chunk
+
+    Each chunk line names the items it finished and the output position
+    after them. A line torn by a crash is cut off on load, so the output
+    and the log always agree on what is done.
+    """
+
+    def __init__(self, path: str, header: Dict):
+        self.path = path
+        self.done: Set[str] = set()
+        self.failed: Set[str] = set()
+        self.sink_state: Dict = {}
+        self.resumed = os.path.exists(path)
+        if self.resumed:
+            self._load(header)
+        else:
+            with open(path, 'w', encoding='utf-8') as log:
+                log.write(json.dumps(header) + '\n')
+
+    def _load(self, header: Dict):
+        valid = 0
+        with open(self.path, 'rb') as log:
+            lines = log.readlines()
+        for index, line in enumerate(lines):
+            if not line.endswith(b'\n'):
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if index == 0:
+                mismatched = {k for k in ('input', 'output', 'format') if entry.get(k) != header[k]}
+                if mismatched:
+                    raise SystemExit(f"{self.path} belongs to a different run ({', '.join(sorted(mismatched))} "
+                                     f"differ); remove it or pick another --checkpoint")
+            else:
+                self.done.update(entry['done'])
+                self.failed.difference_update(entry['done'])
+                self.failed.update(entry['failed'])
+                self.sink_state = entry['sink']
+            valid += len(line)
+        with open(self.path, 'r+b') as log:
+            log.truncate(valid)
+
+    def commit(self, done: List[str], failed: List[str], sink_state: Dict):
+        with open(self.path, 'a', encoding='utf-8') as log:
+            log.write(json.dumps({'done': done, 'failed': failed, 'sink': sink_state, 'at': time.time()}) + '\n')
+            log.flush()
+            os.fsync(log.fileno())
+        self.done.update(done)
+        self.failed.difference_update(done)
+        self.failed.update(failed)
+        self.sink_state = sink_state
+
+
+# Output -------------------------------------------------------------------
+
+class JsonlSink:
+    """Compressed JSONL; every chunk is one complete gzip/zstd member appended to the file"""
+
+    def __init__(self, path: str, state: Dict):
+        self.path = path
+        self.codec = 'zstd' if path.endswith('.zst') else 'gzip'
+        if self.codec == 'zstd' and zstandard is None:
+            raise SystemExit("zstandard is not installed; use a .jsonl.gz output instead")
+        offset = state.get('offset', 0)
+        if offset and not os.path.exists(path):
+            raise SystemExit(f"Checkpoint expects {path} ({offset} bytes) but it is missing")
+        # Anything past the last committed chunk is a torn write from the crashed run
+        self.file = open(path, 'r+b' if os.path.exists(path) else 'wb')
+        self.file.truncate(offset)
+        self.file.seek(offset)
+
+    def write(self, records: List[Dict]) -> Dict:
+        raw = ''.join(json.dumps(record, default=str) + '\n' for record in records).encode('utf-8')
+        if self.codec == 'zstd':
+            data = zstandard.ZstdCompressor(level=6).compress(raw)
+        else:
+            data = gzip.compress(raw, compresslevel=6)
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {'offset': self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """A directory of Parquet part files, readable as one dataset; parts are written atomically"""
+
+    def __init__(self, path: str, state: Dict):
+        if pyarrow is None:
+            raise SystemExit("pyarrow is not installed; use a .jsonl.gz output instead")
+        self.path = path
+        self.parts = state.get('parts', 0)
+        os.makedirs(path, exist_ok=True)
+        for part in glob.glob(os.path.join(path, 'part-*.parquet*')):
+            name = os.path.basename(part)
+            if name.endswith('.tmp') or int(name[5:10]) >= self.parts:
+                os.remove(part)
+
+    def write(self, records: List[Dict]) -> Dict:
+        # Agent results differ in shape, so they are kept as JSON text next to flat columns
+        table = pyarrow.Table.from_pylist([
+            {**{column: record.get(column) for column in PARQUET_COLUMNS},
+             'result': json.dumps(record.get('result'), default=str)}
+            for record in records
+        ])
+        target = os.path.join(self.path, f"part-{self.parts:05d}.parquet")
+        parquet.write_table(table, target + '.tmp', compression='zstd')
+        os.replace(target + '.tmp', target)
+        self.parts += 1
+        return {'parts': self.parts}
+
+    def close(self):
+        pass
+
+
+def open_sink(path: str, output_format: str, state: Dict):
+    if output_format == 'parquet':
+        return ParquetSink(path, state)
+    return JsonlSink(path, state)
+
+
+def detect_output_format(path: str) -> str:
+    return 'parquet' if path.endswith('.parquet') or path.endswith(os.sep) or os.path.isdir(path) else 'jsonl'
+
+
+# Runner -------------------------------------------------------------------
+
+class Throughput:
+    """Overall and recent items per second"""
+
+    def __init__(self, window: float = 30.0):
+        self.started = time.monotonic()
+        self.window = window
+        self._marks: deque = deque()
+
+    def add(self, count: int):
+        now = time.monotonic()
+        self._marks.append((now, count))
+        while self._marks and now - self._marks[0][0] > self.window:
+            self._marks.popleft()
+
+    def recent(self) -> float:
+        if len(self._marks) < 2:
+            return 0.0
+        span = self._marks[-1][0] - self._marks[0][0]
+        return sum(count for _, count in list(self._marks)[1:]) / span if span else 0.0
+
+    def overall(self, count: int) -> float:
+        elapsed = time.monotonic() - self.started
+        return count / elapsed if elapsed else 0.0
+
+
+async def run_item(key: str, item: Dict, default_agent: str, timeout: Optional[float]) -> Dict:
+    agent = item.get('agent', default_agent)
+    query = item.get('query')
+    # Output columns keep one type, whatever a malformed item held
+    record = {'id': key, 'agent': str(agent),
+              'query': query if query is None or isinstance(query, str) else json.dumps(query, default=str)}
+    payloads, leased = [], []
+    try:
+        if INVALID in item:
+            raise ValueError(item[INVALID])
+        task = AgentTask(query=query, **{k: item[k] for k in TASK_FIELDS if k in item})
+        if task.data:
+            task.data = payload_store.wrap(datasets.resolve(task.data, leased), payloads)
+        while True:
+            try:
+                with deadlines.request_scope(timeout * 1000 if timeout else None):
+                    result = await agents.run(agent, task)
+                break
+            except AgentBusyError:
+                await asyncio.sleep(BUSY_RETRY_DELAY)
+        return {**record, 'success': True, 'execution_time': result.get('execution_time', 0.0),
+                'result': to_wire(result.get('result'))}
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        return {**record, 'success': False, 'error': str(getattr(e, 'detail', e))}
+    finally:
+        payload_store.release(payloads)
+        datasets.release(leased)
+
+
+async def main(args) -> int:
+    output_format = args.format or detect_output_format(args.output)
+    checkpoint_path = args.checkpoint or f"{args.output.rstrip(os.sep)}.checkpoint"
+    if not os.path.exists(checkpoint_path) and os.path.exists(args.output) and not args.overwrite:
+        raise SystemExit(f"{args.output} already exists; pass --overwrite to replace it")
+    checkpoint = Checkpoint(checkpoint_path, {
+        'input': os.path.abspath(args.input),
+        'output': os.path.abspath(args.output),
+        'format': output_format,
+        'agent': args.agent
+    })
+    sink = open_sink(args.output, output_format, checkpoint.sink_state)
+
+    skip = checkpoint.done if args.retry_failed else checkpoint.done | checkpoint.failed
+    total = sum(1 for key, _ in read_items(args.input) if key not in skip)
+    logger.info(f"{'Resuming' if checkpoint.resumed else 'Starting'}: {total:,} items to run "
+                f"({len(checkpoint.done):,} already done, {len(checkpoint.failed):,} failed earlier)")
+
+    batch = history.batch()
+    work: asyncio.Queue = asyncio.Queue(maxsize=args.workers * 2)
+    finished: asyncio.Queue = asyncio.Queue()
+    throughput = Throughput()
+    counts = {'done': 0, 'failed': 0}
+
+    async def produce():
+        for key, item in read_items(args.input):
+            if key not in skip:
+                await work.put((key, item))
+        for _ in range(args.workers):
+            await work.put(None)
+
+    async def worker():
+        # Agent history goes to MongoDB in bulk, once per committed chunk
+        with history.batching(batch):
+            while True:
+                entry = await work.get()
+                if entry is None:
+                    return
+                await finished.put(await run_item(*entry, args.agent, args.timeout))
+
+    buffered: List[Dict] = []
+
+    async def commit():
+        if not buffered:
+            return
+        records = buffered[:]
+        buffered.clear()
+        sink_state = await asyncio.to_thread(sink.write, records)
+        if args.no_history:
+            batch.discard()
+        else:
+            await asyncio.to_thread(batch.flush)
+        checkpoint.commit(
+            [r['id'] for r in records if r['success']],
+            [r['id'] for r in records if not r['success']],
+            sink_state
+        )
+        throughput.add(len(records))
+
+    def report():
+        processed = counts['done'] + counts['failed']
+        recent = throughput.recent()
+        eta = f", ETA {(total - processed) / recent / 60:.1f} min" if recent else ''
+        logger.info(f"{processed:,}/{total:,} items ({counts['failed']:,} failed), "
+                    f"{recent:.1f}/s recent, {throughput.overall(processed):.1f}/s overall{eta}")
+
+    tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(worker()) for _ in range(args.workers)]
+    workers_done = asyncio.ensure_future(asyncio.gather(*tasks))
+    last_commit = last_report = time.monotonic()
+    getter = None
+
+    def take(record: Dict):
+        buffered.append(record)
+        counts['done' if record['success'] else 'failed'] += 1
+
+    try:
+        while not (workers_done.done() and finished.empty()):
+            # asyncio.wait (unlike wait_for) never swallows a Ctrl-C cancellation
+            getter = getter or asyncio.ensure_future(finished.get())
+            done, _ = await asyncio.wait({getter}, timeout=1.0)
+            if done:
+                take(getter.result())
+                getter = None
+            now = time.monotonic()
+            if len(buffered) >= args.chunk_size or now - last_commit >= args.commit_interval:
+                await commit()
+                last_commit = now
+            if now - last_report >= args.report_interval:
+                report()
+                last_report = now
+        workers_done.result()
+    finally:
+        if getter is not None:
+            getter.cancel()
+        if not workers_done.done():
+            workers_done.cancel()
+            await asyncio.gather(workers_done, return_exceptions=True)
+        # Whatever finished before an interrupt is still kept
+        while not finished.empty():
+            take(finished.get_nowait())
+        await asyncio.shield(commit())
+        sink.close()
+        agents.shutdown()
+        report()
+    return 1 if counts['failed'] else 0
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="JSONL or CSV file of queries (optionally .gz)")
+    parser.add_argument('--agent', default='research', help="agent for items without their own 'agent'")
+    parser.add_argument('--output', required=True, help="results .jsonl.gz / .jsonl.zst file or Parquet directory")
+    parser.add_argument('--format', choices=('jsonl', 'parquet'), help="default: from the output name")
+    parser.add_argument('--checkpoint', help="progress log (default: <output>.checkpoint)")
+    parser.add_argument('--workers', type=int, default=16, help="items in flight at once")
+    parser.add_argument('--timeout', type=float, help="per-item deadline in seconds")
+    parser.add_argument('--chunk-size', type=int, default=200, help="items per committed output chunk")
+    parser.add_argument('--commit-interval', type=float, default=30.0, help="commit at least this often (seconds)")
+    parser.add_argument('--report-interval', type=float, default=10.0, help="throughput report period (seconds)")
+    parser.add_argument('--retry-failed', action='store_true', help="re-run items that failed in an earlier run")
+    parser.add_argument('--no-history', action='store_true', help="do not write agent logs/results to MongoDB")
+    parser.add_argument('--overwrite', action='store_true', help="replace an existing output on a fresh run")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    try:
+        sys.exit(asyncio.run(main(parse_args())))
+    except KeyboardInterrupt:
+        logger.info("Interrupted; progress up to the last commit is saved, re-run the same command to resume")
+        sys.exit(130)
@@ -0,0 +1,341 @@
+"""
+PurpleBrain-AI Chart Data Engine
+Turns raw columns into render-ready chart data bounded by a pixel budget
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.analysis import table_columns
+from backend.cpu_tasks import cpu_stage
+
+# Defaults for a typical dashboard tile; callers override via task.options
+DEFAULT_BUDGET = {
+    'pixel_width': 1200,     # line charts keep at most one point per pixel
+    'max_categories': 24,    # bars beyond this are folded into "Other"
+    'max_slices': 8,         # pie slices beyond this are folded into "Other"
+    'histogram_bins': 30,
+    'heatmap_cells': 64,     # heatmap grid is at most this many cells per side
+    'heatmap_tile': 16       # cells per tile side, for progressive rendering
+}
+
+# Server-side (min, max) for each budget key; a client budget can shrink chart data, never unbound it
+BUDGET_LIMITS = {
+    'pixel_width': (3, 8192),    # LTTB keeps everything below 3 points
+    'max_categories': (1, 500),
+    'max_slices': (1, 50),
+    'histogram_bins': (1, 1000),
+    'heatmap_cells': (1, 512),
+    'heatmap_tile': (1, 64)
+}
+
+_TIME_COLUMN = re.compile(r'(^|_)(time|timestamp|date|datetime|day|week|month|year|period|ts)($|_)', re.I)
+_MISSING = '(missing)'
+_OTHER = 'Other'
+
+
+def resolve_budget(budget: Optional[Dict] = None) -> Dict[str, int]:
+    """DEFAULT_BUDGET with a client's overrides, each clamped to BUDGET_LIMITS (unusable values ignored)"""
+    resolved = dict(DEFAULT_BUDGET)
+    for key, value in (budget.items() if isinstance(budget, dict) else ()):
+        if key not in BUDGET_LIMITS:
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError, OverflowError):
+            continue
+        low, high = BUDGET_LIMITS[key]
+        resolved[key] = min(max(value, low), high)
+    return resolved
+
+
+def _as_float(value: Any) -> float:
+    """A cell as a number; anything that is not one (text, bad numbers, nested values) is NaN"""
+    if isinstance(value, (int, float)):
+        try:
+            return float(value)
+        except OverflowError:
+            return np.nan
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return np.nan
+    return np.nan
+
+
+def as_float_array(values: Sequence) -> np.ndarray:
+    """float64 array over a column; zero-copy for float64 memoryviews, non-numeric cells as NaN
+
+    A column profiled as numeric only needs most of its values to be numbers.
+    """
+    if isinstance(values, memoryview) and values.format == 'd':
+        return np.frombuffer(values, dtype=np.float64)
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+        return values.astype(np.float64, copy=False)
+    return np.fromiter((_as_float(v) for v in values), dtype=np.float64, count=len(values))
+
+
+def as_key_array(values: Sequence) -> np.ndarray:
+    """Object array of group keys, missing values labelled"""
+    return np.array([_MISSING if v is None or v == '' else str(v) for v in values], dtype=object)
+
+
+def as_time_array(values: Sequence) -> Optional[np.ndarray]:
+    """Epoch milliseconds for ISO date strings or numbers, None if unparseable"""
+    if isinstance(values, memoryview) or (len(values) and isinstance(values[0], (int, float))):
+        return as_float_array(values)
+    try:
+        stamps = np.array([v or 'NaT' for v in values], dtype='datetime64[ms]')
+    except (ValueError, TypeError):
+        return None
+    millis = stamps.astype(np.int64).astype(np.float64)
+    millis[np.isnat(stamps)] = np.nan
+    return millis
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Largest-Triangle-Three-Buckets downsampling to `threshold` points
+
+    Keeps the visual shape of a series (peaks and troughs) while bounding
+    the number of points the browser has to draw.
+    """
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return x, y
+
+    # Bucket boundaries over the interior points (first and last are always kept)
+    edges = np.linspace(1, length - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = length - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < threshold - 1:
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+
+        # Area of the triangle (previous point, candidate, next bucket average)
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas)) if end > start else start
+        selected[bucket + 1] = previous
+
+    return x[selected], y[selected]
+
+
+def line_series(x: Optional[np.ndarray], y: np.ndarray, pixel_width: int) -> Dict:
+    """Line chart points: NaNs dropped, sorted by x, LTTB to the pixel budget"""
+    if x is None:
+        x = np.arange(len(y), dtype=np.float64)
+    mask = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[mask], y[mask]
+    if len(x) > 1 and np.any(np.diff(x) < 0):
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+    sampled_x, sampled_y = lttb(x, y, pixel_width)
+    return {
+        'points': np.column_stack((sampled_x, sampled_y)).tolist(),
+        'source_points': int(len(x)),
+        'rendered_points': int(len(sampled_x)),
+        'downsampling': 'lttb' if len(sampled_x) < len(x) else 'none'
+    }
+
+
+def group_aggregate(keys: np.ndarray, values: Optional[np.ndarray], agg: str, limit: int) -> Dict:
+    """Vectorized group-by; categories past `limit` are folded into "Other\""""
+    categories, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(categories)).astype(np.float64)
+
+    if values is None or agg == 'count':
+        totals = counts
+        agg = 'count'
+    else:
+        valid = ~np.isnan(values)
+        sums = np.bincount(inverse[valid], weights=values[valid], minlength=len(categories))
+        if agg == 'mean':
+            valid_counts = np.bincount(inverse[valid], minlength=len(categories))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                totals = np.where(valid_counts > 0, sums / valid_counts, np.nan)
+        else:
+            agg = 'sum'
+            totals = sums
+
+    order = np.argsort(-np.nan_to_num(totals, nan=-np.inf), kind='stable')
+    labels = categories[order].tolist()
+    series = totals[order]
+    if len(labels) > limit:
+        kept = limit - 1
+        if agg == 'mean':
+            tail_counts = counts[order][kept:]
+            other = float(np.nansum(series[kept:] * tail_counts) / max(tail_counts.sum(), 1))
+        else:
+            other = float(np.nansum(series[kept:]))
+        labels = labels[:kept] + [_OTHER]
+        series = np.append(series[:kept], other)
+
+    return {
+        'categories': labels,
+        'values': [None if np.isnan(v) else float(v) for v in series],
+        'aggregation': agg,
+        'source_categories': int(len(categories))
+    }
+
+
+def histogram(values: np.ndarray, bins: int) -> Dict:
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return {'bins': [], 'counts': []}
+    counts, edges = np.histogram(finite, bins=bins)
+    return {
+        'bins': [[float(lo), float(hi)] for lo, hi in zip(edges[:-1], edges[1:])],
+        'counts': counts.tolist()
+    }
+
+
+def _axis_bins(values: np.ndarray, limit: int) -> Tuple[np.ndarray, List]:
+    """Bin index per row plus axis labels, for numeric or categorical axes"""
+    if values.dtype == object:
+        labels, index = np.unique(values, return_inverse=True)
+        if len(labels) > limit:
+            # Keep the most frequent labels, fold the rest into the last bin
+            top = np.argsort(-np.bincount(index), kind='stable')[:limit - 1]
+            remap = np.full(len(labels), limit - 1)
+            remap[top] = np.arange(limit - 1)
+            return remap[index], labels[top].tolist() + [_OTHER]
+        return index, labels.tolist()
+
+    finite = values[np.isfinite(values)]
+    low, high = (float(finite.min()), float(finite.max())) if len(finite) else (0.0, 1.0)
+    if high == low:
+        high = low + 1.0
+    edges = np.linspace(low, high, limit + 1)
+    index = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, limit - 1)
+    index[~np.isfinite(values)] = -1
+    return index, [[float(lo), float(hi)] for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+def heatmap_tiles(x: np.ndarray, y: np.ndarray, z: Optional[np.ndarray], cells: int, tile: int) -> Dict:
+    """Aggregate (x, y[, z]) into a bounded grid, split into tiles for progressive rendering"""
+    x_index, x_labels = _axis_bins(x, cells)
+    y_index, y_labels = _axis_bins(y, cells)
+    width, height = len(x_labels), len(y_labels)
+
+    valid = (x_index >= 0) & (y_index >= 0)
+    weights = None
+    if z is not None:
+        valid &= ~np.isnan(z)
+        weights = z[valid]
+    flat = y_index[valid] * width + x_index[valid]
+    grid = np.bincount(flat, weights=weights, minlength=width * height).reshape(height, width)
+    if z is not None:
+        counts = np.bincount(flat, minlength=width * height).reshape(height, width)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grid = np.where(counts > 0, grid / counts, np.nan)
+
+    tiles = []
+    for top in range(0, height, tile):
+        for left in range(0, width, tile):
+            block = grid[top:top + tile, left:left + tile]
+            empty = np.all(np.isnan(block)) if z is not None else not np.any(block)
+            if empty:
+                continue  # empty tiles are not sent
+            tiles.append({
+                'origin': [left, top],
+                'cells': [[None if np.isnan(v) else float(v) for v in row] for row in block]
+            })
+
+    finite = grid[np.isfinite(grid)]
+    return {
+        'x_labels': x_labels,
+        'y_labels': y_labels,
+        'tile_size': tile,
+        'tiles': tiles,
+        'value_range': [float(finite.min()), float(finite.max())] if len(finite) else [0.0, 0.0],
+        'aggregation': 'mean' if z is not None else 'count'
+    }
+
+
+def pick_columns(columns: Dict[str, Sequence], profile: Dict) -> Dict[str, Optional[str]]:
+    """Time axis, measures and dimensions a dashboard is built from"""
+    numeric = [c for c in profile.get('numeric_columns', []) if c in columns]
+    categorical = [c for c in profile.get('categorical_columns', []) if c in columns]
+    time_column = next((c for c in list(columns) if _TIME_COLUMN.search(c)), None)
+    measures = [c for c in numeric if c != time_column]
+    dimensions = [c for c in categorical if c != time_column]
+    return {
+        'time': time_column,
+        'measure': measures[0] if measures else None,
+        'second_measure': measures[1] if len(measures) > 1 else None,
+        'dimension': dimensions[0] if dimensions else None,
+        'second_dimension': dimensions[1] if len(dimensions) > 1 else None
+    }
+
+
+@cpu_stage
+def shape_chart_data(data: Dict, profile: Dict, budget: Optional[Dict] = None) -> Dict[str, Any]:
+    """Render-ready data for every chart data_source, sized to the budget"""
+    budget = resolve_budget(budget)
+    columns = table_columns(data)
+    picked = pick_columns(columns, profile)
+    shaped: Dict[str, Any] = {'columns_used': picked}
+
+    measure = as_float_array(columns[picked['measure']]) if picked['measure'] else None
+    dimension = as_key_array(columns[picked['dimension']]) if picked['dimension'] else None
+    # Columns of a task.data payload may differ in length; rows only pair up when they do not
+    paired = measure if measure is not None and dimension is not None and len(measure) == len(dimension) else None
+
+    if measure is not None:
+        x = as_time_array(columns[picked['time']]) if picked['time'] else None
+        if x is not None and len(x) != len(measure):
+            x = None
+        shaped['processed_data'] = {
+            'x_field': picked['time'] or 'index',
+            'y_field': picked['measure'],
+            'x_is_time': x is not None,
+            **line_series(x, measure, budget['pixel_width'])
+        }
+
+    if dimension is not None:
+        shaped['category_data'] = {
+            'dimension': picked['dimension'],
+            'measure': picked['measure'] if paired is not None else None,
+            **group_aggregate(dimension, paired, 'sum' if paired is not None else 'count',
+                              budget['max_categories'])
+        }
+        shaped['distribution_data'] = {
+            'dimension': picked['dimension'],
+            **group_aggregate(dimension, None, 'count', budget['max_slices'])
+        }
+    elif measure is not None:
+        shaped['distribution_data'] = {
+            'measure': picked['measure'],
+            **histogram(measure, budget['histogram_bins'])
+        }
+
+    # Heatmap: two dimensions (or a dimension and time) coloured by the measure
+    x_field = picked['second_dimension'] or picked['time'] or picked['second_measure']
+    if dimension is not None and x_field:
+        if x_field == picked['second_dimension']:
+            x_values = as_key_array(columns[x_field])
+        elif x_field == picked['time']:
+            x_values = as_time_array(columns[x_field])
+        else:
+            x_values = as_float_array(columns[x_field])
+        if x_values is not None and len(x_values) == len(dimension):
+            shaped['performance_matrix'] = {
+                'x_field': x_field,
+                'y_field': picked['dimension'],
+                'value_field': picked['measure'] if paired is not None else None,
+                **heatmap_tiles(x_values, dimension, paired, budget['heatmap_cells'], budget['heatmap_tile'])
+            }
+    return shaped
@@ -0,0 +1,135 @@
+"""
+PurpleBrain-AI CPU Task Layer
+Ships CPU-bound agent stages to a process pool so they never block the event loop
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import importlib
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from backend import accounting, deadlines
+from backend.payloads import PayloadHandle, payload_store
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the pool and runs every stage inline (useful for debugging)
+CPU_WORKERS = int(os.environ.get('PURPLEBRAIN_CPU_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+
+
+def _attach(value: Any, attached: List[PayloadHandle]) -> Any:
+    """Worker side: swap payload handles for zero-copy views of their buffers"""
+    if isinstance(value, PayloadHandle):
+        attached.append(value)
+        return value.view()
+    if isinstance(value, dict):
+        return {k: _attach(v, attached) for k, v in value.items()}
+    return value
+
+
+def _resolve_stage(module_name: str, qualname: str) -> Callable:
+    target = importlib.import_module(module_name)
+    for part in qualname.split('.'):
+        target = getattr(target, part)
+    return getattr(target, '__wrapped__', target)
+
+
+def _run_stage(module_name: str, qualname: str, args: tuple, kwargs: Dict) -> tuple:
+    """Process-pool entry point for a CPU stage; returns (result, CPU seconds spent)"""
+    attached: List[PayloadHandle] = []
+    started = time.process_time()
+    try:
+        args = tuple(_attach(a, attached) for a in args)
+        kwargs = {k: _attach(v, attached) for k, v in kwargs.items()}
+        return _resolve_stage(module_name, qualname)(*args, **kwargs), time.process_time() - started
+    finally:
+        for handle in attached:
+            handle.close()
+
+
+class CPUTaskPool:
+    """Process pool for CPU stages, created on first use"""
+
+    def __init__(self, workers: int = CPU_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.inline_runs = 0
+        self.shared_payloads = 0
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a module-level function in the pool and await its result"""
+        func = getattr(func, '__wrapped__', func)
+        deadlines.check(func.__qualname__)
+        executor = self._get_executor()
+        if executor is None:
+            self.inline_runs += 1
+            attached: List[PayloadHandle] = []
+            return func(*(_attach(a, attached) for a in args), **{k: _attach(v, attached) for k, v in kwargs.items()})
+
+        # Large lists not already behind a handle are moved into payload
+        # buffers for the duration of the call, so only descriptors are pickled
+        created: List[PayloadHandle] = []
+        try:
+            shared_args = tuple(payload_store.wrap(a, created) for a in args)
+            shared_kwargs = {k: payload_store.wrap(v, created) for k, v in kwargs.items()}
+            self.submitted += 1
+            self.shared_payloads += len(created)
+            # An abandoned request drops the job if it is still queued; a running one finishes unobserved
+            result, cpu_s = await deadlines.guard(asyncio.get_running_loop().run_in_executor(
+                executor, _run_stage, func.__module__, func.__qualname__, shared_args, shared_kwargs
+            ), func.__qualname__)
+            # The worker's CPU time belongs to the request that shipped the stage
+            accounting.add(cpu_s=cpu_s)
+            return result
+        finally:
+            payload_store.release(created)
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.workers,
+            'submitted': self.submitted,
+            'inline_runs': self.inline_runs,
+            'shared_payloads': self.shared_payloads
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+cpu_pool = CPUTaskPool()
+
+
+def cpu_stage(func: Callable) -> Callable:
+    """Mark a module-level pure function as a CPU stage
+
+    Calling the decorated function returns an awaitable that runs the
+    original in the shared process pool; the original stays reachable as
+    `__wrapped__` for inline use and for the workers themselves.
+    """
+    @functools.wraps(func)
+    async def offloaded(*args, **kwargs):
+        return await cpu_pool.run(func, *args, **kwargs)
+
+    return offloaded
@@ -0,0 +1,459 @@
+"""
+PurpleBrain-AI Dataset Ingestion
+Streams CSV / NDJSON / Parquet uploads into columnar payload buffers with bounded memory
+"""
+
+import os
+import csv
+import json
+import time
+import uuid
+import codecs
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from backend.payloads import PayloadHandle, PayloadStore, ColumnWriter
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet uploads are optional
+    pq = None
+
+DATASET_FORMATS = ('csv', 'ndjson', 'parquet')
+
+# Rows buffered before they are transposed and flushed to the column files
+CHUNK_ROWS = int(os.environ.get('PURPLEBRAIN_DATASET_CHUNK_ROWS', 8192))
+
+# Uploaded datasets are deleted after this long without being deleted explicitly
+DATASET_TTL_SECONDS = int(os.environ.get('PURPLEBRAIN_DATASET_TTL_SECONDS', 24 * 3600))
+
+# Larger upload bodies are rejected with 413; 0 lifts the limit. Column files go to disk, so this is a disk quota
+DATASET_MAX_BYTES = int(os.environ.get('PURPLEBRAIN_DATASET_MAX_BYTES') or 64 * 1024 ** 3)
+# One CSV record or NDJSON line is held in memory until it is complete, so it has a limit of its own
+DATASET_MAX_RECORD_BYTES = int(os.environ.get('PURPLEBRAIN_DATASET_MAX_RECORD_BYTES') or 1024 ** 2)
+# Every column costs a file and a value per row, including the rows before it first appeared
+DATASET_MAX_COLUMNS = int(os.environ.get('PURPLEBRAIN_DATASET_MAX_COLUMNS') or 1024)
+
+
+def _default_directory() -> str:
+    # On disk, unlike per-request payloads: uploads can be larger than RAM (and /tmp may be tmpfs)
+    base = '/var/tmp' if os.path.isdir('/var/tmp') and os.access('/var/tmp', os.W_OK) else tempfile.gettempdir()
+    return os.environ.get('PURPLEBRAIN_DATASET_DIR') or os.path.join(base, 'purplebrain-datasets')
+
+
+# Column buffers of uploaded datasets
+dataset_store = PayloadStore(_default_directory())
+
+_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/vnd.apache.parquet': 'parquet',
+    'application/x-parquet': 'parquet',
+}
+
+
+class DatasetFormatError(ValueError):
+    """Upload body does not match the declared format"""
+
+
+class DatasetTooLarge(ValueError):
+    """Upload is larger than a configured maximum: body bytes, bytes of one record, or columns"""
+
+    def __init__(self, limit: int, what: str = 'Dataset upload', unit: str = 'byte'):
+        super().__init__(f"{what} exceeds the {limit:,}-{unit} limit")
+        self.limit = limit
+
+
+class DatasetNotFound(LookupError):
+    """task.data names a dataset that does not exist (or has expired)"""
+
+    def __init__(self, dataset_id: str):
+        super().__init__(f"Dataset {dataset_id} not found")
+        self.dataset_id = dataset_id
+
+
+def detect_format(content_type: Optional[str], requested: Optional[str] = None) -> str:
+    """Pick the parser from an explicit ?format= or the Content-Type header"""
+    fmt = (requested or _CONTENT_TYPES.get((content_type or '').split(';')[0].strip().lower(), '')).lower()
+    if fmt not in DATASET_FORMATS:
+        raise DatasetFormatError(f"Unsupported dataset format '{fmt or content_type}', expected one of {DATASET_FORMATS}")
+    if fmt == 'parquet' and pq is None:
+        raise DatasetFormatError("Parquet uploads require pyarrow")
+    return fmt
+
+
+class Dataset:
+    """A finished upload: one payload handle per column"""
+
+    def __init__(self, name: str, fmt: str, rows: int, columns: Dict[str, PayloadHandle], stats: Dict):
+        self.dataset_id = uuid.uuid4().hex
+        self.name = name
+        self.format = fmt
+        self.rows = rows
+        self.columns = columns
+        self.stats = stats
+        self.created_at = datetime.now()
+        self.expires_at = time.time() + DATASET_TTL_SECONDS
+        # Requests using the dataset; its files outlive a delete until the last one is done
+        self.leases = 0
+        self.deleted = False
+
+    @property
+    def nbytes(self) -> int:
+        return sum(handle.nbytes for handle in self.columns.values())
+
+    def as_task_data(self) -> Dict[str, Any]:
+        """Columnar task.data for agents - handles, not values"""
+        return dict(self.columns)
+
+    def describe(self) -> Dict:
+        return {
+            'dataset_id': self.dataset_id,
+            'name': self.name,
+            'format': self.format,
+            'rows': self.rows,
+            'columns': {name: handle.dtype for name, handle in self.columns.items()},
+            'nbytes': self.nbytes,
+            'stats': self.stats,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+class DatasetBuilder:
+    """Incremental parser: feed() body chunks, finish() for the Dataset
+
+    Only the current chunk of rows is held in memory; every CHUNK_ROWS rows
+    are transposed into columns and appended to memory-mapped column files.
+    """
+
+    def __init__(self, fmt: str, name: str = 'upload', store: PayloadStore = dataset_store,
+                 chunk_rows: int = CHUNK_ROWS, max_bytes: int = DATASET_MAX_BYTES,
+                 max_record_bytes: int = DATASET_MAX_RECORD_BYTES, max_columns: int = DATASET_MAX_COLUMNS):
+        self.format = fmt
+        self.name = name
+        self.store = store
+        self.chunk_rows = chunk_rows
+        self.max_bytes = max_bytes
+        self.max_record_bytes = max_record_bytes
+        self.max_columns = max_columns
+        self.rows = 0
+        self.bytes_received = 0
+        self.coerced_values = 0
+        self.skipped_lines = 0
+        self._writers: Dict[str, ColumnWriter] = {}
+        self._header: Optional[List[str]] = None
+        self._batch: List[Dict[str, Any]] = []
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._tail = ''
+        self._pending: List[str] = []
+        self._pending_quotes = 0
+        self._pending_chars = 0
+        self._spool = None
+        if fmt == 'parquet':
+            # Parquet keeps its schema in the footer, so the body is spooled to disk first
+            self._spool = tempfile.NamedTemporaryFile(prefix='purplebrain-upload-', suffix='.parquet',
+                                                      dir=store.directory, delete=False)
+
+    def feed(self, chunk: bytes):
+        self.bytes_received += len(chunk)
+        if self.max_bytes and self.bytes_received > self.max_bytes:
+            raise DatasetTooLarge(self.max_bytes)
+        if self._spool is not None:
+            self._spool.write(chunk)
+            return
+        text = self._tail + self._decoder.decode(chunk)
+        lines = text.split('\n')
+        self._tail = lines.pop()
+        # Characters, not bytes: cheaper to count, and never fewer than the bytes they decode from
+        if len(self._tail) > self.max_record_bytes:
+            raise DatasetTooLarge(self.max_record_bytes, 'A single record')
+        self._consume_lines(lines)
+
+    def finish(self) -> Dataset:
+        if self._spool is not None:
+            self._read_parquet()
+        else:
+            text = self._tail + self._decoder.decode(b'', final=True)
+            self._tail = ''
+            self._consume_lines([text] if text else [])
+            if self._pending:
+                self._consume_lines([], force=True)
+        self._flush()
+        columns = {name: writer.finish() for name, writer in self._writers.items()}
+        return Dataset(self.name, self.format, self.rows, columns, {
+            'bytes_received': self.bytes_received,
+            'coerced_values': self.coerced_values,
+            'skipped_lines': self.skipped_lines
+        })
+
+    def abort(self):
+        for writer in self._writers.values():
+            writer.abort()
+        self._writers.clear()
+        self._cleanup_spool()
+
+    def _consume_lines(self, lines: List[str], force: bool = False):
+        if self.format == 'ndjson':
+            for line in lines:
+                if len(line) > self.max_record_bytes:
+                    raise DatasetTooLarge(self.max_record_bytes, 'A single record')
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    self.skipped_lines += 1
+                    continue
+                if isinstance(record, dict):
+                    self._add_row(record)
+                else:
+                    self.skipped_lines += 1
+            return
+
+        # CSV: a record ends on a newline outside quotes (even quote count so far)
+        records = []
+        for line in lines:
+            if not self._pending and self.rows == 0 and self._header is None:
+                line = line.lstrip('\ufeff')
+            self._pending.append(line)
+            self._pending_quotes += line.count('"')
+            self._pending_chars += len(line) + 1
+            if self._pending_quotes % 2 == 0:
+                records.append('\n'.join(self._pending))
+                self._pending, self._pending_quotes, self._pending_chars = [], 0, 0
+            elif self._pending_chars > self.max_record_bytes:
+                # Most likely a stray unbalanced quote, which would otherwise swallow the rest of the file
+                raise DatasetTooLarge(self.max_record_bytes, 'A single record')
+        if force and self._pending:
+            records.append('\n'.join(self._pending))
+            self._pending, self._pending_quotes, self._pending_chars = [], 0, 0
+
+        for fields in csv.reader(records):
+            if not fields or fields == ['']:
+                continue
+            if self._header is None:
+                self._check_columns(len(fields))
+                self._header = [field.strip() or f"column_{i}" for i, field in enumerate(fields)]
+                continue
+            self._add_row(dict(zip(self._header, fields)))
+
+    def _add_row(self, record: Dict[str, Any]):
+        self._batch.append(record)
+        if len(self._batch) >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        names = list(self._writers)
+        known = set(names)
+        for record in batch:
+            for name in record:
+                if name not in known:
+                    known.add(name)
+                    names.append(name)
+        self._check_columns(len(names))
+
+        for name in names:
+            values = [record.get(name) for record in batch]
+            writer = self._writers.get(name)
+            if writer is None:
+                writer = self._writers[name] = self.store.writer(self._infer_dtype(values))
+                self._append_nulls(writer, self.rows)  # column first seen mid-stream
+            writer.append(self._coerce(values, writer.dtype))
+        self.rows += len(batch)
+
+    def _check_columns(self, count: int):
+        if self.max_columns and count > self.max_columns:
+            raise DatasetTooLarge(self.max_columns, f"{count:,} columns", 'column')
+
+    def _append_nulls(self, writer: ColumnWriter, count: int):
+        """Missing values for rows before a column appeared, a chunk at a time"""
+        for start in range(0, count, self.chunk_rows):
+            writer.append([None] * min(self.chunk_rows, count - start))
+
+    def _append_columns(self, columns: Dict[str, List[Any]], length: int):
+        """Parquet path: batches arrive already columnar"""
+        self._check_columns(len(self._writers.keys() | columns.keys()))
+        for name, values in columns.items():
+            writer = self._writers.get(name)
+            if writer is None:
+                writer = self._writers[name] = self.store.writer(self._infer_dtype(values))
+                self._append_nulls(writer, self.rows)
+            writer.append(self._coerce(values, writer.dtype))
+        for name, writer in self._writers.items():
+            if name not in columns:
+                writer.append([None] * length)
+        self.rows += length
+
+    @staticmethod
+    def _as_number(value: Any) -> Optional[float]:
+        if value is None or value == '':
+            return None
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str):
+            return float(value)
+        raise ValueError(value)
+
+    def _infer_dtype(self, values: List[Any]) -> str:
+        seen = False
+        for value in values:
+            if value is None or value == '':
+                continue
+            seen = True
+            try:
+                self._as_number(value)
+            except (TypeError, ValueError):
+                return 'utf8'
+        return 'float64' if seen else 'utf8'
+
+    def _coerce(self, values: List[Any], dtype: str) -> List[Any]:
+        if dtype == 'utf8':
+            return [
+                v if v is None or isinstance(v, str) else json.dumps(v) if isinstance(v, (dict, list)) else str(v)
+                for v in values
+            ]
+        coerced = []
+        for value in values:
+            try:
+                coerced.append(self._as_number(value))
+            except (TypeError, ValueError):
+                self.coerced_values += 1
+                coerced.append(None)
+        return coerced
+
+    def _read_parquet(self):
+        self._spool.close()
+        try:
+            parquet_file = pq.ParquetFile(self._spool.name)
+            self._check_columns(parquet_file.metadata.num_columns)
+            for batch in parquet_file.iter_batches(batch_size=self.chunk_rows):
+                columns = {name: batch.column(i).to_pylist() for i, name in enumerate(batch.schema.names)}
+                self._append_columns(columns, batch.num_rows)
+        except DatasetTooLarge:
+            raise
+        except Exception as e:
+            raise DatasetFormatError(f"Invalid Parquet upload: {e}")
+        finally:
+            self._cleanup_spool()
+
+    def _cleanup_spool(self):
+        if self._spool is not None:
+            self._spool.close()
+            try:
+                os.unlink(self._spool.name)
+            except FileNotFoundError:
+                pass
+            self._spool = None
+
+
+class DatasetRegistry:
+    """Uploaded datasets by id, with TTL expiry
+
+    Requests lease the datasets they resolve. Deleting a leased dataset
+    unlists it at once; its column files go when the last lease is released.
+    """
+
+    def __init__(self, store: PayloadStore = dataset_store):
+        self.store = store
+        self._datasets: Dict[str, Dataset] = {}
+        self._lock = threading.Lock()
+
+    def add(self, dataset: Dataset) -> Dataset:
+        self.sweep()
+        with self._lock:
+            self._datasets[dataset.dataset_id] = dataset
+        return dataset
+
+    def get(self, dataset_id: str) -> Optional[Dataset]:
+        dataset = self._datasets.get(dataset_id)
+        if dataset is not None:
+            dataset.expires_at = time.time() + DATASET_TTL_SECONDS
+        return dataset
+
+    def list(self) -> List[Dataset]:
+        self.sweep()
+        return list(self._datasets.values())
+
+    def acquire(self, dataset_id: str) -> Dataset:
+        with self._lock:
+            dataset = self._datasets.get(dataset_id)
+            if dataset is None:
+                raise DatasetNotFound(dataset_id)
+            dataset.leases += 1
+            dataset.expires_at = time.time() + DATASET_TTL_SECONDS
+        return dataset
+
+    def release(self, leased: List[Dataset]):
+        """End the leases a request took in resolve()"""
+        for dataset in leased:
+            with self._lock:
+                dataset.leases -= 1
+                drop = dataset.deleted and not dataset.leases
+            if drop:
+                self._drop(dataset)
+        leased.clear()
+
+    def delete(self, dataset_id: str) -> bool:
+        with self._lock:
+            dataset = self._datasets.pop(dataset_id, None)
+            if dataset is None:
+                return False
+            dataset.deleted = True
+            drop = not dataset.leases
+        if drop:
+            self._drop(dataset)
+        return True
+
+    def _drop(self, dataset: Dataset):
+        # Column by column, so one file that cannot be removed does not keep the others
+        for handle in dataset.columns.values():
+            try:
+                self.store.delete(handle.payload_id)
+            except OSError as e:
+                logger.error(f"Could not remove column buffer {handle.payload_id} of dataset {dataset.dataset_id}: {e}")
+
+    def sweep(self):
+        """Delete expired datasets no request is using; never raises into the caller (an upload or listing)"""
+        now = time.time()
+        with self._lock:
+            expired = [dataset_id for dataset_id, dataset in self._datasets.items()
+                       if dataset.expires_at < now and not dataset.leases]
+        for dataset_id in expired:
+            logger.info(f"Dataset {dataset_id} expired")
+            try:
+                self.delete(dataset_id)
+            except Exception as e:
+                logger.error(f"Could not delete expired dataset {dataset_id}: {e}")
+
+    def resolve(self, data: Optional[Dict], leased: List[Dataset]) -> Optional[Dict]:
+        """Expand {'dataset_id': ...} in task.data into the dataset's column handles
+
+        The dataset is leased (added to `leased`) until the caller passes that
+        list to release().
+        """
+        if not data or 'dataset_id' not in data:
+            return data
+        dataset = self.acquire(data['dataset_id'])
+        leased.append(dataset)
+        columns = data.get('columns')
+        resolved = {
+            name: handle for name, handle in dataset.as_task_data().items()
+            if not columns or name in columns
+        }
+        extras = {k: v for k, v in data.items() if k not in ('dataset_id', 'columns')}
+        return {**extras, **resolved}
+
+
+datasets = DatasetRegistry()
@@ -0,0 +1,245 @@
+"""
+PurpleBrain-AI Request Deadlines
+Per-request deadline and cancellation context shared by every stage and upstream call
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Awaitable, Dict, Iterator, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+# Applied when the client sends no deadline (0 = none); client deadlines are capped at the max
+DEFAULT_DEADLINE_MS = int(os.environ.get('PURPLEBRAIN_DEFAULT_DEADLINE_MS', 0))
+MAX_DEADLINE_MS = int(os.environ.get('PURPLEBRAIN_MAX_DEADLINE_MS', 600000))
+
+
+class RequestCancelled(RuntimeError):
+    """The client went away; remaining work was abandoned"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request ran out of time before a stage could start or finish"""
+
+
+# Fallback handlers (``except Exception: return default``) must let these through,
+# otherwise an abandoned request carries on with the next stage
+ABANDONED = (asyncio.CancelledError, RequestCancelled, DeadlineExceeded)
+
+
+class RequestContext:
+    """Deadline plus a cancel flag visible from any thread or event loop
+
+    Thread-executor agents run on private event loops; cancel() reaches
+    their in-flight guarded awaits through call_soon_threadsafe.
+    """
+
+    def __init__(self, deadline_ms: Optional[float] = None, parent: Optional['RequestContext'] = None):
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline_ms / 1000 if deadline_ms else None
+        self.cancelled = False
+        self.reason = ''
+        self._inflight: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = set()
+        self._children: Set['RequestContext'] = set()
+        self._lock = threading.Lock()
+        if parent is not None:
+            # A branch inherits the deadline and dies with its parent, never the other way round
+            self.deadline = parent.deadline
+            with parent._lock:
+                parent._children.add(self)
+            if parent.cancelled:
+                self.cancel(parent.reason)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None without a deadline"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def cancel(self, reason: str = 'client disconnected'):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self.reason = reason
+            inflight = list(self._inflight)
+            children = list(self._children)
+        for loop, future in inflight:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(future.cancel)
+        for child in children:
+            child.cancel(reason)
+
+    def check(self, stage: str = '', needs: float = 0.0):
+        """Raise before starting `stage` if the request is gone or has < `needs` seconds left"""
+        if self.cancelled:
+            raise RequestCancelled(f"Request cancelled before {stage or 'next stage'}: {self.reason}")
+        remaining = self.remaining()
+        if remaining is not None and remaining <= needs:
+            raise DeadlineExceeded(f"Deadline exceeded before {stage or 'next stage'}")
+
+    async def guard(self, awaitable: Awaitable, stage: str = '') -> Any:
+        """Await under the remaining budget; cancel() or the deadline aborts it immediately"""
+        try:
+            self.check(stage)
+        except (RequestCancelled, DeadlineExceeded):
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            elif isinstance(awaitable, asyncio.Future):
+                awaitable.cancel()
+            raise
+        future = asyncio.ensure_future(awaitable)
+        entry = (asyncio.get_running_loop(), future)
+        with self._lock:
+            self._inflight.add(entry)
+        try:
+            return await asyncio.wait_for(future, self.remaining())
+        except asyncio.TimeoutError:
+            if self.remaining() is not None and self.remaining() <= 0:
+                raise DeadlineExceeded(f"Deadline exceeded during {stage or 'stage'}")
+            raise
+        except asyncio.CancelledError:
+            if self.cancelled:
+                raise RequestCancelled(f"Request cancelled during {stage or 'stage'}: {self.reason}")
+            raise
+        finally:
+            with self._lock:
+                self._inflight.discard(entry)
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started) * 1000
+
+
+_current: contextvars.ContextVar[Optional[RequestContext]] = contextvars.ContextVar(
+    'purplebrain_request', default=None
+)
+
+
+def current() -> Optional[RequestContext]:
+    return _current.get()
+
+
+def remaining() -> Optional[float]:
+    context = _current.get()
+    return context.remaining() if context is not None else None
+
+
+def outcome(error: BaseException) -> str:
+    """History status for an abandoned run"""
+    context = _current.get()
+    if isinstance(error, DeadlineExceeded) or (context is not None and context.expired()):
+        return 'deadline_exceeded'
+    return 'cancelled'
+
+
+def check(stage: str = '', needs: float = 0.0):
+    """No-op outside a request scope"""
+    context = _current.get()
+    if context is not None:
+        context.check(stage, needs)
+
+
+async def guard(awaitable: Awaitable, stage: str = '') -> Any:
+    context = _current.get()
+    if context is None:
+        return await awaitable
+    return await context.guard(awaitable, stage)
+
+
+def parse_deadline_ms(header: Optional[str] = None, options: Optional[Dict] = None) -> Optional[float]:
+    """Relative deadline from the header and/or task options; the tighter one wins"""
+    candidates = []
+    for raw in (header, (options or {}).get('deadline_ms')):
+        if raw in (None, ''):
+            continue
+        try:
+            value = float(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid deadline '{raw}', expected milliseconds")
+        if value <= 0:
+            raise ValueError(f"Deadline must be positive, got {raw}")
+        candidates.append(value)
+    if not candidates:
+        return DEFAULT_DEADLINE_MS or None
+    return min(min(candidates), MAX_DEADLINE_MS)
+
+
+@contextmanager
+def request_scope(deadline_ms: Optional[float] = None) -> Iterator[RequestContext]:
+    """Bind a request context; nested scopes (e.g. conductor sub-agents) share the outer one"""
+    context = _current.get()
+    if context is not None:
+        yield context
+        return
+    context = RequestContext(deadline_ms)
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+
+async def _run_in_branch(context: RequestContext, awaitable: Awaitable) -> Any:
+    _current.set(context)  # the task runs in its own copy of the context
+    return await awaitable
+
+
+def start_branch(awaitable: Awaitable) -> Tuple[asyncio.Task, RequestContext]:
+    """Start speculative work that can be abandoned on its own via the returned context"""
+    context = RequestContext(parent=_current.get())
+    return asyncio.ensure_future(_run_in_branch(context, awaitable)), context
+
+
+async def abandon_branch(task: asyncio.Task, context: RequestContext, reason: str):
+    """Cancel a branch and wait until it has unwound"""
+    context.cancel(reason)
+    task.cancel()
+    try:
+        await task
+    except ABANDONED:
+        pass
+    except Exception as e:
+        logger.debug(f"Abandoned branch failed while unwinding: {e}")
+
+
+async def cancel_on(awaitable: Awaitable, disconnected: Awaitable, context: RequestContext,
+                    reason: str = 'client disconnected') -> Any:
+    """Await `awaitable`, abandoning it as soon as `disconnected` completes"""
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(disconnected)
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not work.done():
+            logger.info(f"Cancelling request after {context.elapsed_ms():.0f}ms: {reason}")
+            context.cancel(reason)
+            work.cancel()
+            try:
+                # Let the work unwind (and release what it holds) before returning
+                await work
+            except ABANDONED:
+                pass
+            raise RequestCancelled(f"Request cancelled: {reason}")
+        return work.result()
+    finally:
+        watcher.cancel()
+        if not work.done():
+            context.cancel('server cancelled the request')
+            work.cancel()
+
+
+def run_in_scope(deadline_s: Optional[float], func, *args, **kwargs) -> Any:
+    """Re-establish a deadline inside a process-pool worker"""
+    if deadline_s is None:
+        return func(*args, **kwargs)
+    with request_scope(max(deadline_s, 0.001) * 1000):
+        return func(*args, **kwargs)
@@ -0,0 +1,216 @@
+"""
+PurpleBrain-AI Request Hedging
+Backup LLM requests for calls slower than the recent latency percentile, under a spend budget
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from backend import deadlines
+
+logger = logging.getLogger(__name__)
+
+HEDGE_ENABLED = os.environ.get('PURPLEBRAIN_LLM_HEDGE', '1') not in ('0', 'false', 'False')
+
+# A backup request fires once the primary is slower than this percentile of recent calls
+HEDGE_PERCENTILE = float(os.environ.get('PURPLEBRAIN_LLM_HEDGE_PERCENTILE', 95))
+HEDGE_MIN_DELAY = float(os.environ.get('PURPLEBRAIN_LLM_HEDGE_MIN_DELAY_MS', 500)) / 1000
+# Used until a model has enough samples for a percentile
+HEDGE_INITIAL_DELAY = float(os.environ.get('PURPLEBRAIN_LLM_HEDGE_INITIAL_DELAY_MS', 8000)) / 1000
+MIN_SAMPLES = 20
+LATENCY_WINDOW = 500
+
+# Extra requests allowed per primary request (0.1 = at most ~10% more upstream calls)
+HEDGE_BUDGET = float(os.environ.get('PURPLEBRAIN_LLM_HEDGE_BUDGET', 0.1))
+HEDGE_BUDGET_BURST = 10.0
+
+# Backup model for hedges and for retrying a failed call ('' = same model)
+HEDGE_MODEL = os.environ.get('PURPLEBRAIN_LLM_HEDGE_MODEL', '')
+FALLBACK_MODEL = os.environ.get('PURPLEBRAIN_LLM_FALLBACK_MODEL', '')
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Worth another attempt: rate limits, server errors, timeouts and dropped connections
+
+    Client errors (bad key, invalid request, prompt over the context length)
+    fail the same way on any model.
+    """
+    if isinstance(error, deadlines.ABANDONED):
+        return False
+    status = getattr(error, 'http_status', None) or getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status in (408, 429) or status >= 500
+    return True
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls to one model"""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples: deque = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def mean_above(self, threshold: float) -> Optional[float]:
+        tail = [s for s in self._samples if s > threshold]
+        return sum(tail) / len(tail) if tail else None
+
+
+class HedgeBudget:
+    """Token bucket: each primary call earns `ratio` of a hedge, each hedge spends one"""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET, burst: float = HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.credit = min(1.0, burst)
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self.credit = min(self.burst, self.credit + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.credit < 1:
+                return False
+            self.credit -= 1
+            return True
+
+
+class RequestHedger:
+    """Runs a call, racing a backup against it when the primary falls into the latency tail"""
+
+    def __init__(self, enabled: bool = HEDGE_ENABLED, percentile: float = HEDGE_PERCENTILE,
+                 budget: Optional[HedgeBudget] = None,
+                 retryable: Callable[[BaseException], bool] = is_retryable):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget or HedgeBudget()
+        self.retryable = retryable
+        self._windows: Dict[str, LatencyWindow] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'budget_denied': 0,
+            'fallbacks': 0, 'not_retryable': 0, 'failures': 0, 'latency_saved_s': 0.0
+        }
+
+    def _window(self, model: str) -> LatencyWindow:
+        with self._lock:
+            return self._windows.setdefault(model, LatencyWindow())
+
+    def _count(self, key: str, amount: float = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def hedge_delay(self, model: str) -> float:
+        window = self._window(model)
+        if len(window) < MIN_SAMPLES:
+            return HEDGE_INITIAL_DELAY
+        return max(HEDGE_MIN_DELAY, window.percentile(self.percentile))
+
+    async def run(self, call: Callable[[str], Awaitable[Any]], model: str,
+                  backup_model: Optional[str] = None) -> Any:
+        """`call(model)` starts one upstream request; the first successful result wins"""
+        backup_model = backup_model or HEDGE_MODEL or model
+        self._count('calls')
+        self.budget.earn()
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(call(model))
+        backup = None
+        try:
+            delay = self.hedge_delay(model) if self.enabled else None
+            await asyncio.wait({primary}, timeout=delay)
+            if primary.done():
+                if primary.exception() is None:
+                    self._window(model).add(time.perf_counter() - started)
+                    return primary.result()
+                return await self._fallback(call, model, backup_model, primary.exception())
+
+            if not self.budget.try_spend():
+                self._count('budget_denied')
+                result = await primary
+                self._window(model).add(time.perf_counter() - started)
+                return result
+
+            self._count('hedged')
+            logger.info(f"Hedging {model} call after {delay:.2f}s with {backup_model}")
+            backup = asyncio.ensure_future(call(backup_model))
+            pending = {primary, backup}
+            winner = None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+            elapsed = time.perf_counter() - started
+            # A cancelled primary is recorded at its elapsed time, a lower bound that keeps the tail visible
+            self._window(model).add(elapsed)
+            if winner is None:
+                self._count('failures')
+                raise primary.exception()
+            if winner is backup:
+                self._count('hedge_wins')
+                # Saved time is estimated from how long slow primaries usually take
+                typical_tail = self._window(model).mean_above(delay)
+                if typical_tail is not None:
+                    self._count('latency_saved_s', max(0.0, typical_tail - elapsed))
+            return winner.result()
+        finally:
+            for task in (primary, backup):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def _fallback(self, call: Callable[[str], Awaitable[Any]], model: str, backup_model: str,
+                        error: BaseException) -> Any:
+        fallback_model = FALLBACK_MODEL or backup_model
+        if not self.retryable(error):
+            self._count('not_retryable')
+            self._count('failures')
+            raise error
+        # A retry is an extra upstream call like a hedge; during an outage the budget keeps traffic from doubling
+        if not self.budget.try_spend():
+            self._count('budget_denied')
+            self._count('failures')
+            raise error
+        self._count('fallbacks')
+        logger.warning(f"{model} call failed ({error}); retrying once with {fallback_model}")
+        try:
+            return await call(fallback_model)
+        except Exception:
+            self._count('failures')
+            raise
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            windows = dict(self._windows)
+        stats['latency_saved_s'] = round(stats['latency_saved_s'], 3)
+        stats['hedge_rate'] = round(stats['hedged'] / stats['calls'], 4) if stats['calls'] else 0.0
+        stats['enabled'] = self.enabled
+        stats['budget_ratio'] = self.budget.ratio
+        stats['models'] = {
+            model: {
+                'samples': len(window),
+                'p50_s': window.percentile(50),
+                f"p{self.percentile:g}_s": window.percentile(self.percentile),
+                'hedge_delay_s': self.hedge_delay(model)
+            }
+            for model, window in windows.items()
+        }
+        return stats
+
+
+hedger = RequestHedger()
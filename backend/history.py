@@ -0,0 +1,411 @@
+"""
+PurpleBrain-AI Execution History
+Indexed, paginated queries and aggregates over agent_logs / agent_results, with TTL retention
+"""
+
+import os
+import base64
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import bson
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+
+from backend import accounting
+from backend.result_blobs import ResultBlobStore
+from backend.tracing import KIND_CLIENT, tracer
+
+logger = logging.getLogger(__name__)
+
+# Documents older than this are removed by MongoDB's TTL monitor (0 keeps them forever)
+LOG_TTL_DAYS = float(os.environ.get('PURPLEBRAIN_LOG_TTL_DAYS', 30))
+RESULT_TTL_DAYS = float(os.environ.get('PURPLEBRAIN_RESULT_TTL_DAYS', 90))
+
+# Store large result sub-documents once in result_blobs and reference them
+RESULT_BLOBS = os.environ.get('PURPLEBRAIN_RESULT_BLOBS', '1') == '1'
+
+MAX_PAGE_SIZE = 200
+
+# Buffered (batch run) writes are flushed once this many operations are pending
+BATCH_FLUSH_SIZE = int(os.environ.get('PURPLEBRAIN_HISTORY_FLUSH_SIZE', 200))
+
+GROUP_BY_FIELDS = ('agent', 'status', 'hour', 'day')
+
+# Fields returned when the caller does not ask for a projection; full task/result
+# bodies are only sent when requested explicitly
+DEFAULT_LOG_FIELDS = ('agent_name', 'task_id', 'status', 'timestamp', 'completed_at', 'latency_ms', 'error')
+DEFAULT_RESULT_FIELDS = ('agent', 'task_id', 'query', 'execution_time', 'timestamp', 'created_at')
+
+
+class HistoryCursorError(ValueError):
+    """Pagination cursor could not be decoded"""
+
+
+def encode_cursor(timestamp: datetime, document_id: ObjectId) -> str:
+    raw = f"{timestamp.isoformat()}|{document_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        timestamp, document_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), ObjectId(document_id)
+    except Exception:
+        raise HistoryCursorError(f"Invalid cursor '{cursor}'")
+
+
+def _serialize(document: Dict) -> Dict:
+    def convert(value: Any) -> Any:
+        if isinstance(value, ObjectId):
+            return str(value)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, dict):
+            return {k: convert(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [convert(v) for v in value]
+        return value
+    return convert(document)
+
+
+class HistoryBatch:
+    """Buffers history writes from many runs and flushes them as bulk operations
+
+    A run that starts and finishes between two flushes costs one log insert
+    instead of an insert plus an update.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._logs: Dict[ObjectId, Dict] = {}
+        self._updates: List[UpdateOne] = []
+        self._results: List[Dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.flushes = 0
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._logs) + len(self._updates) + len(self._results)
+
+    def add_log(self, document: Dict) -> ObjectId:
+        document['_id'] = ObjectId()
+        with self._lock:
+            self._logs[document['_id']] = document
+        return document['_id']
+
+    def update_log(self, log_id: ObjectId, update: Dict):
+        with self._lock:
+            buffered = self._logs.get(log_id)
+            if buffered is not None:
+                buffered.update(update)
+            else:
+                self._updates.append(UpdateOne({'_id': log_id}, {'$set': update}))
+
+    def add_result(self, document: Dict):
+        with self._lock:
+            self._results.append(document)
+
+    def discard(self):
+        """Drop pending writes (offline runs that keep no history)"""
+        with self._lock:
+            self._logs, self._updates, self._results = {}, [], []
+
+    def flush(self):
+        # Serialized, so an update never reaches the database before its log insert
+        with self._flush_lock:
+            with self._lock:
+                logs, updates, results = list(self._logs.values()), self._updates, self._results
+                self._logs, self._updates, self._results = {}, [], []
+            if logs:
+                with _db_span('insert_many', 'agent_logs', documents=len(logs)):
+                    self.db.agent_logs.insert_many(logs, ordered=False)
+            if updates:
+                with _db_span('bulk_write', 'agent_logs', documents=len(updates)):
+                    self.db.agent_logs.bulk_write(updates, ordered=False)
+            if results:
+                with _db_span('insert_many', 'agent_results', documents=len(results)):
+                    self.db.agent_results.insert_many(results, ordered=False)
+            if logs or updates or results:
+                self.flushes += 1
+
+
+def _db_span(operation: str, collection: str, document: Optional[Dict] = None, **attributes):
+    """Client span for one MongoDB write; the document's BSON size goes to the span and the usage scope
+
+    Batched writes are charged here, when queued, not again when flushed.
+    The size is only computed for sampled traces or accounted requests.
+    """
+    span = tracer.span(f"mongo.{collection}.{operation}", KIND_CLIENT, **{
+        'db.system': 'mongodb', 'db.operation': operation, 'db.collection': collection,
+        'db.batched': _batch.get() is not None, **attributes
+    })
+    if document is not None and (span.recording or accounting.current() is not None):
+        try:
+            size = len(bson.encode(document))
+        except bson.errors.InvalidDocument:
+            return span
+        span.set('db.document_bytes', size)
+        accounting.add(db_write_bytes=size)
+    return span
+
+
+_batch: contextvars.ContextVar[Optional[HistoryBatch]] = contextvars.ContextVar(
+    'purplebrain_history_batch', default=None
+)
+
+
+class HistoryStore:
+    """Reads and writes execution history; every query is served by an index"""
+
+    def __init__(self, db):
+        self.db = db
+        self.blobs = ResultBlobStore(db.result_blobs, ttl_days=RESULT_TTL_DAYS) if RESULT_BLOBS else None
+
+    def ensure_indexes(self):
+        """Create query and TTL indexes (idempotent; run at startup)"""
+        logs, results = self.db.agent_logs, self.db.agent_results
+        logs.create_index([('agent_name', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)],
+                          name='agent_time')
+        logs.create_index([('status', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)],
+                          name='status_time')
+        logs.create_index([('task_id', ASCENDING)], name='task_id')
+        results.create_index([('agent', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+                             name='agent_time')
+        results.create_index([('agent', ASCENDING), ('execution_time', DESCENDING)], name='agent_latency')
+        results.create_index([('task_id', ASCENDING)], name='task_id')
+        self._backfill_created_at(results)
+        self._ensure_ttl(logs, 'timestamp', LOG_TTL_DAYS)
+        self._ensure_ttl(results, 'created_at', RESULT_TTL_DAYS)
+        if self.blobs is not None:
+            self.blobs.ensure_indexes()
+
+    @staticmethod
+    def _backfill_created_at(results):
+        """Give results stored before `created_at` existed one, so they page, sort and expire like the rest
+
+        Those documents only carry an ISO-string `timestamp`; the ObjectId's
+        creation time stands in when it cannot be parsed.
+        """
+        updates = []
+        backfilled = 0
+        for document in results.find({'created_at': {'$exists': False}}, {'timestamp': 1}):
+            try:
+                created_at = datetime.fromisoformat(document['timestamp'])
+            except (KeyError, TypeError, ValueError):
+                created_at = document['_id'].generation_time.astimezone().replace(tzinfo=None)
+            updates.append(UpdateOne({'_id': document['_id']}, {'$set': {'created_at': created_at}}))
+            if len(updates) >= BATCH_FLUSH_SIZE:
+                backfilled += results.bulk_write(updates, ordered=False).modified_count
+                updates = []
+        if updates:
+            backfilled += results.bulk_write(updates, ordered=False).modified_count
+        if backfilled:
+            logger.info(f"Backfilled created_at on {backfilled} agent_results documents")
+
+    def _ensure_ttl(self, collection, field: str, days: float):
+        name = f"{field}_ttl"
+        seconds = int(days * 86400)
+        existing = collection.index_information().get(name)
+        if not seconds:
+            if existing:
+                collection.drop_index(name)
+            return
+        if existing is None:
+            collection.create_index([(field, ASCENDING)], name=name, expireAfterSeconds=seconds)
+        elif existing.get('expireAfterSeconds') != seconds:
+            # Changing the retention must not rebuild the index
+            try:
+                self.db.command('collMod', collection.name,
+                                index={'name': name, 'expireAfterSeconds': seconds})
+            except OperationFailure as e:
+                logger.warning(f"Could not update TTL on {collection.name}.{field}: {e}")
+
+    # Writes -----------------------------------------------------------------
+
+    def batch(self) -> HistoryBatch:
+        return HistoryBatch(self.db)
+
+    @contextmanager
+    def batching(self, batch: HistoryBatch) -> Iterator[HistoryBatch]:
+        """Route this task's history writes into `batch` instead of one round trip each"""
+        token = _batch.set(batch)
+        try:
+            yield batch
+        finally:
+            _batch.reset(token)
+
+    def log_started(self, agent_id: str, agent_name: str, task_id: str, task: Dict) -> ObjectId:
+        document = {
+            'agent_id': agent_id,
+            'agent_name': agent_name,
+            'task_id': task_id,
+            'task': task,
+            'timestamp': datetime.now(),
+            'status': 'started'
+        }
+        with _db_span('insert_one', 'agent_logs', document):
+            batch = _batch.get()
+            if batch is not None:
+                return batch.add_log(document)
+            return self.db.agent_logs.insert_one(document).inserted_id
+
+    def log_finished(self, log_id: ObjectId, started: datetime, error: Optional[str] = None,
+                     status: Optional[str] = None):
+        completed_at = datetime.now()
+        update = {
+            'status': status or ('failed' if error else 'completed'),
+            'completed_at': completed_at,
+            'latency_ms': (completed_at - started).total_seconds() * 1000
+        }
+        if error:
+            update['error'] = error
+        with _db_span('update_one', 'agent_logs', update):
+            batch = _batch.get()
+            if batch is not None:
+                batch.update_log(log_id, update)
+                return
+            self.db.agent_logs.update_one({'_id': log_id}, {'$set': update})
+
+    def store_result(self, result: Dict):
+        if self.blobs is not None and 'result' in result:
+            # Only the agent output is compacted; the fields history queries filter on stay inline
+            with tracer.span('history.compact_result'):
+                result = {**result, 'result': self.blobs.compact(result['result'])}
+        document = {**result, 'created_at': datetime.now()}
+        with _db_span('insert_one', 'agent_results', document):
+            batch = _batch.get()
+            if batch is not None:
+                batch.add_result(document)
+                return
+            self.db.agent_results.insert_one(document)
+
+    def get_result(self, task_id: str) -> Optional[Dict]:
+        document = self.db.agent_results.find_one({'task_id': task_id})
+        if document is None:
+            return None
+        return _serialize(self._expand(document))
+
+    def _expand(self, document: Dict) -> Dict:
+        if self.blobs is not None and 'result' in document:
+            document['result'] = self.blobs.expand(document['result'])
+        return document
+
+    # Queries ----------------------------------------------------------------
+
+    @staticmethod
+    def _time_range(field: str, since: Optional[datetime], until: Optional[datetime]) -> Dict:
+        bounds = {}
+        if since:
+            bounds['$gte'] = since
+        if until:
+            bounds['$lt'] = until
+        return {field: bounds} if bounds else {}
+
+    @staticmethod
+    def _projection(fields: Optional[List[str]], defaults: Tuple[str, ...], time_field: str) -> Dict:
+        projection = {name: 1 for name in (fields or defaults)}
+        projection[time_field] = 1  # the sort key is needed to build the next cursor
+        return projection
+
+    def _page(self, collection, query: Dict, time_field: str, projection: Dict,
+              limit: int, cursor: Optional[str], expand: bool = False) -> Dict:
+        """Keyset pagination on (time, _id) descending - no skip(), constant cost per page"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        if cursor:
+            timestamp, document_id = decode_cursor(cursor)
+            query = {'$and': [query, {'$or': [
+                {time_field: {'$lt': timestamp}},
+                {time_field: timestamp, '_id': {'$lt': document_id}}
+            ]}]}
+        documents = list(
+            collection.find(query, projection)
+            .sort([(time_field, DESCENDING), ('_id', DESCENDING)])
+            .limit(limit + 1)
+        )
+        has_more = len(documents) > limit
+        documents = documents[:limit]
+        if expand:
+            documents = [self._expand(document) for document in documents]
+        next_cursor = None
+        if has_more and documents:
+            next_cursor = encode_cursor(documents[-1][time_field], documents[-1]['_id'])
+        return {
+            'items': [_serialize(document) for document in documents],
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }
+
+    def list_logs(self, agent_name: Optional[str] = None, status: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None,
+                  min_latency_ms: Optional[float] = None, max_latency_ms: Optional[float] = None,
+                  limit: int = 50, cursor: Optional[str] = None, fields: Optional[List[str]] = None) -> Dict:
+        query: Dict[str, Any] = self._time_range('timestamp', since, until)
+        if agent_name:
+            query['agent_name'] = agent_name
+        if status:
+            query['status'] = status
+        latency = {}
+        if min_latency_ms is not None:
+            latency['$gte'] = min_latency_ms
+        if max_latency_ms is not None:
+            latency['$lte'] = max_latency_ms
+        if latency:
+            query['latency_ms'] = latency
+        projection = self._projection(fields, DEFAULT_LOG_FIELDS, 'timestamp')
+        return self._page(self.db.agent_logs, query, 'timestamp', projection, limit, cursor)
+
+    def list_results(self, agent_name: Optional[str] = None,
+                     since: Optional[datetime] = None, until: Optional[datetime] = None,
+                     min_execution_time: Optional[float] = None, limit: int = 50,
+                     cursor: Optional[str] = None, fields: Optional[List[str]] = None) -> Dict:
+        # Results not yet backfilled have no key to page on
+        query: Dict[str, Any] = self._time_range('created_at', since, until) or {'created_at': {'$exists': True}}
+        if agent_name:
+            query['agent'] = agent_name
+        if min_execution_time is not None:
+            query['execution_time'] = {'$gte': min_execution_time}
+        projection = self._projection(fields, DEFAULT_RESULT_FIELDS, 'created_at')
+        return self._page(self.db.agent_results, query, 'created_at', projection, limit, cursor, expand=True)
+
+    def stats(self, agent_name: Optional[str] = None, since: Optional[datetime] = None,
+              until: Optional[datetime] = None, group_by: str = 'agent') -> List[Dict]:
+        """Counts, failures and latency per agent / status / hour / day"""
+        if group_by not in GROUP_BY_FIELDS:
+            raise ValueError(f"group_by must be one of {GROUP_BY_FIELDS}")
+        if since is None and until is None:
+            since = datetime.now() - timedelta(days=7)  # bounded scan by default
+        match: Dict[str, Any] = self._time_range('timestamp', since, until)
+        if agent_name:
+            match['agent_name'] = agent_name
+        key = {
+            'agent': '$agent_name',
+            'status': '$status',
+            'hour': {'$dateToString': {'format': '%Y-%m-%dT%H:00', 'date': '$timestamp'}},
+            'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$timestamp'}}
+        }[group_by]
+        pipeline = [
+            {'$match': match},
+            {'$group': {
+                '_id': key,
+                'count': {'$sum': 1},
+                'failed': {'$sum': {'$cond': [{'$eq': ['$status', 'failed']}, 1, 0]}},
+                'in_flight': {'$sum': {'$cond': [{'$eq': ['$status', 'started']}, 1, 0]}},
+                'avg_latency_ms': {'$avg': '$latency_ms'},
+                'max_latency_ms': {'$max': '$latency_ms'},
+                'min_latency_ms': {'$min': '$latency_ms'}
+            }},
+            {'$sort': {'_id': 1}}
+        ]
+        return [
+            {group_by: row.pop('_id'), **row}
+            for row in self.db.agent_logs.aggregate(pipeline)
+        ]
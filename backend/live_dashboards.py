@@ -0,0 +1,398 @@
+"""
+PurpleBrain-AI Live Dashboards
+Incremental chart aggregates for streaming dashboards - each update costs O(new rows)
+"""
+
+import os
+import math
+import uuid
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from backend.analysis import table_columns, profile_column
+from backend.chart_data import pick_columns, resolve_budget
+
+logger = logging.getLogger(__name__)
+
+# Largest batch a single append message may carry
+MAX_APPEND_ROWS = int(os.environ.get('PURPLEBRAIN_DASHBOARD_MAX_APPEND_ROWS', 50000))
+
+# Rows kept for the sliding-window statistics; a subscriber's own window is clamped to the maximum
+DEFAULT_WINDOW = int(os.environ.get('PURPLEBRAIN_DASHBOARD_WINDOW', 1000))
+MAX_WINDOW = int(os.environ.get('PURPLEBRAIN_DASHBOARD_MAX_WINDOW') or 100000)
+FIELD_KEYS = ('time', 'measure', 'dimension')
+
+# Distinct categories tracked exactly; later ones are counted under "Other"
+MAX_TRACKED_CATEGORIES = 10000
+
+_OTHER = 'Other'
+_MISSING = '(missing)'
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with bounded relative error (DDSketch-style log buckets)"""
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value: float):
+        self.count += 1
+        if value > 0:
+            buckets, key = self.positive, self._index(value)
+        elif value < 0:
+            buckets, key = self.negative, self._index(-value)
+        else:
+            self.zeros += 1
+            return
+        buckets[key] = buckets.get(key, 0) + 1
+        if len(buckets) > self.max_buckets:
+            # Collapse the two smallest-magnitude buckets; only tiny values lose accuracy
+            lowest, second = sorted(buckets)[:2]
+            buckets[second] += buckets.pop(lowest)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+
+class WindowedStats:
+    """Mean / std / min / max over the last `size` values, O(1) amortized per value"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._values: deque = deque()
+        self._mins: deque = deque()  # (position, value), increasing values
+        self._maxs: deque = deque()  # (position, value), decreasing values
+        self._position = 0
+        self._sum = 0.0
+        self._sum_squares = 0.0
+
+    def add(self, value: float):
+        self._values.append(value)
+        self._sum += value
+        self._sum_squares += value * value
+        while self._mins and self._mins[-1][1] >= value:
+            self._mins.pop()
+        self._mins.append((self._position, value))
+        while self._maxs and self._maxs[-1][1] <= value:
+            self._maxs.pop()
+        self._maxs.append((self._position, value))
+        self._position += 1
+
+        if len(self._values) > self.size:
+            old = self._values.popleft()
+            self._sum -= old
+            self._sum_squares -= old * old
+            oldest = self._position - self.size
+            if self._mins[0][0] < oldest:
+                self._mins.popleft()
+            if self._maxs[0][0] < oldest:
+                self._maxs.popleft()
+
+    def summary(self) -> Dict:
+        count = len(self._values)
+        if not count:
+            return {'size': self.size, 'count': 0}
+        mean = self._sum / count
+        variance = max(0.0, self._sum_squares / count - mean * mean)
+        return {
+            'size': self.size,
+            'count': count,
+            'mean': mean,
+            'std': math.sqrt(variance),
+            'min': self._mins[0][1],
+            'max': self._maxs[0][1]
+        }
+
+
+class LiveDashboard:
+    """Running aggregates behind one streaming dashboard
+
+    The line chart keeps at most `pixel_width` x-buckets; when a new point
+    falls outside them the bucket width doubles and neighbours are merged,
+    so the series stays bounded however long the stream runs.
+    """
+
+    def __init__(self, fields: Optional[Dict] = None, budget: Optional[Dict] = None,
+                 window: int = DEFAULT_WINDOW):
+        self.dashboard_id = uuid.uuid4().hex
+        self.fields = dict(fields or {})
+        self.budget = resolve_budget(budget)
+        self.created_at = datetime.now()
+        self.lock = asyncio.Lock()
+        self.seq = 0
+        self.rows = 0
+        self.skipped_values = 0
+
+        # Measure: running moments, quantiles and a sliding window
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.minimum: Optional[float] = None
+        self.maximum: Optional[float] = None
+        self.sketch = QuantileSketch()
+        self.window = WindowedStats(window)
+
+        # Dimension: count and sum per category
+        self.categories: Dict[str, List[float]] = {}
+
+        # Line chart: x-bucket -> [sum, count]
+        self._buckets: Dict[int, List[float]] = {}
+        self._origin: Optional[float] = None
+        self._width: Optional[float] = None
+
+    def _resolve_fields(self, columns: Dict[str, Sequence]):
+        if all(key in self.fields for key in ('time', 'measure', 'dimension')):
+            return
+        profile = {'numeric_columns': [], 'categorical_columns': []}
+        for name, values in columns.items():
+            kind = profile_column(values)['kind']
+            profile[f"{kind}_columns"].append(name)
+        picked = pick_columns(columns, profile)
+        for key in ('time', 'measure', 'dimension'):
+            self.fields.setdefault(key, picked[key])
+
+    @staticmethod
+    def _number(value: Any) -> Optional[float]:
+        if value is None or value == '' or isinstance(value, bool):
+            return None
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return None
+        return None if math.isnan(number) else number
+
+    @staticmethod
+    def _timestamp(value: Any) -> Optional[float]:
+        if isinstance(value, str):
+            try:
+                return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000
+            except ValueError:
+                return None
+        return LiveDashboard._number(value)
+
+    def _bucket_x(self, key: int) -> float:
+        return self._origin + (key + 0.5) * self._width
+
+    def _add_point(self, x: float, y: float, changed: set) -> bool:
+        """Add to the line buckets; True if the buckets were re-laid out"""
+        if self._origin is None:
+            self._origin, self._width = x, 1.0
+        reset = False
+        key = math.floor((x - self._origin) / self._width)
+        if key not in self._buckets and len(self._buckets) >= self.budget['pixel_width']:
+            low = min(self._buckets.keys() | {key})
+            high = max(self._buckets.keys() | {key})
+            while high - low >= self.budget['pixel_width']:
+                merged: Dict[int, List[float]] = {}
+                for old_key, (total, count) in self._buckets.items():
+                    entry = merged.setdefault(old_key // 2, [0.0, 0])
+                    entry[0] += total
+                    entry[1] += count
+                self._buckets = merged
+                self._width *= 2
+                key = math.floor((x - self._origin) / self._width)
+                low, high = low // 2, high // 2
+            reset = True
+        entry = self._buckets.setdefault(key, [0.0, 0])
+        entry[0] += y
+        entry[1] += 1
+        changed.add(key)
+        return reset
+
+    def append(self, data: Dict, max_rows: Optional[int] = MAX_APPEND_ROWS) -> Dict:
+        """Fold new rows (records or columns) into the aggregates; returns the chart delta"""
+        if not isinstance(data, dict):
+            raise ValueError("columns must be an object of column name to values")
+        columns = table_columns(data)
+        length = max((len(values) for values in columns.values()), default=0)
+        if max_rows is not None and length > max_rows:
+            raise ValueError(f"Append of {length} rows exceeds the {max_rows} row limit")
+        if not length:
+            return self._delta(set(), set(), False)
+        self._resolve_fields(columns)
+
+        measure_values = columns.get(self.fields.get('measure'))
+        dimension_values = columns.get(self.fields.get('dimension'))
+        time_values = columns.get(self.fields.get('time'))
+
+        changed_points: set = set()
+        changed_categories: set = set()
+        reset = False
+        for i in range(length):
+            value = self._number(measure_values[i]) if measure_values is not None and i < len(measure_values) else None
+            if measure_values is not None and value is None:
+                self.skipped_values += 1
+
+            if value is not None:
+                self.count += 1
+                self.total += value
+                delta = value - self.mean
+                self.mean += delta / self.count
+                self._m2 += delta * (value - self.mean)
+                self.minimum = value if self.minimum is None else min(self.minimum, value)
+                self.maximum = value if self.maximum is None else max(self.maximum, value)
+                self.sketch.add(value)
+                self.window.add(value)
+
+                if time_values is not None:
+                    x = self._timestamp(time_values[i]) if i < len(time_values) else None
+                else:
+                    x = float(self.rows + i)
+                if x is not None:
+                    reset = self._add_point(x, value, changed_points) or reset
+
+            if dimension_values is not None:
+                raw = dimension_values[i] if i < len(dimension_values) else None
+                category = _MISSING if raw is None or raw == '' else str(raw)
+                if category not in self.categories and len(self.categories) >= MAX_TRACKED_CATEGORIES:
+                    category = _OTHER
+                entry = self.categories.setdefault(category, [0, 0.0])
+                entry[0] += 1
+                if value is not None:
+                    entry[1] += value
+                changed_categories.add(category)
+
+        self.rows += length
+        return self._delta(changed_points, changed_categories, reset)
+
+    def _points(self, keys) -> List[List[float]]:
+        return [
+            [self._bucket_x(key), total / count]
+            for key, (total, count) in sorted((k, self._buckets[k]) for k in keys if k in self._buckets)
+        ]
+
+    def _measure_stats(self) -> Dict:
+        return {
+            'field': self.fields.get('measure'),
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.mean if self.count else None,
+            'std': math.sqrt(self._m2 / self.count) if self.count > 1 else 0.0,
+            'min': self.minimum,
+            'max': self.maximum,
+            'quantiles': {f"p{int(q * 100)}": self.sketch.quantile(q) for q in (0.5, 0.9, 0.99)},
+            'window': self.window.summary()
+        }
+
+    def _delta(self, changed_points: set, changed_categories: set, reset: bool) -> Dict:
+        self.seq += 1
+        delta = {
+            'type': 'dashboard_delta',
+            'dashboard_id': self.dashboard_id,
+            'seq': self.seq,
+            'rows_total': self.rows,
+            'measure_stats': self._measure_stats()
+        }
+        if changed_points or reset:
+            delta['processed_data'] = {
+                'reset': reset,
+                'bucket_width': self._width,
+                'points': self._points(self._buckets if reset else changed_points)
+            }
+        if changed_categories:
+            delta['category_data'] = {name: self.categories[name][1] for name in sorted(changed_categories)}
+            delta['distribution_data'] = {name: self.categories[name][0] for name in sorted(changed_categories)}
+        return delta
+
+    def snapshot(self) -> Dict:
+        """Full chart state, sent on subscribe and whenever a client resyncs"""
+        ranked = sorted(self.categories.items(), key=lambda item: -item[1][1])
+        return {
+            'type': 'dashboard_snapshot',
+            'dashboard_id': self.dashboard_id,
+            'seq': self.seq,
+            'fields': self.fields,
+            'rows_total': self.rows,
+            'skipped_values': self.skipped_values,
+            'measure_stats': self._measure_stats(),
+            'processed_data': {
+                'reset': True,
+                'bucket_width': self._width,
+                'points': self._points(self._buckets)
+            },
+            'category_data': {name: totals[1] for name, totals in ranked},
+            'distribution_data': {name: totals[0] for name, totals in ranked}
+        }
+
+
+class DashboardHub:
+    """Live dashboards by id; each belongs to the connection that subscribed it"""
+
+    def __init__(self):
+        self._dashboards: Dict[str, LiveDashboard] = {}
+        self._owners: Dict[str, Any] = {}
+
+    def subscribe(self, owner: Any, fields: Optional[Dict] = None, budget: Optional[Dict] = None,
+                  window: Optional[int] = None) -> LiveDashboard:
+        """New dashboard for `owner`; raises ValueError for fields or a window a client should not send"""
+        if fields is not None and not (
+            isinstance(fields, dict) and all(isinstance(fields.get(key), (str, type(None))) for key in FIELD_KEYS)
+        ):
+            raise ValueError(f"fields must map {', '.join(FIELD_KEYS)} to column names")
+        if window is None:
+            window = DEFAULT_WINDOW
+        elif not isinstance(window, int) or isinstance(window, bool):
+            raise ValueError("window must be an integer number of rows")
+        dashboard = LiveDashboard(fields, budget, min(max(window, 1), MAX_WINDOW))
+        self._dashboards[dashboard.dashboard_id] = dashboard
+        self._owners[dashboard.dashboard_id] = owner
+        logger.info(f"Live dashboard {dashboard.dashboard_id} subscribed")
+        return dashboard
+
+    def get(self, dashboard_id: str, owner: Any) -> LiveDashboard:
+        dashboard = self._dashboards.get(dashboard_id)
+        if dashboard is None or self._owners.get(dashboard_id) is not owner:
+            raise KeyError(f"Dashboard {dashboard_id} not found")
+        return dashboard
+
+    def unsubscribe(self, dashboard_id: str, owner: Any) -> bool:
+        if self._owners.get(dashboard_id) is not owner:
+            return False
+        self._owners.pop(dashboard_id)
+        self._dashboards.pop(dashboard_id, None)
+        return True
+
+    def drop_owner(self, owner: Any):
+        """Forget every dashboard of a closed connection"""
+        for dashboard_id in [d for d, o in self._owners.items() if o is owner]:
+            self.unsubscribe(dashboard_id, owner)
+
+    def stats(self) -> Dict:
+        return {
+            'live_dashboards': len(self._dashboards),
+            'rows_total': sum(d.rows for d in self._dashboards.values())
+        }
+
+
+dashboards = DashboardHub()
@@ -0,0 +1,163 @@
+"""
+PurpleBrain-AI LLM Gateway
+Single entry point for chat completions, fronted by the semantic cache
+"""
+
+import time
+import asyncio
+import hashlib
+import logging
+import contextvars
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import openai
+
+try:
+    import aiohttp
+except ImportError:  # without it every call keeps opening its own connection
+    aiohttp = None
+
+from backend import accounting, deadlines
+from backend.hedging import RequestHedger, hedger as default_hedger
+from backend.model_router import Route, model_router
+from backend.resilience import CircuitOpenError, breakers
+from backend.semantic_cache import SemanticCache, semantic_cache
+from backend.prompts import count_tokens
+from backend.tracing import KIND_CLIENT, tracer
+
+logger = logging.getLogger(__name__)
+
+# Sampled, creative completions are expected to differ run to run - never cache them
+CACHEABLE_MAX_TEMPERATURE = 0.5
+
+# Circuit breaker name for the completion API
+LLM_UPSTREAM = 'openai'
+
+# Pooled HTTP session (and the loop that owns it) shared by calls inside shared_session()
+_session: contextvars.ContextVar[Optional[tuple]] = contextvars.ContextVar('purplebrain_llm_session', default=None)
+
+
+def cache_namespace(model: str, system: str, temperature: float, max_tokens: int, scope: str = '') -> str:
+    """Completions are only interchangeable for the same model, system prompt, sampling and scope"""
+    digest = hashlib.sha1(system.encode('utf-8')).hexdigest()[:12]
+    return f"{scope}:{model}:{digest}:{temperature}:{max_tokens}"
+
+
+@asynccontextmanager
+async def shared_session(connections: int = 32) -> AsyncIterator[None]:
+    """Reuse one keep-alive connection pool for every completion in the scope
+
+    The client otherwise opens (and TLS-handshakes) a new session per call.
+    Calls made on another event loop (thread-executor agents) are unaffected.
+    """
+    if aiohttp is None or not hasattr(openai, 'aiosession') or _session.get() is not None:
+        yield
+        return
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=connections)) as session:
+        token = _session.set((asyncio.get_running_loop(), session))
+        try:
+            yield
+        finally:
+            _session.reset(token)
+
+
+async def _create(model: str, system: str, prompt: str, max_tokens: int, temperature: float) -> str:
+    """One upstream chat completion request (hedged backups included), charged to the current usage scope"""
+    accounting.count_upstream(LLM_UPSTREAM)
+    shared, token = _session.get(), None
+    if shared is not None and shared[0] is asyncio.get_running_loop():
+        token = openai.aiosession.set(shared[1])
+    try:
+        response = await openai.ChatCompletion.acreate(
+            model=model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            request_timeout=deadlines.remaining()
+        )
+    finally:
+        if token is not None:
+            openai.aiosession.reset(token)
+    content = response.choices[0].message.content
+    if accounting.current() is not None:
+        usage = response.get('usage') or {}
+        accounting.add(
+            prompt_tokens=usage.get('prompt_tokens') or count_tokens(system, model) + count_tokens(prompt, model),
+            completion_tokens=usage.get('completion_tokens') or count_tokens(content or '', model)
+        )
+    return content
+
+
+async def chat_completion(system: str, prompt: str, model: str = "gpt-4", max_tokens: int = 1500,
+                          temperature: float = 0.3, cache_key: Optional[str] = None, cache_scope: str = '',
+                          cache: Optional[SemanticCache] = semantic_cache,
+                          hedger: Optional[RequestHedger] = default_hedger,
+                          route: Optional[Route] = None) -> str:
+    """Chat completion text; raises on API errors so callers keep their own fallbacks
+
+    Prompts built from a long fixed template should pass the variable part
+    (e.g. the user's query) as `cache_key` and name the template in
+    `cache_scope`; otherwise the shared template dominates the similarity.
+    Cache misses go through the hedger, which races a backup request
+    against calls in the model's latency tail. A `route` from the model
+    router replaces model, max_tokens and temperature, and its outcome is
+    recorded for policy tuning. While the upstream's circuit breaker is
+    open, calls raise CircuitOpenError at once instead of waiting to time out.
+    """
+    if cache_key is not None and not isinstance(cache_key, str):
+        # Keys are normalized as text; anything else would fail inside the cache lookup and pass for an upstream error
+        raise TypeError(f"cache_key must be the query text, not {type(cache_key).__name__}")
+    backup_model = None
+    if route is not None:
+        model, max_tokens, temperature = route.model, route.max_tokens, route.temperature
+        backup_model = route.backup_model
+        cache_scope = cache_scope or route.stage
+    with tracer.span('llm.chat_completion', KIND_CLIENT, **{
+        'llm.stage': cache_scope or None, 'llm.model': model, 'llm.max_tokens': max_tokens,
+        'llm.temperature': temperature
+    }) as span:
+        if span.recording:
+            # Only counted for sampled traces; tokenizing is not free
+            span.set('llm.prompt_tokens', count_tokens(system, model) + count_tokens(prompt, model))
+        if temperature > CACHEABLE_MAX_TEMPERATURE:
+            cache = None
+        namespace = cache_namespace(model, system, temperature, max_tokens, cache_scope)
+        cache_key = cache_key or prompt
+        if cache is not None:
+            cached = cache.lookup(namespace, cache_key)
+            span.set('llm.cache_hit', cached is not None)
+            if cached is not None:
+                logger.info(f"Semantic cache hit ({namespace})")
+                accounting.count_cache_hit('semantic_cache')
+                return cached
+
+        started = time.perf_counter()
+        def call(model: str):
+            # Hedged attempts run as tasks of their own; their client-side CPU still belongs to this request
+            return accounting.metered(_create(model, system, prompt, max_tokens, temperature))
+        async def upstream():
+            # Abandoned or out-of-time requests never reach (or stop waiting on) the API
+            if hedger is not None:
+                return await deadlines.guard(hedger.run(call, model, backup_model), f"{cache_scope or model} completion")
+            return await deadlines.guard(call(model), f"{cache_scope or model} completion")
+    
+        try:
+            content = await breakers.get(LLM_UPSTREAM).call(upstream)
+        except (CircuitOpenError, *deadlines.ABANDONED):
+            raise
+        except Exception:
+            if route is not None:
+                model_router.record(route, time.perf_counter() - started, success=False)
+            raise
+        if route is not None:
+            model_router.record(route, time.perf_counter() - started, success=True)
+        if cache is not None:
+            # Embedding, indexing and the periodic save stay off the event loop
+            await accounting.to_thread(cache.store, namespace, cache_key, content, time.perf_counter() - started)
+        if span.recording:
+            span.set('llm.completion_tokens', count_tokens(content, model))
+        return content
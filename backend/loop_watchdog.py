@@ -0,0 +1,238 @@
+"""
+PurpleBrain-AI Event Loop Watchdog
+Continuous event-loop lag measurement with stack capture of the calls that block the loop
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LOOP_WATCHDOG_ENABLED = os.environ.get('PURPLEBRAIN_LOOP_WATCHDOG', '1') == '1'
+# A loop that has not run its heartbeat for this long is blocked; the offending stack is captured
+BLOCK_THRESHOLD_MS = float(os.environ.get('PURPLEBRAIN_LOOP_BLOCK_MS', 100))
+HEARTBEAT_INTERVAL_MS = float(os.environ.get('PURPLEBRAIN_LOOP_INTERVAL_MS', 50))
+
+# Upper bounds (ms) of the lag histogram buckets; the last bucket is unbounded
+LAG_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+MAX_SITES = 256
+STACK_DEPTH = 40
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _is_app_frame(filename: str) -> bool:
+    return filename.startswith(_ROOT) and 'site-packages' not in filename and filename != __file__
+
+
+def _site(stack: traceback.StackSummary) -> Tuple[str, str]:
+    """Call-site key: the innermost frame of our own code, and the frame that was actually running"""
+    def where(frame: traceback.FrameSummary) -> str:
+        path = os.path.relpath(frame.filename, _ROOT) if frame.filename.startswith(_ROOT) else frame.filename
+        return f"{path}:{frame.lineno} in {frame.name}"
+
+    app_frames = [frame for frame in stack if _is_app_frame(frame.filename)]
+    return (where(app_frames[-1]) if app_frames else '(no application frame)'), where(stack[-1])
+
+
+class LagHistogram:
+    """Heartbeat lag of one kind of loop, in fixed buckets"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.samples = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.stalls = 0
+
+    def add(self, lag_ms: float):
+        index = next((i for i, bound in enumerate(LAG_BUCKETS_MS) if lag_ms <= bound), len(LAG_BUCKETS_MS))
+        self.counts[index] += 1
+        self.samples += 1
+        self.total_ms += lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th percentile"""
+        if not self.samples:
+            return None
+        rank, seen = self.samples * p / 100, 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return LAG_BUCKETS_MS[index] if index < len(LAG_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict:
+        bounds = [str(bound) for bound in LAG_BUCKETS_MS] + ['+Inf']
+        return {
+            'samples': self.samples,
+            'mean_ms': round(self.total_ms / self.samples, 3) if self.samples else None,
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max_ms, 3),
+            'stalls': self.stalls,
+            'buckets_ms': dict(zip(bounds, self.counts))
+        }
+
+
+class _Heartbeat:
+    """What the watchdog thread knows about one monitored loop"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.thread_id = threading.get_ident()
+        self.due = time.monotonic()
+        self.stall_site: Optional[Tuple[str, str]] = None
+
+
+class LoopWatchdog:
+    """Heartbeats on each monitored loop plus one thread that notices when a heartbeat is overdue
+
+    A heartbeat sleeps `interval` and measures how late it woke up (the
+    loop's lag). If it is more than `threshold` late, the watchdog thread
+    grabs the loop thread's stack while the blocking call is still on it.
+    """
+
+    def __init__(self, threshold_ms: float = BLOCK_THRESHOLD_MS, interval_ms: float = HEARTBEAT_INTERVAL_MS,
+                 enabled: bool = LOOP_WATCHDOG_ENABLED):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.enabled = enabled
+        self._beats: Dict[int, _Heartbeat] = {}
+        self._histograms: Dict[str, LagHistogram] = {}
+        self._sites: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch, name='purplebrain-loop-watchdog', daemon=True)
+                self._thread.start()
+
+    def _watch(self):
+        poll = max(0.005, min(self.interval, self.threshold / 2))
+        while True:
+            time.sleep(poll)
+            now = time.monotonic()
+            with self._lock:
+                beats = list(self._beats.values())
+            for beat in beats:
+                if beat.stall_site is None and now - beat.due > self.threshold:
+                    self._capture(beat)
+
+    def _capture(self, beat: _Heartbeat):
+        frame = sys._current_frames().get(beat.thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame, limit=STACK_DEPTH)
+        del frame
+        if not stack:
+            return
+        site = _site(stack)
+        beat.stall_site = site
+        with self._lock:
+            entry = self._sites.get(site)
+            if entry is None:
+                if len(self._sites) >= MAX_SITES:
+                    # Forget the site that has cost the least so far
+                    del self._sites[min(self._sites, key=lambda key: self._sites[key]['blocked_ms'])]
+                entry = self._sites[site] = {'count': 0, 'blocked_ms': 0.0, 'max_ms': 0.0, 'loops': set(),
+                                             'stack': traceback.format_list(stack[-12:])}
+            entry['count'] += 1
+            entry['loops'].add(beat.name)
+        logger.warning(f"Event loop '{beat.name}' blocked for over {self.threshold * 1000:.0f}ms at {site[0]} ({site[1]})")
+
+    def _register(self, beat: _Heartbeat):
+        self._ensure_thread()
+        with self._lock:
+            self._beats[id(beat)] = beat
+            self._histograms.setdefault(beat.name, LagHistogram())
+
+    def _unregister(self, beat: _Heartbeat):
+        with self._lock:
+            self._beats.pop(id(beat), None)
+
+    def _beat(self, beat: _Heartbeat, lag: float):
+        lag_ms = max(0.0, lag * 1000)
+        with self._lock:
+            histogram = self._histograms[beat.name]
+            histogram.add(lag_ms)
+            if beat.stall_site is not None:
+                histogram.stalls += 1
+                entry = self._sites.get(beat.stall_site)
+                if entry is not None:
+                    # The late wake-up is the whole stall, not just the part seen at capture time
+                    entry['blocked_ms'] += lag_ms
+                    entry['max_ms'] = max(entry['max_ms'], lag_ms)
+        beat.stall_site = None
+
+    async def heartbeat(self, name: str):
+        """Run forever on the current loop, measuring its lag"""
+        beat = _Heartbeat(name)
+        self._register(beat)
+        try:
+            while True:
+                beat.due = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                self._beat(beat, time.monotonic() - beat.due)
+        finally:
+            if beat.stall_site is not None:
+                # Cancelled right after a stall (the monitored work just finished); still count it
+                self._beat(beat, time.monotonic() - beat.due)
+            self._unregister(beat)
+
+    def start(self, name: str) -> Optional[asyncio.Task]:
+        """Monitor the running loop for as long as it lives (e.g. the uvicorn loop)"""
+        if not self.enabled:
+            return None
+        return asyncio.ensure_future(self.heartbeat(name))
+
+    async def monitored(self, awaitable: Awaitable, name: str) -> Any:
+        """Await `awaitable` with the loop monitored meanwhile (for short-lived per-request loops)"""
+        if not self.enabled:
+            return await awaitable
+        heartbeat = asyncio.ensure_future(self.heartbeat(name))
+        try:
+            return await awaitable
+        finally:
+            heartbeat.cancel()
+            try:
+                await heartbeat
+            except asyncio.CancelledError:
+                pass
+
+    def top_sites(self, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            sites = sorted(self._sites.items(), key=lambda item: item[1]['blocked_ms'], reverse=True)[:limit]
+            return [{
+                'site': site[0],
+                'blocking_call': site[1],
+                'count': entry['count'],
+                'blocked_ms': round(entry['blocked_ms'], 1),
+                'max_ms': round(entry['max_ms'], 1),
+                'loops': sorted(entry['loops']),
+                'stack': entry['stack']
+            } for site, entry in sites]
+
+    def stats(self, limit: int = 20) -> Dict:
+        with self._lock:
+            loops = {name: histogram.to_dict() for name, histogram in self._histograms.items()}
+            monitored = len(self._beats)
+        return {
+            'enabled': self.enabled,
+            'threshold_ms': self.threshold * 1000,
+            'interval_ms': self.interval * 1000,
+            'monitored_loops': monitored,
+            'loops': loops,
+            'blocking_sites': self.top_sites(limit)
+        }
+
+
+loop_watchdog = LoopWatchdog()
@@ -0,0 +1,184 @@
+"""
+PurpleBrain-AI Stage Memoization
+Pipeline stage results keyed by a hash of only the inputs each stage declares
+"""
+
+import os
+import copy
+import json
+import time
+import hashlib
+import inspect
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Sequence, Union
+
+from backend import accounting
+from backend.payloads import PayloadHandle
+from backend.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+STAGE_MEMO_ENABLED = os.environ.get('PURPLEBRAIN_STAGE_MEMO', '1') == '1'
+STAGE_MEMO_ENTRIES = int(os.environ.get('PURPLEBRAIN_STAGE_MEMO_ENTRIES', 1024))
+# Upstream facts drift; a memoized stage is recomputed after this long even if its inputs did not change
+STAGE_MEMO_TTL = float(os.environ.get('PURPLEBRAIN_STAGE_MEMO_TTL_S', 3600))
+
+# Set while a memoized stage runs; fallbacks inside it flip `degraded` so the result is not kept
+_frame: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar('purplebrain_stage_frame', default=None)
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, PayloadHandle):
+        # Handle ids are random per request; the content is what the stage depends on
+        return {'$payload_sha256': value.digest()}
+    if hasattr(value, 'model_dump'):
+        return value.model_dump()
+    return str(value)
+
+
+def fingerprint(inputs: Dict) -> str:
+    raw = json.dumps(inputs, sort_keys=True, separators=(',', ':'), default=_encode)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def mark_degraded():
+    """Called from fallback paths: the enclosing stage's result must not be memoized"""
+    frame = _frame.get()
+    if frame is not None:
+        frame['degraded'] = True
+
+
+@contextmanager
+def independent() -> Iterator[None]:
+    """Work started inside (e.g. speculative downstream branches) cannot taint the enclosing stage"""
+    token = _frame.set(None)
+    try:
+        yield
+    finally:
+        _frame.reset(token)
+
+
+class StageMemo:
+    """LRU of stage outputs; a stage is recomputed only when one of its declared inputs changes"""
+
+    def __init__(self, max_entries: int = STAGE_MEMO_ENTRIES, ttl: float = STAGE_MEMO_TTL,
+                 enabled: bool = STAGE_MEMO_ENABLED):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, stage: str, key: str):
+        with self._lock:
+            counts = self._stats.setdefault(stage, {'hits': 0, 'misses': 0, 'stored': 0, 'skipped': 0})
+            counts[key] += 1
+
+    def key(self, stage: str, inputs: Dict) -> str:
+        return f"{stage}:{fingerprint(inputs)}"
+
+    def get(self, stage: str, inputs: Dict) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        key = self.key(stage, inputs)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            self._count(stage, 'misses')
+            return None
+        self._count(stage, 'hits')
+        # Callers may decorate what they get back; the memoized copy stays pristine
+        return copy.deepcopy(entry[1])
+
+    def put(self, stage: str, inputs: Dict, value: Any):
+        if not self.enabled:
+            return
+        key = self.key(stage, inputs)
+        stored = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self._count(stage, 'stored')
+
+    async def run(self, stage: str, inputs: Dict, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Memoized `compute()`; results produced through a fallback path are returned but not kept"""
+        with tracer.span(f"stage.{stage}") as span:
+            value = await self._run(stage, inputs, compute, span)
+        return value
+
+    async def _run(self, stage: str, inputs: Dict, compute: Callable[[], Awaitable[Any]], span) -> Any:
+        cached = self.get(stage, inputs)
+        span.set('memo.hit', cached is not None)
+        if cached is not None:
+            accounting.count_cache_hit('stage_memo')
+            return cached
+        frame = {'degraded': False}
+        token = _frame.set(frame)
+        try:
+            value = await compute()
+        finally:
+            _frame.reset(token)
+        if frame['degraded']:
+            self._count(stage, 'skipped')
+            span.set('memo.degraded', True)
+            logger.info(f"Not memoizing {stage}: a fallback produced part of it")
+            # A degraded inner stage also taints whatever stage encloses this one
+            mark_degraded()
+        else:
+            self.put(stage, inputs, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stages = {stage: dict(counts) for stage, counts in self._stats.items()}
+            size = len(self._entries)
+        return {'enabled': self.enabled, 'entries': size, 'max_entries': self.max_entries,
+                'ttl_s': self.ttl, 'stages': stages}
+
+
+stage_memo = StageMemo()
+
+
+def memoized_stage(stage: str, depends_on: Union[Sequence[str], Callable[..., Dict]],
+                   memo: Optional[StageMemo] = None):
+    """Declare an async agent stage's inputs and memoize it on them
+
+    `depends_on` names the parameters the stage's output is a function of,
+    or is a callable taking the stage's parameters and returning the inputs
+    dict (for stages that only depend on part of an argument). Anything not
+    declared - notably presentation settings such as `style` - does not
+    invalidate the memoized result.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {k: v for k, v in bound.arguments.items() if k != 'self'}
+            if callable(depends_on):
+                inputs = depends_on(**arguments)
+            else:
+                inputs = {name: arguments[name] for name in depends_on}
+            return await (memo or stage_memo).run(stage, inputs, lambda: func(*args, **kwargs))
+
+        return wrapper
+    return decorator
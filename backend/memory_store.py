@@ -0,0 +1,379 @@
+"""
+PurpleBrain-AI Agent Memory
+Persistent agent results in SQLite (FTS5 full-text index) with top-k retrieval for prompts
+"""
+
+import os
+import re
+import json
+import math
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from backend import accounting
+from backend.payloads import describe_payloads
+from backend.tracing import KIND_CLIENT, tracer
+
+logger = logging.getLogger(__name__)
+
+MEMORY_PATH = os.environ.get('PURPLEBRAIN_MEMORY_PATH', 'purplebrain_memory.db')
+
+# Retention: rows older than this, or beyond the newest N per agent, are deleted
+RETENTION_DAYS = float(os.environ.get('PURPLEBRAIN_MEMORY_RETENTION_DAYS', 90))
+MAX_PER_AGENT = int(os.environ.get('PURPLEBRAIN_MEMORY_MAX_PER_AGENT', 1000000))
+
+# Optional in-memory vector index over the newest memories (0 disables it)
+VECTOR_INDEX_SIZE = int(os.environ.get('PURPLEBRAIN_MEMORY_VECTOR_INDEX', 0))
+
+# Newest matches read per query term. Rare terms are read in full; very common ones
+# only over their most recent matches, so lookup cost stays flat as the store grows
+CANDIDATES_PER_TERM = int(os.environ.get('PURPLEBRAIN_MEMORY_CANDIDATES_PER_TERM', 250))
+
+# Vector neighbours below this cosine similarity are noise, not recall
+VECTOR_MIN_SIMILARITY = 0.3
+
+# Writes between retention sweeps
+RETENTION_EVERY = 1000
+
+# Characters of result text kept for indexing and prompt context
+SUMMARY_CHARS = 2000
+
+# Result fields that carry an agent's actual output, in order of preference
+_SUMMARY_FIELDS = ('synthesis', 'enhanced_content', 'content', 'narrative', 'summary', 'analysis', 'ai_analysis')
+_QUERY_FIELDS = ('query', 'content', 'topic', 'prompt')
+_TERM = re.compile(r"[A-Za-z0-9]{2,}")
+_STOPWORDS = {
+    'the', 'and', 'for', 'with', 'that', 'this', 'from', 'are', 'was', 'were', 'what',
+    'how', 'why', 'which', 'about', 'into', 'its', 'has', 'have', 'had', 'will', 'can'
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    id INTEGER PRIMARY KEY,
+    agent TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    query TEXT NOT NULL DEFAULT '',
+    summary TEXT NOT NULL DEFAULT '',
+    task TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS memories_agent_time ON memories(agent, created_at);
+CREATE INDEX IF NOT EXISTS memories_time ON memories(created_at);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+    query, summary, content='memories', content_rowid='id', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS memories_fts_insert AFTER INSERT ON memories BEGIN
+    INSERT INTO memories_fts(rowid, query, summary) VALUES (new.id, new.query, new.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS memories_fts_delete AFTER DELETE ON memories BEGIN
+    INSERT INTO memories_fts(memories_fts, rowid, query, summary) VALUES ('delete', old.id, old.query, old.summary);
+END;
+"""
+
+
+def task_text(task: Any) -> str:
+    """The text a task asks about: the task itself, or its first query-like field"""
+    if isinstance(task, str):
+        return task
+    if isinstance(task, dict):
+        for field in _QUERY_FIELDS:
+            if isinstance(task.get(field), str) and task[field]:
+                return task[field]
+    return json.dumps(describe_payloads(task), default=str)[:500]
+
+
+def _result_text(result: Any) -> str:
+    """The prose an agent produced, found at the usual result fields"""
+    if isinstance(result, str):
+        return result[:SUMMARY_CHARS]
+    if not isinstance(result, dict):
+        return ''
+    parts = []
+    for field in _SUMMARY_FIELDS:
+        value = result.get(field)
+        if isinstance(value, str):
+            parts.append(value)
+        elif isinstance(value, dict):
+            parts.append(_result_text(value))
+    return '\n'.join(p for p in parts if p)[:SUMMARY_CHARS]
+
+
+def _query_terms(text: str) -> List[str]:
+    terms = []
+    for term in _TERM.findall(text.lower()):
+        if term not in _STOPWORDS and term not in terms:
+            terms.append(term)
+    return terms[:12]
+
+
+class MemoryStore:
+    """SQLite-backed memory shared by every agent (and process) using the same file
+
+    WAL mode lets readers run alongside the single writer; each thread gets
+    its own connection.
+    """
+
+    def __init__(self, path: str = MEMORY_PATH, retention_days: float = RETENTION_DAYS,
+                 max_per_agent: int = MAX_PER_AGENT, vector_index_size: int = VECTOR_INDEX_SIZE):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_per_agent = max_per_agent
+        self.vector_index_size = vector_index_size
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writes = 0
+        self._ready = False
+        self.fts = True
+        self._vectors = None
+        self._vectorizer = None
+        self._vector_ids: List[int] = []
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        if not self._ready:
+            self._setup(connection)
+        return connection
+
+    def _setup(self, connection: sqlite3.Connection):
+        with self._write_lock:
+            if self._ready:
+                return
+            connection.executescript(_SCHEMA)
+            try:
+                connection.executescript(_FTS_SCHEMA)
+            except sqlite3.OperationalError as e:
+                # SQLite built without FTS5: fall back to recency + LIKE matching
+                logger.warning(f"FTS5 unavailable, memory search degraded: {e}")
+                self.fts = False
+            if self.vector_index_size:
+                self._load_vectors(connection)
+            self._ready = True
+        self.apply_retention()
+
+    def _load_vectors(self, connection: sqlite3.Connection):
+        from backend.semantic_cache import HNSWIndex, HashedNgramVectorizer, normalize_prompt
+
+        self._vectorizer = HashedNgramVectorizer()
+        self._normalize = normalize_prompt
+        self._vectors = HNSWIndex(self._vectorizer.dim)
+        rows = connection.execute(
+            'SELECT id, query, summary FROM memories ORDER BY id DESC LIMIT ?', (self.vector_index_size,)
+        ).fetchall()
+        for row in reversed(rows):
+            self._index_vector(row['id'], f"{row['query']} {row['summary']}")
+
+    def _index_vector(self, memory_id: int, text: str):
+        self._vectors.add(str(memory_id), self._vectorizer.embed(self._normalize(text)))
+        self._vector_ids.append(memory_id)
+        if len(self._vector_ids) > self.vector_index_size:
+            self._vectors.remove(str(self._vector_ids.pop(0)))
+
+    def remember(self, agent: str, task: Any, result: Any) -> int:
+        """Persist one agent result; returns its memory id"""
+        query = task_text(task)
+        summary = _result_text(result)
+        task_json = json.dumps(describe_payloads(task), default=str)
+        result_json = json.dumps(describe_payloads(result), default=str)
+        connection = self._connection()
+        with self._write_lock:
+            cursor = connection.execute(
+                'INSERT INTO memories (agent, created_at, query, summary, task, result) VALUES (?, ?, ?, ?, ?, ?)',
+                (agent, time.time(), query, summary, task_json, result_json)
+            )
+            connection.commit()
+            memory_id = cursor.lastrowid
+            if self._vectors is not None:
+                self._index_vector(memory_id, f"{query} {summary}")
+            self._writes += 1
+            sweep = self._writes % RETENTION_EVERY == 0
+        accounting.add(db_write_bytes=sum(len(text.encode('utf-8')) for text in (query, summary, task_json, result_json)))
+        if sweep:
+            self.apply_retention()
+        return memory_id
+
+    def recall(self, text: str, agent: Optional[str] = None, k: int = 5,
+               since: Optional[float] = None) -> List[Dict]:
+        """Top-k past results relevant to `text` (term relevance, plus vector similarity when enabled)"""
+        connection = self._connection()
+        scored: Dict[int, float] = {}
+        terms = _query_terms(text)
+        if self.fts and terms:
+            scored = self._term_scores(connection, terms, agent)
+        elif terms:
+            pattern = f"%{terms[0]}%"
+            rows = connection.execute(
+                'SELECT id FROM memories WHERE (query LIKE ? OR summary LIKE ?) AND (? IS NULL OR agent = ?) '
+                'ORDER BY created_at DESC LIMIT ?',
+                (pattern, pattern, agent, agent, k)
+            ).fetchall()
+            scored = {row['id']: 0.5 for row in rows}
+
+        if self._vectors is not None and text:
+            with self._write_lock:
+                neighbours = self._vectors.search(self._vectorizer.embed(self._normalize(text)), k * 4)
+            for key, similarity in neighbours:
+                if similarity >= VECTOR_MIN_SIMILARITY:
+                    memory_id = int(key)
+                    scored[memory_id] = scored.get(memory_id, 0.0) + similarity
+
+        if not scored:
+            return []
+        ranked = sorted(scored, key=scored.get, reverse=True)[:k * 4]
+        placeholders = ','.join('?' * len(ranked))
+        rows = connection.execute(
+            f'SELECT id, agent, created_at, query, summary FROM memories WHERE id IN ({placeholders}) '
+            'AND (? IS NULL OR agent = ?) AND (? IS NULL OR created_at >= ?)',
+            (*ranked, agent, agent, since, since)
+        ).fetchall()
+        by_id = {row['id']: row for row in rows}
+        return [
+            {**dict(by_id[memory_id]), 'score': scored[memory_id]}
+            for memory_id in ranked if memory_id in by_id
+        ][:k]
+
+    def _term_scores(self, connection: sqlite3.Connection, terms: List[str], agent: Optional[str]) -> Dict[int, float]:
+        """BM25-style relevance: summed IDF of the query terms each memory contains
+
+        FTS5's built-in bm25() (and fts5vocab) walk every match of a term to
+        count documents, which is linear in the store size for common terms.
+        Here each term's matches are streamed newest-first, at most
+        CANDIDATES_PER_TERM of them; when the cap is hit, document frequency
+        is estimated from the match density over the id range read.
+        """
+        # Separate MIN/MAX subqueries so each is a single index probe
+        oldest, newest = connection.execute(
+            'SELECT (SELECT MIN(id) FROM memories), (SELECT MAX(id) FROM memories)'
+        ).fetchone()
+        if newest is None:
+            return {}
+        total = newest - oldest + 1
+
+        scores: Dict[int, float] = {}
+        for term in terms:
+            # Quoted phrase: user text is never interpreted as FTS syntax
+            ids = [row[0] for row in connection.execute(
+                'SELECT f.rowid FROM memories_fts f JOIN memories m ON m.id = f.rowid '
+                'WHERE memories_fts MATCH ? AND (? IS NULL OR m.agent = ?) ORDER BY f.rowid DESC LIMIT ?',
+                (f'"{term}"', agent, agent, CANDIDATES_PER_TERM)
+            ).fetchall()]
+            if not ids:
+                continue
+            if len(ids) < CANDIDATES_PER_TERM:
+                documents = len(ids)
+            else:
+                documents = len(ids) * total / (newest - ids[-1] + 1)
+            idf = math.log(1 + (total - documents + 0.5) / (documents + 0.5))
+            for memory_id in ids:
+                scores[memory_id] = scores.get(memory_id, 0.0) + idf
+        if not scores:
+            return {}
+        best = max(scores.values())
+        # Normalised to (0, 1]; newer memories win ties
+        return {memory_id: score / best + memory_id * 1e-12 for memory_id, score in scores.items()}
+
+    def context_for(self, text: str, agent: Optional[str] = None, k: int = 3, max_chars: int = 1500) -> str:
+        """Relevant past results formatted for a prompt ('' when there are none)"""
+        lines = []
+        used = 0
+        for memory in self.recall(text, agent=agent, k=k):
+            snippet = memory['summary'][:max(0, max_chars - used)]
+            if not snippet:
+                break
+            lines.append(f"- ({memory['query'][:120]}) {snippet}")
+            used += len(snippet)
+        return '\n'.join(lines)
+
+    def recent(self, agent: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        rows = self._connection().execute(
+            'SELECT id, agent, created_at, query, summary FROM memories WHERE (? IS NULL OR agent = ?) '
+            'ORDER BY created_at DESC LIMIT ?',
+            (agent, agent, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, memory_id: int) -> Optional[Dict]:
+        row = self._connection().execute('SELECT * FROM memories WHERE id = ?', (memory_id,)).fetchone()
+        if row is None:
+            return None
+        memory = dict(row)
+        memory['task'] = json.loads(memory['task'])
+        memory['result'] = json.loads(memory['result'])
+        return memory
+
+    def count(self, agent: Optional[str] = None) -> int:
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM memories WHERE (? IS NULL OR agent = ?)', (agent, agent)
+        ).fetchone()[0]
+
+    def apply_retention(self) -> int:
+        """Delete memories past the age limit or beyond the per-agent cap"""
+        connection = self._connection()
+        deleted = 0
+        with self._write_lock:
+            if self.retention_days:
+                cutoff = time.time() - self.retention_days * 86400
+                deleted += connection.execute('DELETE FROM memories WHERE created_at < ?', (cutoff,)).rowcount
+            if self.max_per_agent:
+                for (agent,) in connection.execute('SELECT DISTINCT agent FROM memories').fetchall():
+                    row = connection.execute(
+                        'SELECT created_at FROM memories WHERE agent = ? ORDER BY created_at DESC LIMIT 1 OFFSET ?',
+                        (agent, self.max_per_agent)
+                    ).fetchone()
+                    if row is not None:
+                        deleted += connection.execute(
+                            'DELETE FROM memories WHERE agent = ? AND created_at <= ?', (agent, row[0])
+                        ).rowcount
+            connection.commit()
+        if deleted:
+            logger.info(f"Memory retention removed {deleted} entries")
+        return deleted
+
+
+class AgentMemory:
+    """One agent's view of the shared store"""
+
+    def __init__(self, store: MemoryStore, agent: str):
+        self.store = store
+        self.agent = agent
+
+    def __len__(self) -> int:
+        return self.store.count(self.agent)
+
+    def _span(self, operation: str):
+        return tracer.span(f"sqlite.memories.{operation}", KIND_CLIENT, **{
+            'db.system': 'sqlite', 'db.operation': operation, 'agent.name': self.agent
+        })
+
+    def remember(self, task: Any, result: Any) -> int:
+        with self._span('insert'):
+            return self.store.remember(self.agent, task, result)
+
+    def recall(self, text: str, k: int = 5) -> List[Dict]:
+        with self._span('recall') as span:
+            results = self.store.recall(text, agent=self.agent, k=k)
+            span.set('db.rows', len(results))
+            return results
+
+    def context_for(self, task: Any, k: int = 3, max_chars: int = 1500) -> str:
+        """Prompt context for a task (a query string or a task dict)"""
+        with self._span('context') as span:
+            context = self.store.context_for(task_text(task), agent=self.agent, k=k, max_chars=max_chars)
+            span.set('prompt.context_chars', len(context))
+            return context
+
+
+memory_store = MemoryStore()
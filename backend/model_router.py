@@ -0,0 +1,185 @@
+"""
+PurpleBrain-AI Model Router
+Declarative per-stage model, token and temperature policy with outcome tracking
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+from backend.hedging import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+# JSON merged over DEFAULT_POLICY, e.g. {"stages": {"insights": {"tier": "quality"}}}
+POLICY_ENV_VAR = 'PURPLEBRAIN_MODEL_POLICY'
+
+# Optional JSONL file of every routed call's outcome, for offline policy tuning
+OUTCOME_LOG_PATH = os.environ.get('PURPLEBRAIN_MODEL_OUTCOME_LOG', '')
+
+# Approximate prompt tokens at which a request counts as fully complex
+COMPLEXITY_TOKENS = 1200
+
+DEFAULT_POLICY: Dict[str, Any] = {
+    'tiers': {
+        'fast': {'model': 'gpt-3.5-turbo', 'max_tokens': 600, 'temperature': 0.2, 'backup_model': 'gpt-3.5-turbo'},
+        'quality': {'model': 'gpt-4', 'max_tokens': 1500, 'temperature': 0.3, 'backup_model': 'gpt-3.5-turbo'}
+    },
+    'stages': {
+        # Mostly replaced by the built-in defaults downstream; a small model is enough
+        'visualization_plan': {'tier': 'fast'},
+        'insights': {'tier': 'fast', 'max_tokens': 800,
+                     'escalate': {'above': 0.6, 'tier': 'quality', 'max_tokens': 1500}},
+        # Research feeds the fact-check gate; keep it on the strongest model
+        'research_synthesis': {'tier': 'quality'},
+        'code_switching': {'tier': 'quality', 'max_tokens': 1000, 'temperature': 0.7,
+                           'downgrade': {'below': 0.15, 'tier': 'fast'}}
+    },
+    'default_tier': 'quality'
+}
+
+
+@dataclass
+class Route:
+    """Where one LLM call goes and with which limits"""
+    stage: str
+    tier: str
+    model: str
+    max_tokens: int
+    temperature: float
+    backup_model: Optional[str]
+    complexity: float
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def estimate_complexity(text: str) -> float:
+    """0..1 from the size of the variable part of the prompt"""
+    return round(min(1.0, (len(text or '') / 4) / COMPLEXITY_TOKENS), 3)
+
+
+class _Outcomes:
+    """Running outcome totals for one (stage, model)"""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.latency = LatencyWindow()
+        self.quality_sum = 0.0
+        self.quality_count = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'p50_latency_s': self.latency.percentile(50),
+            'p95_latency_s': self.latency.percentile(95),
+            'mean_quality': round(self.quality_sum / self.quality_count, 4) if self.quality_count else None,
+            'quality_samples': self.quality_count
+        }
+
+
+class ModelRouter:
+    """Chooses model, max_tokens and temperature per stage and complexity"""
+
+    def __init__(self, policy: Optional[Dict] = None, outcome_log: str = OUTCOME_LOG_PATH):
+        self.policy = policy or DEFAULT_POLICY
+        self.outcome_log = outcome_log
+        self._outcomes: Dict[tuple, _Outcomes] = {}
+        self._lock = threading.Lock()
+
+    def configure_from_env(self, env_var: str = POLICY_ENV_VAR):
+        """Merge operator overrides (tiers and stages) over the current policy"""
+        raw = os.environ.get(env_var)
+        if not raw:
+            return
+        try:
+            overrides = json.loads(open(raw).read() if os.path.isfile(raw) else raw)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Invalid {env_var}: {e}")
+            return
+        policy = {
+            'tiers': {**self.policy['tiers']},
+            'stages': {**self.policy['stages']},
+            'default_tier': overrides.get('default_tier', self.policy['default_tier'])
+        }
+        for section in ('tiers', 'stages'):
+            for name, rules in overrides.get(section, {}).items():
+                policy[section][name] = {**policy[section].get(name, {}), **rules}
+        self.policy = policy
+
+    def route(self, stage: str, text: str = '') -> Route:
+        """Route for `stage`; `text` is the variable part of the prompt (e.g. the user's query)"""
+        rules = self.policy['stages'].get(stage, {})
+        complexity = estimate_complexity(text)
+        # Precedence: tier settings < stage settings < the matched escalate/downgrade rule
+        overrides = {k: v for k, v in rules.items() if k not in ('escalate', 'downgrade')}
+        escalate, downgrade = rules.get('escalate'), rules.get('downgrade')
+        if escalate and complexity > escalate['above']:
+            overrides.update(escalate)
+        elif downgrade and complexity < downgrade['below']:
+            overrides.update(downgrade)
+        tier = overrides.get('tier', self.policy['default_tier'])
+        if tier not in self.policy['tiers']:
+            logger.warning(f"Stage '{stage}' uses unknown tier '{tier}', using {self.policy['default_tier']}")
+            tier = self.policy['default_tier']
+        settings = self.policy['tiers'][tier]
+        return Route(
+            stage=stage,
+            tier=tier,
+            model=settings['model'],
+            max_tokens=int(overrides.get('max_tokens', settings['max_tokens'])),
+            temperature=float(overrides.get('temperature', settings['temperature'])),
+            backup_model=settings.get('backup_model'),
+            complexity=complexity
+        )
+
+    def _entry(self, stage: str, model: str) -> _Outcomes:
+        with self._lock:
+            return self._outcomes.setdefault((stage, model), _Outcomes())
+
+    def record(self, route: Route, latency: float, success: bool):
+        """Outcome of one routed upstream call (cache hits never reach here)"""
+        entry = self._entry(route.stage, route.model)
+        with self._lock:
+            entry.calls += 1
+            if success:
+                entry.latency.add(latency)
+            else:
+                entry.failures += 1
+        self._log({'event': 'call', 'route': route.to_dict(), 'latency_s': round(latency, 4), 'success': success})
+
+    def record_quality(self, stage: str, model: str, score: float):
+        """Downstream quality signal for a stage's output (e.g. fact-check accuracy of a synthesis)"""
+        entry = self._entry(stage, model)
+        with self._lock:
+            entry.quality_sum += score
+            entry.quality_count += 1
+        self._log({'event': 'quality', 'stage': stage, 'model': model, 'score': round(score, 4)})
+
+    def _log(self, outcome: Dict):
+        if not self.outcome_log:
+            return
+        outcome['at'] = time.time()
+        try:
+            with self._lock, open(self.outcome_log, 'a', encoding='utf-8') as log:
+                log.write(json.dumps(outcome) + '\n')
+        except OSError as e:
+            logger.warning(f"Could not write model outcome log: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            outcomes = dict(self._outcomes)
+        stages: Dict[str, List[Dict]] = {}
+        for (stage, model), entry in sorted(outcomes.items()):
+            stages.setdefault(stage, []).append({'model': model, **entry.to_dict()})
+        return {'policy': self.policy, 'outcomes': stages}
+
+
+model_router = ModelRouter()
+model_router.configure_from_env()
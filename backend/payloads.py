@@ -0,0 +1,370 @@
+"""
+PurpleBrain-AI Payload Handles
+Large task.data columns stored once in memory-mapped buffers and passed by reference
+"""
+
+import os
+import mmap
+import uuid
+import hashlib
+import logging
+import tempfile
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Lists with at least this many items are moved out of the Python heap
+PAYLOAD_MIN_ITEMS = int(os.environ.get('PURPLEBRAIN_PAYLOAD_MIN_ITEMS', 10000))
+
+
+def _default_directory() -> str:
+    # tmpfs when available, so mapped buffers are plain shared memory
+    base = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else tempfile.gettempdir()
+    return os.environ.get('PURPLEBRAIN_PAYLOAD_DIR') or os.path.join(base, 'purplebrain-payloads')
+
+
+class TextColumn(Sequence):
+    """Read-only string column over Arrow-style offsets + UTF-8 data buffers"""
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self) -> int:
+        return max(0, len(self._offsets) - 1)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('text column index out of range')
+        return bytes(self._data[self._offsets[index]:self._offsets[index + 1]]).decode('utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        offsets, data = self._offsets, self._data
+        for i in range(len(self)):
+            yield bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+
+class PayloadHandle:
+    """Reference to a column stored in the payload directory
+
+    Pickles as a small descriptor, so handing it to another agent, thread or
+    worker process never copies the data. `view()` maps the buffers
+    read-only; `to_list()` is the network-edge serializer. Code reading the
+    buffers holds a lease (`acquire()`/`release()`, or `leased()`), and
+    `close()` leaves them mapped until the last lease is released.
+    """
+
+    def __init__(self, payload_id: str, dtype: str, length: int, nbytes: int, directory: str):
+        self.payload_id = payload_id
+        self.dtype = dtype
+        self.length = length
+        self.nbytes = nbytes
+        self.directory = directory
+        self._maps: List[mmap.mmap] = []
+        self._views: List[memoryview] = []
+        self._column: Optional[Sequence] = None
+        self._digest: Optional[str] = None
+        self._leases = 0
+        self._closing = False
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return self.describe()
+
+    def __setstate__(self, state):
+        self.__init__(state['$payload'], state['dtype'], state['length'], state['nbytes'], state['directory'])
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __repr__(self) -> str:
+        preview = ', '.join(repr(v) for v in self.view()[:3]) if self.length else ''
+        more = ', ...' if self.length > 3 else ''
+        return f"<{self.dtype}[{self.length}] {preview}{more}>"
+
+    def path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"{self.payload_id}.{suffix}")
+
+    def _map(self, suffix: str, fmt: str) -> memoryview:
+        with open(self.path(suffix), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(array(fmt))
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        view = memoryview(mapped)
+        self._views.append(view)
+        if fmt == 'B':
+            return view
+        cast = view.cast(fmt)
+        self._views.append(cast)
+        return cast
+
+    def view(self) -> Sequence:
+        """Zero-copy access: float64 memoryview or TextColumn"""
+        with self._lock:
+            if self._column is None:
+                if self.dtype == 'float64':
+                    self._column = self._map('f64', 'd')
+                else:
+                    self._column = TextColumn(self._map('off', 'q'), self._map('txt', 'B'))
+            return self._column
+
+    def to_list(self) -> List:
+        if self.dtype == 'float64':
+            # NaN marks a missing value and is not valid JSON
+            return [None if v != v else v for v in self.view()]
+        return list(self.view())
+
+    def digest(self) -> str:
+        """Content hash of the column; stable across requests, unlike the payload id"""
+        if self._digest is None:
+            hasher = hashlib.sha256(self.dtype.encode('ascii'))
+            for suffix in (('f64',) if self.dtype == 'float64' else ('off', 'txt')):
+                with open(self.path(suffix), 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        hasher.update(block)
+            self._digest = hasher.hexdigest()
+        return self._digest
+
+    def describe(self) -> Dict:
+        return {
+            '$payload': self.payload_id,
+            'dtype': self.dtype,
+            'length': self.length,
+            'nbytes': self.nbytes,
+            'directory': self.directory
+        }
+
+    def acquire(self) -> 'PayloadHandle':
+        """Take a lease: the buffers stay mapped (even through close()) until it is released"""
+        with self._lock:
+            self._leases += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._leases -= 1
+            if self._leases or not self._closing:
+                return
+            self._closing = False
+        self._unmap()
+
+    def close(self):
+        """Unmap buffers held by this process, or once the last lease is released"""
+        with self._lock:
+            if self._leases:
+                self._closing = True
+                return
+        self._unmap()
+
+    def _unmap(self):
+        with self._lock:
+            self._column = None
+            views, self._views = self._views, []
+            maps, self._maps = self._maps, []
+        for view in reversed(views):
+            try:
+                view.release()
+            except BufferError:
+                pass
+        for mapped in maps:
+            try:
+                mapped.close()
+            except BufferError:
+                # Something outside any lease (a numpy array, a slice) still points into it;
+                # the mapping is freed with the last such reference
+                logger.debug(f"Payload {self.payload_id} is still referenced; unmapping when it is collected")
+
+
+class ColumnWriter:
+    """Appends chunks to a column file without holding the whole column in memory"""
+
+    def __init__(self, store: 'PayloadStore', dtype: str):
+        if dtype not in ('float64', 'utf8'):
+            raise ValueError(f"Unsupported payload dtype '{dtype}'")
+        self.store = store
+        self.dtype = dtype
+        self.payload_id = uuid.uuid4().hex
+        self.length = 0
+        self._offset = 0
+        directory = store.directory
+        if dtype == 'float64':
+            self._values = open(os.path.join(directory, f"{self.payload_id}.f64"), 'wb')
+        else:
+            self._values = open(os.path.join(directory, f"{self.payload_id}.txt"), 'wb')
+            self._offsets = open(os.path.join(directory, f"{self.payload_id}.off"), 'wb')
+            array('q', [0]).tofile(self._offsets)
+
+    def append(self, values: Sequence):
+        if self.dtype == 'float64':
+            array('d', (float('nan') if v is None else v for v in values)).tofile(self._values)
+        else:
+            offsets = array('q')
+            parts = []
+            for value in values:
+                encoded = b'' if value is None else str(value).encode('utf-8')
+                parts.append(encoded)
+                self._offset += len(encoded)
+                offsets.append(self._offset)
+            self._values.write(b''.join(parts))
+            offsets.tofile(self._offsets)
+        self.length += len(values)
+
+    def finish(self) -> PayloadHandle:
+        self._values.close()
+        nbytes = self.length * 8
+        if self.dtype == 'utf8':
+            self._offsets.close()
+            nbytes = self._offset + (self.length + 1) * 8
+        handle = PayloadHandle(self.payload_id, self.dtype, self.length, nbytes, self.store.directory)
+        self.store._track(handle)
+        return handle
+
+    def abort(self):
+        self._values.close()
+        if self.dtype == 'utf8':
+            self._offsets.close()
+        self.store.delete(self.payload_id)
+
+
+class PayloadStore:
+    """Owns the payload directory: creates, tracks and deletes column buffers"""
+
+    def __init__(self, directory: Optional[str] = None, min_items: int = PAYLOAD_MIN_ITEMS):
+        self.directory = directory or _default_directory()
+        self.min_items = min_items
+        os.makedirs(self.directory, exist_ok=True)
+        self._live: Dict[str, PayloadHandle] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.bytes_created = 0
+
+    def _track(self, handle: PayloadHandle):
+        with self._lock:
+            self._live[handle.payload_id] = handle
+            self.created += 1
+            self.bytes_created += handle.nbytes
+
+    def writer(self, dtype: str) -> ColumnWriter:
+        return ColumnWriter(self, dtype)
+
+    def put(self, values: Sequence) -> Optional[PayloadHandle]:
+        """Store a list of floats as a float64 column or of strings as UTF-8; None for anything else
+
+        Ints and bools stay in the list: a float64 column would hand them back
+        as floats, and ids or counts above 2**53 would lose precision.
+        """
+        if all(v is None or isinstance(v, float) for v in values):
+            dtype = 'float64'  # missing values become NaN
+        elif all(v is None or isinstance(v, str) for v in values):
+            dtype = 'utf8'
+        else:
+            return None
+        writer = self.writer(dtype)
+        writer.append(values)
+        return writer.finish()
+
+    def wrap(self, obj: Any, created: List[PayloadHandle]) -> Any:
+        """Replace large lists inside task.data with handles (collected in `created`)"""
+        if isinstance(obj, dict):
+            return {k: self.wrap(v, created) for k, v in obj.items()}
+        if isinstance(obj, list) and len(obj) >= self.min_items and not isinstance(obj[0], (dict, list)):
+            handle = self.put(obj)
+            if handle is not None:
+                created.append(handle)
+                return handle
+        return obj
+
+    def get(self, payload_id: str) -> Optional[PayloadHandle]:
+        return self._live.get(payload_id)
+
+    def delete(self, payload_id: str):
+        """Remove the files now; mapped buffers go when their last lease is released"""
+        with self._lock:
+            handle = self._live.pop(payload_id, None)
+        for suffix in ('f64', 'off', 'txt'):
+            try:
+                os.unlink(os.path.join(self.directory, f"{payload_id}.{suffix}"))
+            except FileNotFoundError:
+                pass
+        if handle is not None:
+            handle.close()
+
+    def release(self, handles: List[PayloadHandle]):
+        for handle in handles:
+            self.delete(handle.payload_id)
+
+    def stats(self) -> Dict:
+        return {
+            'directory': self.directory,
+            'live_payloads': len(self._live),
+            'live_bytes': sum(h.nbytes for h in list(self._live.values())),
+            'created': self.created,
+            'bytes_created': self.bytes_created
+        }
+
+
+payload_store = PayloadStore()
+
+
+def _handles(obj: Any, depth: int = 4) -> Iterator[PayloadHandle]:
+    """Handles inside task arguments: dict values, list items and object fields"""
+    if isinstance(obj, PayloadHandle):
+        yield obj
+        return
+    if depth == 0 or obj is None or isinstance(obj, (str, bytes, int, float, type)):
+        return
+    if isinstance(obj, dict):
+        values = obj.values()
+    elif isinstance(obj, (list, tuple)):
+        values = obj
+    elif hasattr(obj, '__dict__'):
+        values = vars(obj).values()
+    else:
+        return
+    for value in values:
+        if not isinstance(value, (str, int, float)):
+            yield from _handles(value, depth - 1)
+
+
+@contextmanager
+def leased(obj: Any) -> Iterator[List[PayloadHandle]]:
+    """Lease every handle inside `obj` for the block, so deleting them meanwhile cannot unmap a view in use"""
+    handles = [handle.acquire() for handle in _handles(obj)]
+    try:
+        yield handles
+    finally:
+        for handle in handles:
+            handle.release()
+
+
+def describe_payloads(obj: Any) -> Any:
+    """Copy-free summary for logs and storage: handles become descriptors"""
+    if isinstance(obj, PayloadHandle):
+        descriptor = obj.describe()
+        descriptor.pop('directory')
+        return descriptor
+    if isinstance(obj, dict):
+        return {k: describe_payloads(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [describe_payloads(v) for v in obj]
+    return obj
+
+
+def to_wire(obj: Any) -> Any:
+    """Network-edge serializer: the only place handles turn back into lists"""
+    if isinstance(obj, PayloadHandle):
+        return obj.to_list()
+    if isinstance(obj, dict):
+        return {k: to_wire(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [to_wire(v) for v in obj]
+    return obj
+
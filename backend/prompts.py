@@ -0,0 +1,213 @@
+"""
+PurpleBrain-AI Prompt Budgeting
+Local token counting, per-stage prompt budgets, relevance-ranked packing and context compaction
+"""
+
+import os
+import re
+import math
+import logging
+from typing import Any, Dict, List, Sequence, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # exact counts are optional; the estimate is within ~10% for English text
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Prompt tokens (system + user) each stage may use; completions get the model's remaining context
+STAGE_BUDGETS = {
+    'research_synthesis': 3000,
+    'code_switching': 2500,
+    'insights': 900,
+    'visualization_plan': 900,
+}
+DEFAULT_STAGE_BUDGET = int(os.environ.get('PURPLEBRAIN_PROMPT_BUDGET', 3000))
+
+MODEL_CONTEXT = {
+    'gpt-4': 8192,
+    'gpt-4-32k': 32768,
+    'gpt-4-turbo': 128000,
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000,
+    'gpt-3.5-turbo': 16385,
+}
+DEFAULT_CONTEXT = 8192
+
+# Per-message framing overhead plus slack for estimate error
+SAFETY_TOKENS = 64
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+_SENTENCES = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+_TERMS = re.compile(r"[a-z0-9]{3,}")
+_encoders: Dict[str, Any] = {}
+
+
+def count_tokens(text: str, model: str = 'gpt-4') -> int:
+    """Token count for `text` (tiktoken when installed, otherwise a close local estimate)"""
+    if not text:
+        return 0
+    if tiktoken is not None:
+        encoder = _encoders.get(model)
+        if encoder is None:
+            try:
+                encoder = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoder = tiktoken.get_encoding('cl100k_base')
+            _encoders[model] = encoder
+        return len(encoder.encode(text))
+    # BPE splits long words into ~4-character pieces; punctuation is usually its own token
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECES.findall(text))
+
+
+def truncate_tokens(text: str, budget: int, model: str = 'gpt-4') -> str:
+    """Longest prefix of `text` (cut at a word boundary) within `budget` tokens"""
+    if budget <= 0:
+        return ''
+    if count_tokens(text, model) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle], model) <= budget - 1:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    if ' ' in cut:
+        cut = cut[:cut.rindex(' ')]
+    return cut.rstrip() + '…'
+
+
+def _terms(text: str) -> List[str]:
+    return _TERMS.findall(text.lower())
+
+
+def relevance(text: str, query_terms: set) -> float:
+    """Share of query terms present, with a mild length normalization"""
+    if not query_terms:
+        return 0.0
+    terms = _terms(text)
+    if not terms:
+        return 0.0
+    hits = len(query_terms.intersection(terms))
+    return hits / len(query_terms) + min(hits, 5) / (5 + math.log1p(len(terms)))
+
+
+def compact_text(text: str, query: str, budget: int, model: str = 'gpt-4') -> str:
+    """Extractive compaction: keep the most query-relevant sentences, in their original order"""
+    if count_tokens(text, model) <= budget:
+        return text
+    sentences = [s.strip() for s in _SENTENCES.split(text) if s.strip()]
+    if len(sentences) <= 1:
+        return truncate_tokens(text, budget, model)
+    query_terms = set(_terms(query))
+    # The opening sentence usually frames the rest, so it gets a small bonus
+    scored = sorted(
+        range(len(sentences)),
+        key=lambda i: relevance(sentences[i], query_terms) + (0.3 if i == 0 else 0.0) - i * 1e-6,
+        reverse=True
+    )
+    kept, used = set(), 0
+    for index in scored:
+        cost = count_tokens(sentences[index], model) + 1
+        if used + cost > budget:
+            continue
+        kept.add(index)
+        used += cost
+    if not kept:
+        return truncate_tokens(sentences[scored[0]], budget, model)
+    return ' '.join(sentences[i] for i in sorted(kept))
+
+
+def data_preview(data: Any, budget: int = 150, model: str = 'gpt-4', values_per_column: int = 5) -> str:
+    """Bounded preview of task data without stringifying whole columns"""
+    if not isinstance(data, dict):
+        return truncate_tokens(repr(data)[:budget * 8], budget, model)
+    parts = []
+    for key, value in data.items():
+        if isinstance(value, (list, tuple)):
+            head = ', '.join(repr(v) for v in value[:values_per_column])
+            more = f", ... ({len(value)} values)" if len(value) > values_per_column else ''
+            parts.append(f"{key}: [{head}{more}]")
+        elif isinstance(value, dict):
+            parts.append(f"{key}: {{{', '.join(map(str, list(value)[:values_per_column]))}}}")
+        else:
+            parts.append(f"{key}: {repr(value)[:120]}")  # PayloadHandle reprs are already short
+    return truncate_tokens('; '.join(parts), budget, model)
+
+
+class PromptBudget:
+    """Tracks what is left of a stage's prompt budget while a prompt is assembled"""
+
+    def __init__(self, stage: str, model: str = 'gpt-4', max_tokens: int = 1500, system: str = '', template: str = ''):
+        self.stage = stage
+        self.model = model
+        context = MODEL_CONTEXT.get(model, DEFAULT_CONTEXT)
+        self.limit = min(STAGE_BUDGETS.get(stage, DEFAULT_STAGE_BUDGET), context - max_tokens - SAFETY_TOKENS)
+        self.used = count_tokens(system, model) + count_tokens(template, model)
+        self.dropped = 0
+        self.compacted = 0
+
+    @classmethod
+    def for_route(cls, route, system: str = '', template: str = '') -> 'PromptBudget':
+        return cls(route.stage, route.model, route.max_tokens, system, template)
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.limit - self.used)
+
+    def take(self, text: str) -> str:
+        """Charge a fixed piece of the prompt"""
+        self.used += count_tokens(text, self.model)
+        return text
+
+    def fit_text(self, text: str, query: str = '', share: float = 1.0) -> str:
+        """`text` within `share` of the remaining budget, compacted if it does not fit"""
+        budget = int(self.remaining * share)
+        fitted = compact_text(text, query, budget, self.model)
+        if fitted is not text:
+            self.compacted += 1
+            logger.info(f"Compacted {self.stage} context to {budget} tokens")
+        return self.take(fitted)
+
+    def fit_ranked(self, items: Sequence[str], query: str, share: float = 1.0,
+                   separator: str = '\n') -> Tuple[List[int], List[str]]:
+        """Most relevant items first, packed into `share` of the remaining budget
+
+        Returns the indices of the kept items (in original order) and their
+        text; the last item that does not fit whole is truncated rather than
+        dropped when there is meaningful room left.
+        """
+        budget = int(self.remaining * share)
+        query_terms = set(_terms(query))
+        order = sorted(range(len(items)), key=lambda i: relevance(items[i], query_terms), reverse=True)
+        kept: Dict[int, str] = {}
+        used = 0
+        separator_cost = count_tokens(separator, self.model)
+        for index in order:
+            cost = count_tokens(items[index], self.model) + separator_cost
+            if used + cost <= budget:
+                kept[index] = items[index]
+                used += cost
+            elif budget - used > 40:
+                kept[index] = truncate_tokens(items[index], budget - used - separator_cost, self.model)
+                used = budget
+            else:
+                self.dropped += 1
+        indices = sorted(kept)
+        self.used += used
+        if self.dropped:
+            logger.info(f"{self.stage} prompt kept {len(indices)}/{len(items)} items within {budget} tokens")
+        return indices, [kept[i] for i in indices]
+
+    def report(self) -> Dict:
+        return {
+            'stage': self.stage,
+            'model': self.model,
+            'prompt_tokens': self.used,
+            'budget': self.limit,
+            'items_dropped': self.dropped,
+            'sections_compacted': self.compacted
+        }
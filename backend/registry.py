@@ -0,0 +1,499 @@
+"""
+PurpleBrain-AI Agent Registry
+Lazy agent discovery with per-agent concurrency, executor and queue isolation, queued fairly per tenant
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import importlib
+import contextvars
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from importlib.metadata import entry_points
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from backend import accounting, deadlines, tenants
+from backend.hedging import LatencyWindow
+from backend.loop_watchdog import loop_watchdog
+from backend.payloads import leased
+from backend.tracing import tracer
+from backend.tenants import DEFAULT_TENANT, TenantPolicy, tenant_metrics, tenant_policy
+
+logger = logging.getLogger(__name__)
+
+# Third-party packages expose agents as `name = "module:AgentClass"`
+ENTRY_POINT_GROUP = 'purplebrain.agents'
+
+# Operators override limits with JSON, e.g. {"visualization": {"executor": "process"}}
+LIMITS_ENV_VAR = 'PURPLEBRAIN_AGENT_LIMITS'
+
+EXECUTOR_KINDS = ('inline', 'thread', 'process')
+
+AgentTarget = Union[str, Callable[[], Any]]
+
+
+class AgentBusyError(RuntimeError):
+    """Raised when an agent's wait queue is full"""
+
+    def __init__(self, key: str, max_queue: int):
+        super().__init__(f"Agent {key} is at capacity ({max_queue} requests queued)")
+        self.key = key
+        self.max_queue = max_queue
+
+
+class AgentNotFound(LookupError):
+    """Raised for an agent key that was never registered"""
+
+    def __init__(self, key: str):
+        super().__init__(f"Agent {key} not found")
+        self.key = key
+
+
+def _resolve_target(target: AgentTarget) -> Callable[[], Any]:
+    """Turn a "module:attr" reference into the agent factory it names"""
+    if not isinstance(target, str):
+        return target
+    module_name, _, attr = target.partition(':')
+    factory = importlib.import_module(module_name)
+    for part in attr.split('.'):
+        factory = getattr(factory, part)
+    return factory
+
+
+def _run_coroutine(func: Callable, args: tuple, kwargs: Dict, loop_name: Optional[str] = None) -> Any:
+    """Run an agent coroutine to completion on a private event loop (lag-monitored when named)
+
+    Payload buffers in the arguments stay leased until the run ends, even if
+    the request that passed them has given up and deleted them.
+    """
+    with leased((args, kwargs)):
+        coroutine = accounting.metered(func(*args, **kwargs))
+        if loop_name:
+            return asyncio.run(loop_watchdog.monitored(coroutine, loop_name))
+        return asyncio.run(coroutine)
+
+
+async def _run_leased(coroutine: Any, args: tuple, kwargs: Dict) -> Any:
+    with leased((args, kwargs)):
+        return await coroutine
+
+
+# Agents instantiated inside process-pool workers, one per target
+_WORKER_AGENTS: Dict[Any, Any] = {}
+
+
+def _run_in_worker(target: AgentTarget, method: str, args: tuple, kwargs: Dict,
+                   deadline_s: Optional[float] = None) -> tuple:
+    """Process-pool entry point: build the agent once per worker and run it; returns (result, usage)"""
+    if target not in _WORKER_AGENTS:
+        _WORKER_AGENTS[target] = _resolve_target(target)()
+    # Only the deadline crosses the process boundary; cancellation stops at the await
+    with accounting.usage_scope() as usage:
+        result = deadlines.run_in_scope(
+            deadline_s, _run_coroutine, getattr(_WORKER_AGENTS[target], method), args, kwargs
+        )
+    return result, usage.to_dict()
+
+
+class _Waiter:
+    """One queued acquire: its tenant, fair-queuing tags and the future that grants the slot"""
+
+    __slots__ = ('tenant', 'start', 'finish', 'enqueued_at', 'future', 'granted')
+
+    def __init__(self, tenant: str, start: float, finish: float, future: asyncio.Future):
+        self.tenant = tenant
+        self.start = start
+        self.finish = finish
+        self.enqueued_at = time.monotonic()
+        self.future = future
+        self.granted = False
+
+
+class _Slots:
+    """Counting semaphore with bounded per-tenant wait queues, usable from any event loop
+
+    Flask handlers create a fresh loop per request, so asyncio.Semaphore
+    (which binds to one loop) cannot be shared between them. A freed slot
+    goes to the queued tenant with the smallest virtual finish time
+    (weighted fair queuing), so a tenant replaying a large batch gets its
+    weight's share while other tenants' requests keep moving.
+    """
+
+    def __init__(self, limit: int, max_queue: int, policy: TenantPolicy = tenant_policy):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.policy = policy
+        self.in_use = 0
+        self.queued = 0
+        self._queues: Dict[str, deque] = {}
+        self._running: Dict[str, int] = {}
+        self._finish: Dict[str, float] = {}
+        self._virtual = 0.0
+        self._lock = threading.Lock()
+
+    def oldest_wait(self) -> float:
+        """Seconds the longest-waiting queued request has waited (0 when nothing is queued)"""
+        with self._lock:
+            heads = [queue[0].enqueued_at for queue in self._queues.values() if queue]
+        return time.monotonic() - min(heads) if heads else 0.0
+
+    def tenants(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            names = set(self._running) | set(self._queues)
+            return {
+                name: {'in_flight': self._running.get(name, 0), 'queued': len(self._queues.get(name, ()))}
+                for name in sorted(names)
+            }
+
+    def _under_cap(self, tenant: str) -> bool:
+        cap = self.policy.max_concurrency(tenant)
+        return cap is None or self._running.get(tenant, 0) < cap
+
+    def _grant(self, tenant: str):
+        self.in_use += 1
+        self._running[tenant] = self._running.get(tenant, 0) + 1
+
+    async def acquire(self, key: str, tenant: str = DEFAULT_TENANT):
+        with self._lock:
+            # Free slots with requests still queued means those requests' tenants are at their cap
+            if self.in_use < self.limit and self._under_cap(tenant):
+                self._grant(tenant)
+                return
+            if self.queued >= self.max_queue and not self._push_out(tenant, key):
+                raise AgentBusyError(key, self.max_queue)
+            start = max(self._virtual, self._finish.get(tenant, 0.0))
+            waiter = _Waiter(tenant, start, start + 1 / self.policy.weight(tenant),
+                             asyncio.get_running_loop().create_future())
+            self._finish[tenant] = waiter.finish
+            self._queues.setdefault(tenant, deque()).append(waiter)
+            self.queued += 1
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if not waiter.granted:
+                    self._remove(waiter)
+                    self._prune()
+                    raise
+            # Already handed a slot: a cancelled waiter is released by _wake,
+            # one whose result was set before cancellation must give it back here
+            if not waiter.future.cancelled():
+                self.release(tenant)
+            raise
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.tenant)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            self.queued -= 1
+            if not queue:
+                del self._queues[waiter.tenant]
+
+    def _push_out(self, tenant: str, key: str) -> bool:
+        """Full queue: drop the newest request of the tenant most over its share to make room"""
+        def backlog(name: str) -> float:
+            return len(self._queues.get(name, ())) / self.policy.weight(name)
+
+        heaviest = max(self._queues, key=backlog, default=None)
+        if heaviest is None or heaviest == tenant or backlog(heaviest) <= backlog(tenant) + 1 / self.policy.weight(tenant):
+            return False
+        victim = self._queues[heaviest][-1]
+        self._remove(victim)
+        self._finish[heaviest] = victim.start
+        victim.future.get_loop().call_soon_threadsafe(self._evict, victim.future, AgentBusyError(key, self.max_queue))
+        return True
+
+    def release(self, tenant: str = DEFAULT_TENANT):
+        with self._lock:
+            self.in_use -= 1
+            self._running[tenant] -= 1
+            if not self._running[tenant]:
+                del self._running[tenant]
+            self._dispatch()
+
+    def _dispatch(self):
+        while self.in_use < self.limit:
+            chosen = None
+            for name, queue in self._queues.items():
+                if self._under_cap(name) and (chosen is None or queue[0].finish < chosen.finish):
+                    chosen = queue[0]
+            if chosen is None:
+                break
+            self._remove(chosen)
+            loop = chosen.future.get_loop()
+            if loop.is_closed():
+                continue
+            self._virtual = max(self._virtual, chosen.start)
+            chosen.granted = True
+            self._grant(chosen.tenant)
+            loop.call_soon_threadsafe(self._wake, chosen)
+        self._prune()
+
+    def _prune(self):
+        """Forget finish tags that can no longer delay anyone, so client-chosen tenant ids do not accumulate
+
+        With nothing queued every tenant starts afresh; otherwise a tag the
+        virtual clock has passed counts for nothing in the `max` of acquire.
+        """
+        if not self._queues:
+            self._finish.clear()
+            self._virtual = 0.0
+            return
+        for name in [name for name, finish in self._finish.items()
+                     if finish <= self._virtual and name not in self._queues]:
+            del self._finish[name]
+
+    def _wake(self, waiter: _Waiter):
+        if waiter.future.cancelled():
+            self.release(waiter.tenant)
+        else:
+            waiter.future.set_result(None)
+
+    @staticmethod
+    def _evict(future: asyncio.Future, error: AgentBusyError):
+        if not future.done():
+            future.set_exception(error)
+
+
+class AgentSpec:
+    """Registration record: how to build an agent and how much it may consume"""
+
+    def __init__(self, key: str, target: AgentTarget, max_concurrency: int = 8,
+                 executor: str = 'inline', max_queue: int = 64,
+                 workers: Optional[int] = None, source: str = 'builtin'):
+        if executor not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown executor '{executor}' for agent {key}, expected one of {EXECUTOR_KINDS}")
+        self.key = key
+        self.target = target
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.executor = executor
+        self.max_queue = max(0, int(max_queue))
+        self.workers = workers or self.max_concurrency
+        self.source = source
+
+    def to_dict(self) -> Dict:
+        return {
+            'executor': self.executor,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'workers': self.workers,
+            'source': self.source
+        }
+
+
+class AgentRuntime:
+    """Per-agent isolation: its own slots, queue and executor"""
+
+    def __init__(self, spec: AgentSpec):
+        self.spec = spec
+        self.slots = _Slots(spec.max_concurrency, spec.max_queue)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        # Time spent waiting for a slot, and running once it had one
+        self.queue_wait = LatencyWindow()
+        self.service_time = LatencyWindow()
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+
+    def executor(self) -> Optional[Executor]:
+        """Create the agent's dedicated pool on first use"""
+        if self.spec.executor == 'inline':
+            return None
+        with self._executor_lock:
+            if self._executor is None:
+                if self.spec.executor == 'thread':
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.spec.workers,
+                        thread_name_prefix=f"agent-{self.spec.key}"
+                    )
+                else:
+                    # spawn keeps Mongo clients and event loops out of the children
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.spec.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+            return self._executor
+
+    def stats(self) -> Dict:
+        return {
+            **self.spec.to_dict(),
+            'in_flight': self.slots.in_use,
+            'queued': self.slots.queued,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'p95_queue_wait_s': self.queue_wait.percentile(95),
+            'p50_service_s': self.service_time.percentile(50),
+            'tenants': self.slots.tenants()
+        }
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+class AgentRegistry:
+    """Discovers agents, builds them on first use and runs them in isolation"""
+
+    def __init__(self):
+        self._specs: Dict[str, AgentSpec] = {}
+        self._instances: Dict[str, Any] = {}
+        self._runtimes: Dict[str, AgentRuntime] = {}
+        self._lock = threading.Lock()
+
+    def register(self, key: str, target: AgentTarget, **limits) -> AgentSpec:
+        """Register an agent factory (class, callable or "module:attr")"""
+        spec = AgentSpec(key, target, **limits)
+        with self._lock:
+            self._specs[key] = spec
+            self._instances.pop(key, None)
+            old_runtime = self._runtimes.pop(key, None)
+        if old_runtime:
+            old_runtime.shutdown()
+        return spec
+
+    def discover(self, group: str = ENTRY_POINT_GROUP) -> List[str]:
+        """Register agents advertised by installed packages' entry points"""
+        discovered = []
+        for entry_point in entry_points(group=group):
+            if entry_point.name in self._specs:
+                logger.warning(f"Ignoring entry point {entry_point.value}: agent '{entry_point.name}' already registered")
+                continue
+            self.register(entry_point.name, entry_point.value, source=f"entry_point:{entry_point.value}")
+            discovered.append(entry_point.name)
+        if discovered:
+            logger.info(f"Discovered agents via entry points: {', '.join(discovered)}")
+        return discovered
+
+    def configure_from_env(self, env_var: str = LIMITS_ENV_VAR):
+        """Apply operator overrides for executor and limits"""
+        raw = os.environ.get(env_var)
+        if not raw:
+            return
+        try:
+            overrides = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid {env_var}: {e}")
+            return
+        for key, limits in overrides.items():
+            spec = self._specs.get(key)
+            if spec is None:
+                logger.warning(f"{env_var} references unknown agent '{key}'")
+                continue
+            merged = {**spec.to_dict(), **limits}
+            merged.pop('source', None)
+            self.register(key, spec.target, source=spec.source, **merged)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._specs
+
+    def keys(self) -> List[str]:
+        return list(self._specs)
+
+    def spec(self, key: str) -> AgentSpec:
+        spec = self._specs.get(key)
+        if spec is None:
+            raise AgentNotFound(key)
+        return spec
+
+    def is_loaded(self, key: str) -> bool:
+        return key in self._instances
+
+    def get(self, key: str) -> Any:
+        """Return the agent instance, constructing it on first access"""
+        instance = self._instances.get(key)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if key not in self._instances:
+                spec = self.spec(key)
+                self._instances[key] = _resolve_target(spec.target)()
+                logger.info(f"Loaded agent '{key}' ({spec.executor} executor)")
+            return self._instances[key]
+
+    def __getitem__(self, key: str) -> Any:
+        return self.get(key)
+
+    def items(self):
+        """(key, instance) pairs - loads every agent"""
+        return [(key, self.get(key)) for key in self.keys()]
+
+    def runtime(self, key: str) -> AgentRuntime:
+        runtime = self._runtimes.get(key)
+        if runtime is None:
+            with self._lock:
+                runtime = self._runtimes.setdefault(key, AgentRuntime(self.spec(key)))
+        return runtime
+
+    def stats(self, key: str) -> Dict:
+        return {'loaded': self.is_loaded(key), **self.runtime(key).stats()}
+
+    async def run(self, key: str, *args, method: str = 'process', **kwargs) -> Any:
+        """Run an agent method inside the agent's own concurrency budget, queued fairly per tenant
+
+        The run gets its own resource-usage scope, which also counts for the caller's.
+        """
+        tenant = tenants.current()
+        with tracer.span(f"agent.{key}.{method}", **{'agent.name': key, 'tenant': tenant}) as span, \
+                accounting.usage_scope():
+            return await self._run(span, key, tenant, method, args, kwargs)
+
+    async def _run(self, span, key: str, tenant: str, method: str, args: tuple, kwargs: Dict) -> Any:
+        runtime = self.runtime(key)
+        queued_at = time.perf_counter()
+        try:
+            # Queue time counts against the request deadline too
+            await deadlines.guard(runtime.slots.acquire(key, tenant), f"{key} queue")
+        except AgentBusyError:
+            runtime.rejected += 1
+            tenant_metrics.record_rejected(tenant, key)
+            raise
+        started = time.perf_counter()
+        runtime.queue_wait.add(started - queued_at)
+        accounting.add(queue_wait_s=started - queued_at)
+        span.set_attributes({'agent.executor': runtime.spec.executor,
+                             'agent.queue_wait_ms': round((started - queued_at) * 1000, 3)})
+        success = False
+
+        try:
+            executor = runtime.executor()
+            if executor is None:
+                call = accounting.metered(_run_leased(getattr(self.get(key), method)(*args, **kwargs), args, kwargs))
+            elif runtime.spec.executor == 'thread':
+                # The worker thread sees the same request context, so cancel() reaches its loop
+                bound = getattr(self.get(key), method)
+                call = asyncio.get_running_loop().run_in_executor(
+                    executor, contextvars.copy_context().run, _run_coroutine, bound, args, kwargs, f"agent-{key}"
+                )
+            else:
+                call = asyncio.get_running_loop().run_in_executor(
+                    executor, _run_in_worker, runtime.spec.target, method, args, kwargs, deadlines.remaining()
+                )
+            result = await deadlines.guard(call, key)
+            if runtime.spec.executor == 'process':
+                result, usage = result
+                accounting.merge(usage)
+            runtime.service_time.add(time.perf_counter() - started)
+            runtime.completed += 1
+            success = True
+            return result
+        except BaseException:
+            runtime.failed += 1
+            raise
+        finally:
+            runtime.slots.release(tenant)
+            finished = time.perf_counter()
+            tenant_metrics.record(tenant, key, started - queued_at, finished - queued_at, success)
+
+    def shutdown(self):
+        for runtime in list(self._runtimes.values()):
+            runtime.shutdown()
@@ -0,0 +1,305 @@
+"""
+PurpleBrain-AI Upstream Resilience
+Per-upstream circuit breakers and stale-while-revalidate serving of last good results
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from backend import accounting, deadlines
+from backend.memo import mark_degraded
+
+logger = logging.getLogger(__name__)
+
+# A breaker opens when at least this share of the recent calls failed or were slow
+BREAKER_FAILURE_RATE = float(os.environ.get('PURPLEBRAIN_BREAKER_FAILURE_RATE', 0.5))
+BREAKER_SLOW_CALL_S = float(os.environ.get('PURPLEBRAIN_BREAKER_SLOW_CALL_S', 20))
+BREAKER_MIN_CALLS = int(os.environ.get('PURPLEBRAIN_BREAKER_MIN_CALLS', 10))
+BREAKER_WINDOW = 50
+# How long an open breaker fails fast before letting a probe through
+BREAKER_OPEN_S = float(os.environ.get('PURPLEBRAIN_BREAKER_OPEN_S', 30))
+
+# Last good results older than this are not served, even during an incident
+STALE_MAX_AGE_S = float(os.environ.get('PURPLEBRAIN_STALE_MAX_AGE_S', 86400))
+STALE_ENTRIES = int(os.environ.get('PURPLEBRAIN_STALE_ENTRIES', 2048))
+# A key is refreshed in the background at most this often while it is served stale
+REFRESH_INTERVAL_S = 5.0
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream is failing; the call was not attempted"""
+
+
+class CircuitBreaker:
+    """Count-based sliding window of outcomes with open / half-open / closed states"""
+
+    def __init__(self, name: str, failure_rate: float = BREAKER_FAILURE_RATE,
+                 slow_call_s: float = BREAKER_SLOW_CALL_S, min_calls: int = BREAKER_MIN_CALLS,
+                 open_s: float = BREAKER_OPEN_S, window: int = BREAKER_WINDOW):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_s = slow_call_s
+        self.min_calls = min_calls
+        self.open_s = open_s
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: deque = deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0, 'opened': 0}
+
+    def is_open(self) -> bool:
+        """True while calls are being rejected (a due probe makes this False)"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at < self.open_s
+            return self.state == HALF_OPEN and self._probing
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_s:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                # Exactly one probe at a time tests whether the upstream has recovered
+                self._probing = True
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record(self, success: bool, latency: float):
+        slow = latency >= self.slow_call_s
+        with self._lock:
+            self._stats['calls'] += 1
+            self._stats['failures'] += not success
+            self._stats['slow_calls'] += slow
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if success and not slow:
+                    logger.info(f"Circuit {self.name} closed: probe succeeded")
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success and not slow)
+            if len(self._outcomes) >= self.min_calls:
+                bad = self._outcomes.count(False) / len(self._outcomes)
+                if bad >= self.failure_rate:
+                    self._open()
+
+    def release(self):
+        """An abandoned call says nothing about the upstream; free the probe slot it held"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def _open(self):
+        if self.state != OPEN:
+            self._stats['opened'] += 1
+            logger.warning(f"Circuit {self.name} open for {self.open_s:.0f}s")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    async def call(self, func: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """Await `func(*args, **kwargs)` unless the circuit is open, recording the outcome"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open; failing fast")
+        started = time.perf_counter()
+        try:
+            result = await func(*args, **kwargs)
+        except deadlines.ABANDONED:
+            self.release()
+            raise
+        except Exception:
+            self.record(False, time.perf_counter() - started)
+            raise
+        self.record(True, time.perf_counter() - started)
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            recent = list(self._outcomes)
+            stats['state'] = self.state
+        stats['recent_failure_rate'] = round(recent.count(False) / len(recent), 4) if recent else 0.0
+        return stats
+
+
+class BreakerRegistry:
+    """One breaker per upstream, created on first use"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name)
+            return breaker
+
+    def stats(self) -> Dict:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.stats() for name, breaker in breakers.items()}
+
+
+breakers = BreakerRegistry()
+
+
+@dataclass
+class Served:
+    """A result plus whether it is a stale last-good copy"""
+    value: Any
+    stale: bool = False
+    age_s: Optional[float] = None
+
+    def freshness(self) -> Dict:
+        return {'stale': self.stale, 'age_s': round(self.age_s, 1) if self.age_s is not None else None}
+
+
+class _Refresher:
+    """Background event loop for revalidation; request loops (Flask's in particular) close too early
+
+    Refreshes run in an empty context: the request that triggered one has
+    its own deadline, cancellation, tenant and usage scope, and has usually
+    answered before the refresh finishes.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: set = set()
+        self._lock = threading.Lock()
+
+    def submit(self, coroutine: Awaitable):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='purplebrain-refresh', daemon=True).start()
+        self._loop.call_soon_threadsafe(self._start, coroutine, context=contextvars.Context())
+
+    def _start(self, coroutine: Awaitable):
+        # Created inside the empty context, so the task copies that one rather than the request's
+        task = self._loop.create_task(coroutine)
+        # The loop only holds weak references to its tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+class LastGoodCache:
+    """Stale-while-revalidate: the last successful result per key, served while the upstream is down"""
+
+    def __init__(self, max_entries: int = STALE_ENTRIES, max_age: float = STALE_MAX_AGE_S):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._refreshing: Dict[str, float] = {}
+        self._refresher = _Refresher()
+        self._lock = threading.Lock()
+        self._stats = {'fresh': 0, 'stale_served': 0, 'refreshes': 0, 'refresh_failures': 0, 'unavailable': 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.max_age:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def serve(self, key: str, compute: Callable[[], Awaitable[Any]], upstream: str) -> Served:
+        """Fresh result when the upstream answers; otherwise the last good one, flagged stale
+
+        While `upstream`'s circuit is open the stale copy is returned without
+        waiting and `compute` is retried in the background; once a probe
+        succeeds the copy is replaced. Raises when there is nothing to serve.
+        """
+        if breakers.get(upstream).is_open():
+            served = self._stale(key, compute)
+            if served is not None:
+                return served
+        try:
+            value = await compute()
+        except deadlines.ABANDONED:
+            raise
+        except Exception as e:
+            served = self._stale(key, compute)
+            if served is None:
+                self._count('unavailable')
+                raise
+            logger.warning(f"Serving stale result for {key!r} ({e})")
+            return served
+        self.put(key, value)
+        self._count('fresh')
+        return Served(value)
+
+    def _stale(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Optional[Served]:
+        entry = self.get(key)
+        if entry is None:
+            return None
+        self._count('stale_served')
+        accounting.count_cache_hit('last_good')
+        # A stale answer must not be memoized as if it were current
+        mark_degraded()
+        self._revalidate(key, compute)
+        return Served(entry[1], stale=True, age_s=time.time() - entry[0])
+
+    def _revalidate(self, key: str, compute: Callable[[], Awaitable[Any]]):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._refreshing.get(key, 0.0) < REFRESH_INTERVAL_S:
+                return
+            self._refreshing[key] = now
+            if len(self._refreshing) > self.max_entries:
+                self._refreshing.pop(next(iter(self._refreshing)))
+        self._refresher.submit(self._refresh(key, compute))
+
+    async def _refresh(self, key: str, compute: Callable[[], Awaitable[Any]]):
+        try:
+            self.put(key, await compute())
+            self._count('refreshes')
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            self._count('refresh_failures')
+            logger.debug(f"Background refresh of {key!r} failed: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+last_good = LastGoodCache()
+
+
+def resilience_stats() -> Dict:
+    return {'breakers': breakers.stats(), 'stale_while_revalidate': last_good.stats()}
@@ -0,0 +1,207 @@
+"""
+PurpleBrain-AI Result Blobs
+Content-addressed, compressed storage for the large parts of agent results
+"""
+
+import os
+import gzip
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Set
+
+from pymongo import ASCENDING, UpdateOne
+
+from backend import accounting
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+BLOB_REF = '__blob__'
+
+# Sub-documents at least this large (as canonical JSON) are stored once and referenced
+BLOB_MIN_BYTES = int(os.environ.get('PURPLEBRAIN_RESULT_BLOB_MIN_BYTES', 1024))
+
+# Digests this process has written recently; a repeat skips the database entirely
+KNOWN_DIGESTS = int(os.environ.get('PURPLEBRAIN_RESULT_BLOB_KNOWN', 10000))
+
+# Decoded blobs kept in memory for reads
+READ_CACHE_ENTRIES = int(os.environ.get('PURPLEBRAIN_RESULT_BLOB_READ_CACHE', 512))
+
+# A blob's last_used is refreshed at most this often, so TTL only drops unreferenced blobs
+TOUCH_INTERVAL = timedelta(hours=6)
+
+
+def _canonical(value: Any) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def _compress(raw: bytes):
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=6).compress(raw)
+    return 'gzip', gzip.compress(raw, compresslevel=6)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and BLOB_REF in value
+
+
+class ResultBlobStore:
+    """Splits large sub-documents out of results into deduplicated blobs"""
+
+    def __init__(self, collection, min_bytes: int = BLOB_MIN_BYTES, ttl_days: float = 0):
+        self.collection = collection
+        self.min_bytes = min_bytes
+        self.ttl_days = ttl_days
+        self._known: 'OrderedDict[str, datetime]' = OrderedDict()
+        self._decoded: 'OrderedDict[str, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'bytes_in': 0, 'bytes_written': 0, 'blobs_written': 0, 'blobs_deduplicated': 0}
+
+    def ensure_indexes(self):
+        # Blobs outlive the results that reference them by one retention period
+        if self.ttl_days:
+            self.collection.create_index([('last_used', ASCENDING)], name='last_used_ttl',
+                                         expireAfterSeconds=int(self.ttl_days * 2 * 86400))
+
+    # Writes -----------------------------------------------------------------
+
+    def compact(self, value: Any) -> Any:
+        """Replace large sub-documents with references and write any new blobs"""
+        pending: Dict[str, bytes] = {}
+        compacted = self._compact(value, pending)
+        size = len(_canonical(value))
+        with self._lock:
+            self._stats['bytes_in'] += size
+        self._write(pending)
+        return compacted
+
+    def _compact(self, value: Any, pending: Dict[str, bytes]) -> Any:
+        # Bottom-up: static blocks dedupe on their own even when a sibling changes every run
+        if isinstance(value, dict):
+            value = {k: self._compact(v, pending) for k, v in value.items()}
+        elif isinstance(value, list):
+            value = [self._compact(v, pending) for v in value]
+        elif not isinstance(value, str):
+            return value
+        raw = _canonical(value)
+        if len(raw) < self.min_bytes:
+            return value
+        digest = hashlib.sha256(raw).hexdigest()
+        pending[digest] = raw
+        return {BLOB_REF: digest}
+
+    def _write(self, pending: Dict[str, bytes]):
+        now = datetime.now()
+        with self._lock:
+            fresh = {}
+            for digest, raw in pending.items():
+                seen = self._known.get(digest)
+                if seen is not None and now - seen < TOUCH_INTERVAL:
+                    self._known.move_to_end(digest)
+                    self._stats['blobs_deduplicated'] += 1
+                else:
+                    fresh[digest] = raw
+        if not fresh:
+            return
+        operations, compressed = [], {}
+        for digest, raw in fresh.items():
+            codec, data = _compress(raw)
+            compressed[digest] = len(data)
+            operations.append(UpdateOne(
+                {'_id': digest},
+                {'$setOnInsert': {'codec': codec, 'data': data, 'size': len(raw), 'created_at': now},
+                 '$set': {'last_used': now}},
+                upsert=True
+            ))
+        result = self.collection.bulk_write(operations, ordered=False)
+        inserted = set(result.upserted_ids.values())
+        accounting.add(db_write_bytes=sum(compressed[digest] for digest in inserted))
+        with self._lock:
+            for digest in fresh:
+                self._known[digest] = now
+                self._known.move_to_end(digest)
+                if digest in inserted:
+                    self._stats['blobs_written'] += 1
+                    self._stats['bytes_written'] += compressed[digest]
+                else:
+                    self._stats['blobs_deduplicated'] += 1
+            while len(self._known) > KNOWN_DIGESTS:
+                self._known.popitem(last=False)
+
+    # Reads ------------------------------------------------------------------
+
+    def expand(self, value: Any) -> Any:
+        """Reassemble a compacted value; blobs are fetched in one round trip per nesting level"""
+        blobs: Dict[str, Any] = {}
+        missing = self._refs(value)
+        while missing:
+            loaded = self._load(missing)
+            blobs.update(loaded)
+            missing = set()
+            for blob in loaded.values():
+                missing |= {d for d in self._refs(blob) if d not in blobs}
+        return self._resolve(value, blobs)
+
+    def _refs(self, value: Any) -> Set[str]:
+        if is_ref(value):
+            return {value[BLOB_REF]}
+        if isinstance(value, dict):
+            return set().union(*(self._refs(v) for v in value.values())) if value else set()
+        if isinstance(value, list):
+            return set().union(*(self._refs(v) for v in value)) if value else set()
+        return set()
+
+    def _resolve(self, value: Any, blobs: Dict[str, Any]) -> Any:
+        if is_ref(value):
+            digest = value[BLOB_REF]
+            if digest not in blobs:
+                logger.warning(f"Result blob {digest} is missing")
+                return None
+            return self._resolve(blobs[digest], blobs)
+        if isinstance(value, dict):
+            return {k: self._resolve(v, blobs) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._resolve(v, blobs) for v in value]
+        return value
+
+    def _load(self, digests: Set[str]) -> Dict[str, Any]:
+        loaded = {}
+        with self._lock:
+            for digest in digests:
+                if digest in self._decoded:
+                    self._decoded.move_to_end(digest)
+                    loaded[digest] = self._decoded[digest]
+        remaining = [d for d in digests if d not in loaded]
+        if remaining:
+            for document in self.collection.find({'_id': {'$in': remaining}}):
+                loaded[document['_id']] = json.loads(_decompress(document['codec'], document['data']))
+            with self._lock:
+                for digest in remaining:
+                    if digest in loaded:
+                        self._decoded[digest] = loaded[digest]
+                while len(self._decoded) > READ_CACHE_ENTRIES:
+                    self._decoded.popitem(last=False)
+        return loaded
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['codec'] = 'zstd' if zstandard is not None else 'gzip'
+        stats['write_ratio'] = round(stats['bytes_written'] / stats['bytes_in'], 4) if stats['bytes_in'] else None
+        return stats
@@ -0,0 +1,402 @@
+"""
+PurpleBrain-AI Semantic Cache
+Near-duplicate prompts answered from cache via hashed n-gram embeddings and an in-process HNSW index
+"""
+
+import os
+import re
+import json
+import math
+import time
+import uuid
+import zlib
+import heapq
+import atexit
+import random
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.environ.get('PURPLEBRAIN_SEMANTIC_CACHE', '1') not in ('0', 'false', 'False')
+
+# Cosine similarity a cached prompt needs to be served for a new one
+SIMILARITY_THRESHOLD = float(os.environ.get('PURPLEBRAIN_SEMANTIC_CACHE_THRESHOLD', 0.82))
+
+MAX_ENTRIES = int(os.environ.get('PURPLEBRAIN_SEMANTIC_CACHE_MAX_ENTRIES', 5000))
+TTL_SECONDS = int(os.environ.get('PURPLEBRAIN_SEMANTIC_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+
+# JSON-lines file the cache is saved to and restored from; empty keeps it in memory only
+CACHE_PATH = os.environ.get('PURPLEBRAIN_SEMANTIC_CACHE_PATH', '')
+
+# Inserts between automatic saves
+SAVE_EVERY = 25
+
+EMBEDDING_DIM = 1024
+
+_WORD = re.compile(r"[a-z0-9]+")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+# Question scaffolding that changes between phrasings but not the meaning; interrogatives
+# and modals stay ("why does X fail" and "how does X fail" are different questions)
+_FILLER = {
+    'a', 'an', 'the', 'of', 'in', 'on', 'for', 'to', 'and', 'or', 'by', 'with', 'about',
+    'is', 'are', 'was', 'were', 'please', 'tell', 'me', 'show', 'give', 'explain', 's'
+}
+_INTERROGATIVES = frozenset({'what', 'which', 'how', 'why', 'who', 'whom', 'whose', 'when', 'where'})
+
+# Bumped whenever normalization changes; entries saved under another version are not loaded
+NORMALIZATION_VERSION = 2
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case, punctuation and filler-word differences do not make a new question"""
+    return ' '.join(w for w in _WORD.findall(prompt.lower()) if w not in _FILLER)
+
+
+def _asks(normalized: str) -> List[str]:
+    return [w for w in normalized.split() if w in _INTERROGATIVES]
+
+
+def _stem(word: str) -> str:
+    for suffix in ('ing', 'ed', 'es', 's'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def _terms(normalized: str) -> frozenset:
+    """Content words up to inflection: "fails under load" and "failing under load" share them"""
+    return frozenset(_stem(w) for w in normalized.split())
+
+
+class HashedNgramVectorizer:
+    """Stateless text embedding: word uni/bigrams plus in-word character trigrams, hashed
+
+    crc32 keeps the hashing stable across processes and restarts, so a
+    persisted cache can be re-embedded on load instead of storing vectors.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def _features(self, text: str):
+        words = text.split()
+        for word in words:
+            yield word, 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield f"c:{padded[i:i + 3]}", 0.3
+        for first, second in zip(words, words[1:]):
+            yield f"b:{first} {second}", 0.5
+
+    def embed(self, normalized: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(normalized):
+            h = zlib.crc32(feature.encode('utf-8'))
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+
+class HNSWIndex:
+    """Hierarchical Navigable Small World graph over unit vectors (cosine similarity)
+
+    Removal only tombstones a node - it still routes searches - and the
+    graph is rebuilt once tombstones outnumber live nodes.
+    """
+
+    def __init__(self, dim: int, m: int = 16, ef_construction: int = 100, ef_search: int = 64, seed: int = 42):
+        self.dim = dim
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._level_mult = 1 / math.log(m)
+        self._rng = random.Random(seed)
+        self._vectors = np.zeros((64, dim), dtype=np.float32)
+        self._keys: List[Optional[str]] = []
+        self._slots: Dict[str, int] = {}
+        self._layers: List[Dict[int, List[int]]] = []
+        self._entry: Optional[int] = None
+        self._deleted = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _search_layer(self, query: np.ndarray, entry_points: List[int], ef: int, layer: int) -> List[Tuple[float, int]]:
+        graph = self._layers[layer]
+        visited = set(entry_points)
+        scores = self._vectors[entry_points] @ query
+        candidates = [(-float(s), p) for s, p in zip(scores, entry_points)]
+        results = [(float(s), p) for s, p in zip(scores, entry_points)]
+        heapq.heapify(candidates)
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            negative, point = heapq.heappop(candidates)
+            if len(results) >= ef and -negative < results[0][0]:
+                break
+            neighbours = [n for n in graph.get(point, ()) if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            for score, neighbour in zip((self._vectors[neighbours] @ query).tolist(), neighbours):
+                if len(results) < ef or score > results[0][0]:
+                    heapq.heappush(candidates, (-score, neighbour))
+                    heapq.heappush(results, (score, neighbour))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return sorted(results, reverse=True)
+
+    def _link(self, layer: int, point: int, neighbour: int):
+        links = self._layers[layer][neighbour]
+        links.append(point)
+        limit = self.m0 if layer == 0 else self.m
+        if len(links) > limit:
+            scores = self._vectors[links] @ self._vectors[neighbour]
+            keep = np.argsort(-scores)[:limit]
+            self._layers[layer][neighbour] = [links[i] for i in keep]
+
+    def add(self, key: str, vector: np.ndarray):
+        if key in self._slots:
+            self.remove(key)
+        slot = len(self._keys)
+        if slot >= len(self._vectors):
+            self._vectors = np.vstack([self._vectors, np.zeros_like(self._vectors)])
+        self._vectors[slot] = vector
+        self._keys.append(key)
+        self._slots[key] = slot
+
+        level = int(-math.log(1.0 - self._rng.random()) * self._level_mult)
+        while len(self._layers) <= level:
+            self._layers.append({})
+        for layer in range(level + 1):
+            self._layers[layer][slot] = []
+
+        if self._entry is None:
+            self._entry = slot
+            return
+
+        top = len(self._layers) - 1
+        entry_level = max(layer for layer in range(top + 1) if self._entry in self._layers[layer])
+        entry_points = [self._entry]
+        for layer in range(entry_level, level, -1):
+            entry_points = [self._search_layer(vector, entry_points, 1, layer)[0][1]]
+        for layer in range(min(level, entry_level), -1, -1):
+            found = self._search_layer(vector, entry_points, self.ef_construction, layer)
+            neighbours = [p for _, p in found if p != slot][:self.m]
+            self._layers[layer][slot] = neighbours
+            for neighbour in neighbours:
+                self._link(layer, slot, neighbour)
+            entry_points = [p for _, p in found]
+        if level > entry_level:
+            self._entry = slot
+
+    def remove(self, key: str):
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        self._keys[slot] = None
+        self._deleted += 1
+        if self._deleted > max(64, len(self._slots)):
+            self._rebuild()
+
+    def _rebuild(self):
+        live = [(key, self._vectors[slot].copy()) for key, slot in self._slots.items()]
+        self.__init__(self.dim, self.m, self.ef_construction, self.ef_search)
+        for key, vector in live:
+            self.add(key, vector)
+
+    def search(self, query: np.ndarray, k: int = 5) -> List[Tuple[str, float]]:
+        if self._entry is None or not self._slots:
+            return []
+        top = max(layer for layer in range(len(self._layers)) if self._entry in self._layers[layer])
+        entry_points = [self._entry]
+        for layer in range(top, 0, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+        found = self._search_layer(query, entry_points, max(self.ef_search, k), 0)
+        return [(self._keys[p], score) for score, p in found if self._keys[p] is not None][:k]
+
+
+class SemanticCache:
+    """Completions keyed by prompt meaning, scoped per namespace (model + system prompt)"""
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, max_entries: int = MAX_ENTRIES,
+                 ttl_seconds: int = TTL_SECONDS, path: str = CACHE_PATH, dim: int = EMBEDDING_DIM):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.vectorizer = HashedNgramVectorizer(dim)
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()  # least recently used first
+        self._exact: Dict[Tuple[str, str], str] = {}
+        self._indexes: Dict[str, HNSWIndex] = {}
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.metrics = {
+            'lookups': 0, 'hits': 0, 'exact_hits': 0, 'misses': 0, 'inserts': 0,
+            'evictions': 0, 'expirations': 0, 'hit_similarity_total': 0.0, 'seconds_saved': 0.0
+        }
+        if path:
+            self.load()
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        self._exact.pop((entry['namespace'], entry['prompt']), None)
+        self._indexes[entry['namespace']].remove(key)
+
+    def _hit(self, key: str, similarity: float) -> str:
+        entry = self._entries[key]
+        entry['hits'] += 1
+        entry['last_used'] = time.time()
+        self._entries.move_to_end(key)
+        self.metrics['hits'] += 1
+        self.metrics['hit_similarity_total'] += similarity
+        self.metrics['seconds_saved'] += entry['latency']
+        return entry['response']
+
+    def lookup(self, namespace: str, prompt: str) -> Optional[str]:
+        """Cached completion for this prompt or a close paraphrase of it"""
+        normalized = normalize_prompt(prompt)
+        numbers = _NUMBER.findall(normalized)
+        asks = _asks(normalized)
+        terms = _terms(normalized)
+        now = time.time()
+        with self._lock:
+            self.metrics['lookups'] += 1
+            key = self._exact.get((namespace, normalized))
+            if key is not None and now - self._entries[key]['created_at'] <= self.ttl_seconds:
+                self.metrics['exact_hits'] += 1
+                return self._hit(key, 1.0)
+
+            index = self._indexes.get(namespace)
+            if index is not None:
+                for key, similarity in index.search(self.vectorizer.embed(normalized)):
+                    if similarity < self.threshold:
+                        break
+                    entry = self._entries[key]
+                    if now - entry['created_at'] > self.ttl_seconds:
+                        self._drop(key)
+                        self.metrics['expirations'] += 1
+                        continue
+                    # "revenue in 2023" and "revenue in 2024" embed alike but are different questions
+                    if entry['numbers'] != numbers:
+                        continue
+                    # Neither are "why does X fail" and "how does X fail"
+                    if entry['asks'] != asks:
+                        continue
+                    # Nor "trends in Europe" and "trends in Asia": n-grams cannot tell swapped entities apart
+                    if entry['terms'] != terms:
+                        continue
+                    return self._hit(key, similarity)
+            self.metrics['misses'] += 1
+            return None
+
+    def store(self, namespace: str, prompt: str, response: str, latency: float = 0.0):
+        normalized = normalize_prompt(prompt)
+        with self._lock:
+            self._insert(namespace, normalized, response, latency, time.time())
+            self._unsaved += 1
+            should_save = self.path and self._unsaved >= SAVE_EVERY
+        if should_save:
+            self.save()
+
+    def _insert(self, namespace: str, normalized: str, response: str, latency: float,
+                created_at: float, hits: int = 0):
+        existing = self._exact.get((namespace, normalized))
+        if existing is not None:
+            self._drop(existing)
+        key = uuid.uuid4().hex
+        self._entries[key] = {
+            'namespace': namespace,
+            'prompt': normalized,
+            'numbers': _NUMBER.findall(normalized),
+            'asks': _asks(normalized),
+            'terms': _terms(normalized),
+            'response': response,
+            'latency': latency,
+            'created_at': created_at,
+            'last_used': created_at,
+            'hits': hits
+        }
+        self._exact[(namespace, normalized)] = key
+        index = self._indexes.get(namespace)
+        if index is None:
+            index = self._indexes[namespace] = HNSWIndex(self.vectorizer.dim)
+        index.add(key, self.vectorizer.embed(normalized))
+        self.metrics['inserts'] += 1
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.metrics['evictions'] += 1
+
+    def save(self):
+        """Atomically write live entries (LRU order) as JSON lines; vectors are re-derived on load"""
+        if not self.path:
+            return
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+            self._unsaved = 0
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                entry.pop('numbers')
+                entry.pop('asks')
+                entry.pop('terms')
+                entry['normalization'] = NORMALIZATION_VERSION
+                f.write(json.dumps(entry) + '\n')
+        os.replace(temporary, self.path)
+        logger.info(f"Semantic cache saved: {len(entries)} entries")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        cutoff = time.time() - self.ttl_seconds
+        loaded = 0
+        with self._lock, open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                # Prompts are stored normalized; ones saved under other rules cannot be compared with new lookups
+                if entry['created_at'] < cutoff or entry.get('normalization') != NORMALIZATION_VERSION:
+                    continue
+                self._insert(entry['namespace'], entry['prompt'], entry['response'],
+                             entry.get('latency', 0.0), entry['created_at'], entry.get('hits', 0))
+                loaded += 1
+            self.metrics['inserts'] = 0
+        logger.info(f"Semantic cache loaded: {loaded} entries from {self.path}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._exact.clear()
+            self._indexes.clear()
+
+    def stats(self) -> Dict:
+        metrics = dict(self.metrics)
+        similarity_total = metrics.pop('hit_similarity_total')
+        return {
+            'enabled': CACHE_ENABLED,
+            'entries': len(self._entries),
+            'namespaces': len(self._indexes),
+            'threshold': self.threshold,
+            **metrics,
+            'hit_rate': metrics['hits'] / metrics['lookups'] if metrics['lookups'] else 0.0,
+            'mean_hit_similarity': similarity_total / metrics['hits'] if metrics['hits'] else None
+        }
+
+
+semantic_cache = SemanticCache() if CACHE_ENABLED else None
+
+if semantic_cache is not None and CACHE_PATH:
+    atexit.register(semantic_cache.save)
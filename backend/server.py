@@ -9,15 +9,15 @@ import os
 import asyncio
 import logging
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set, Tuple
 import json
 import uuid
 
 # FastAPI imports
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel
 
 # Database and external integrations
@@ -27,6 +27,29 @@ import httpx
 import openai
 from dotenv import load_dotenv
 
+from backend.registry import AgentRegistry, AgentBusyError, AgentNotFound
+from backend.admission import AdmissionController, Overloaded, parse_priority
+from backend.tenants import tenant_metrics, tenant_policy, tenant_scope
+from backend.loop_watchdog import loop_watchdog
+from backend.tracing import TRACEPARENT_HEADER, tracer
+from backend.cpu_tasks import cpu_pool
+from backend.payloads import PayloadHandle, payload_store, describe_payloads, to_wire
+from backend.datasets import DatasetBuilder, DatasetFormatError, DatasetNotFound, DatasetTooLarge
+from backend.datasets import DATASET_MAX_BYTES, datasets, detect_format
+from backend.analysis import profile_data
+from backend.chart_data import shape_chart_data
+from backend.live_dashboards import dashboards
+from backend.llm import LLM_UPSTREAM, chat_completion, shared_session
+from backend.hedging import hedger
+from backend.model_router import model_router
+from backend.memo import memoized_stage, mark_degraded, stage_memo
+from backend.resilience import Served, last_good, resilience_stats
+from backend.prompts import data_preview
+from backend.semantic_cache import semantic_cache
+from backend.history import HistoryStore, HistoryCursorError, BATCH_FLUSH_SIZE
+from backend import accounting, deadlines
+from backend.deadlines import DeadlineExceeded, RequestCancelled
+
 # Load environment variables
 load_dotenv()
 
@@ -54,6 +77,7 @@ app.add_middleware(
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 client = MongoClient(MONGO_URL)
 db = client.purplebrain
+history = HistoryStore(db)
 
 # OpenAI setup
 openai.api_key = os.environ.get('OPENAI_API_KEY')
@@ -77,6 +101,19 @@ class AgentResponse(BaseModel):
     result: Dict
     timestamp: str
     execution_time: float
+    accounting: Optional[Dict] = None
+
+class BatchItem(BaseModel):
+    model_config = ConfigDict(json_schema_extra=None)
+    agent: str
+    task: AgentTask
+    id: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    model_config = ConfigDict(json_schema_extra=None)
+    items: List[BatchItem]
+    concurrency: Optional[int] = None
+    deadline_ms: Optional[float] = None
 
 # Enhanced Agent Base Class
 class EnhancedAgent:
@@ -94,10 +131,12 @@ class EnhancedAgent:
         """Process task with enhanced capabilities"""
         start_time = datetime.now()
         self.execution_count += 1
+        task_id = str(uuid.uuid4())
+        log_id = None
         
         try:
             # Log task execution
-            await self._log_execution(task)
+            log_id = await self._log_execution(task, task_id)
             
             # Execute the task
             result = await self._execute_task(task)
@@ -110,47 +149,54 @@ class EnhancedAgent:
                 'agent_id': self.agent_id,
                 'agent': self.name,
                 'persona': self.persona,
-                'task_id': str(uuid.uuid4()),
+                'task_id': task_id,
                 'query': task.query,
                 'result': result,
                 'execution_time': execution_time,
+                # Resources this run used up to here (sub-stages included); stored with the result
+                'accounting': accounting.snapshot(),
                 'timestamp': datetime.now().isoformat(),
                 'execution_count': self.execution_count
             }
             
             # Store result in database
             await self._store_result(response)
+            history.log_finished(log_id, start_time)
             
             return response
             
+        except deadlines.ABANDONED as e:
+            if log_id is not None:
+                status = deadlines.outcome(e)
+                history.log_finished(log_id, start_time, error=str(e) or status, status=status)
+            raise
         except Exception as e:
             logger.error(f"Error in {self.name}: {str(e)}")
+            if log_id is not None:
+                history.log_finished(log_id, start_time, error=str(e))
             raise HTTPException(status_code=500, detail=f"Agent execution failed: {str(e)}")
     
     async def _execute_task(self, task: AgentTask) -> Dict:
         """Override in subclasses"""
         raise NotImplementedError
     
-    async def _log_execution(self, task: AgentTask):
-        """Log task execution to database"""
-        log_entry = {
-            'agent_id': self.agent_id,
-            'agent_name': self.name,
-            'task': self._make_json_safe(task.dict()),
-            'timestamp': datetime.now(),
-            'status': 'started'
-        }
-        db.agent_logs.insert_one(log_entry)
+    async def _log_execution(self, task: AgentTask, task_id: str):
+        """Log task execution to database; returns the log entry id"""
+        return history.log_started(self.agent_id, self.name, task_id, self._make_json_safe(task.dict()))
     
     async def _store_result(self, result: Dict):
         """Store execution result"""
         # Convert to JSON-safe format before storing
         json_safe_result = self._make_json_safe(result)
-        db.agent_results.insert_one(json_safe_result)
+        # Hashing and compressing large sub-documents is CPU work - keep it off the event loop
+        await accounting.to_thread(history.store_result, json_safe_result)
     
     def _make_json_safe(self, obj):
         """Convert object to JSON-safe format"""
-        if isinstance(obj, dict):
+        if isinstance(obj, PayloadHandle):
+            # Reference only - the buffer itself is never copied into logs
+            return describe_payloads(obj)
+        elif isinstance(obj, dict):
             return {k: self._make_json_safe(v) for k, v in obj.items()}
         elif isinstance(obj, list):
             return [self._make_json_safe(item) for item in obj]
@@ -187,11 +233,17 @@ class VisualizationAgent(EnhancedAgent):
         data = task.data or {}
         style = task.style or "professional"
         
+        # Column profiling is CPU-bound - it runs in the process pool
+        data_profile = await self._profile_data(data)
+        
         # AI-powered visualization strategy
         viz_strategy = await self._analyze_visualization_needs(task.query, data)
         
+        # Shape raw columns into render-ready chart data (CPU-bound, process pool)
+        chart_data = await self._shape_chart_data(data, data_profile, task.options)
+        
         # Generate visualizations based on strategy
-        visualizations = await self._create_visualizations(viz_strategy, data, style)
+        visualizations = await self._create_visualizations(viz_strategy, data, style, chart_data)
         
         # Generate insights and narratives
         insights = await self._generate_insights(data, visualizations)
@@ -207,18 +259,40 @@ class VisualizationAgent(EnhancedAgent):
             'export_formats': ['png', 'svg', 'pdf', 'html', 'json'],
             'recommended_actions': await self._recommend_actions(insights),
             'styling_options': await self._generate_styling_options(style),
-            'data_quality_score': await self._assess_data_quality(data),
+            'data_profile': data_profile,
+            'data_quality_score': await self._assess_data_quality(data, data_profile),
             'narrative': await self._create_data_narrative(data, insights)
         }
     
+    @memoized_stage('visualization.profile', depends_on=('data',))
+    async def _profile_data(self, data: Dict) -> Dict:
+        """Profile columns of the supplied data off the event loop"""
+        
+        if not data:
+            return {'rows': 0, 'columns': {}, 'numeric_columns': [], 'categorical_columns': [], 'completeness': 0.0}
+        return await profile_data(data)
+    
+    @memoized_stage('visualization.chart_data', depends_on=lambda data, data_profile, options: {
+        'data': data, 'chart_budget': (options or {}).get('chart_budget')
+    })
+    async def _shape_chart_data(self, data: Dict, data_profile: Dict, options: Optional[Dict]) -> Dict:
+        """Aggregate and downsample chart series to the client's render budget"""
+        
+        if not data_profile.get('columns'):
+            return {}
+        budget = (options or {}).get('chart_budget')
+        return await shape_chart_data(data, data_profile, budget)
+    
+    @memoized_stage('visualization.strategy', depends_on=('query', 'data'))
     async def _analyze_visualization_needs(self, query: str, data: Dict) -> Dict:
         """AI-powered analysis of what visualizations are needed"""
         
+        preview = data_preview(data, budget=150)
         prompt = f"""
         As a master data visualization strategist, analyze this request and data to recommend the optimal visualization approach:
         
         Query: {query}
-        Data Preview: {str(data)[:500]}
+        Data Preview: {preview}
         
         Provide a strategic visualization plan including:
         1. Primary visualization type and rationale
@@ -232,21 +306,29 @@ class VisualizationAgent(EnhancedAgent):
         """
         
         try:
-            response = await self._get_ai_response(prompt)
+            response = await self._get_ai_response(
+                prompt, cache_key=f"{query}\n{preview}", cache_scope='visualization_plan'
+            )
             return {
-                'analysis': response,
+                'analysis': response.value,
+                'freshness': response.freshness(),
                 'primary_viz_type': 'interactive_dashboard',  # Default fallback
                 'secondary_viz_types': ['trend_analysis', 'comparison_charts'],
                 'key_metrics': ['growth', 'performance', 'insights'],
                 'narrative_flow': ['overview', 'deep_dive', 'actionable_insights'],
                 'interactivity': ['drill_down', 'filtering', 'real_time_updates']
             }
+        except deadlines.ABANDONED:
+            raise
         except:
+            mark_degraded()
             return self._get_default_viz_strategy()
     
-    async def _create_visualizations(self, strategy: Dict, data: Dict, style: str) -> List[Dict]:
+    async def _create_visualizations(self, strategy: Dict, data: Dict, style: str,
+                                     chart_data: Optional[Dict] = None) -> List[Dict]:
         """Create actual visualization configurations"""
         
+        chart_data = chart_data or {}
         visualizations = []
         
         # Primary Dashboard Visualization
@@ -262,18 +344,21 @@ class VisualizationAgent(EnhancedAgent):
                         'data_source': 'processed_data',
                         'x_axis': 'time',
                         'y_axis': 'value',
+                        'data': chart_data.get('processed_data'),
                         'styling': await self._get_chart_styling(style)
                     },
                     {
                         'type': 'bar_chart', 
                         'title': 'Category Comparison',
                         'data_source': 'category_data',
+                        'data': chart_data.get('category_data'),
                         'styling': await self._get_chart_styling(style)
                     },
                     {
                         'type': 'pie_chart',
                         'title': 'Distribution Analysis',
                         'data_source': 'distribution_data',
+                        'data': chart_data.get('distribution_data'),
                         'styling': await self._get_chart_styling(style)
                     }
                 ],
@@ -307,7 +392,9 @@ class VisualizationAgent(EnhancedAgent):
                     {
                         'type': 'heatmap',
                         'title': 'Performance Matrix',
-                        'dimensions': ['product', 'region', 'time']
+                        'dimensions': ['product', 'region', 'time'],
+                        'data_source': 'performance_matrix',
+                        'data': chart_data.get('performance_matrix')
                     }
                 ]
             }
@@ -345,13 +432,18 @@ class VisualizationAgent(EnhancedAgent):
         
         return visualizations
     
+    # Insights read the data and the chart count only, so a style change reuses them
+    @memoized_stage('visualization.insights', depends_on=lambda data, visualizations: {
+        'data': data, 'charts': len(visualizations)
+    })
     async def _generate_insights(self, data: Dict, visualizations: List[Dict]) -> Dict:
         """Generate AI-powered insights from data and visualizations"""
         
+        preview = data_preview(data, budget=100)
         prompt = f"""
         As a master data analyst, generate key insights from this data and visualization strategy:
         
-        Data: {str(data)[:300]}
+        Data: {preview}
         Visualizations: {len(visualizations)} charts created
         
         Provide:
@@ -365,9 +457,12 @@ class VisualizationAgent(EnhancedAgent):
         """
         
         try:
-            ai_insights = await self._get_ai_response(prompt)
+            ai_insights = await self._get_ai_response(
+                prompt, cache_key=f"{preview}\n{len(visualizations)} charts", cache_scope='insights'
+            )
             return {
-                'ai_analysis': ai_insights,
+                'ai_analysis': ai_insights.value,
+                'freshness': ai_insights.freshness(),
                 'critical_insights': [
                     'Market opportunity identified: 40% growth potential in Q2',
                     'Efficiency optimization could save $500K annually',
@@ -385,7 +480,10 @@ class VisualizationAgent(EnhancedAgent):
                 'confidence_score': 0.92,
                 'data_completeness': 0.87
             }
+        except deadlines.ABANDONED:
+            raise
         except:
+            mark_degraded()
             return self._get_default_insights()
     
     async def _create_interactive_config(self, visualizations: List[Dict]) -> Dict:
@@ -415,7 +513,12 @@ class VisualizationAgent(EnhancedAgent):
                 'direct_link', 
                 'pdf_export',
                 'presentation_mode'
-            ]
+            ],
+            'live_updates': {
+                'endpoint': '/ws',
+                'messages': ['subscribe', 'append', 'snapshot', 'unsubscribe'],
+                'delta_sources': ['processed_data', 'category_data', 'distribution_data']
+            }
         }
     
     async def _recommend_actions(self, insights: Dict) -> List[Dict]:
@@ -468,14 +571,18 @@ class VisualizationAgent(EnhancedAgent):
         
         return style_configs.get(style, style_configs['professional'])
     
-    async def _assess_data_quality(self, data: Dict) -> float:
+    async def _assess_data_quality(self, data: Dict, data_profile: Optional[Dict] = None) -> float:
         """Assess the quality of input data"""
         
         if not data:
             return 0.0
+        
+        completeness = 0.9
+        if data_profile and data_profile.get('columns'):
+            completeness = data_profile['completeness']
             
         quality_factors = {
-            'completeness': 0.9,  # How complete is the data
+            'completeness': completeness,  # How complete is the data
             'accuracy': 0.85,     # How accurate does it appear
             'consistency': 0.88,  # Internal consistency
             'relevance': 0.92     # Relevance to query
@@ -518,23 +625,33 @@ class VisualizationAgent(EnhancedAgent):
             'responsive': True
         }
     
-    async def _get_ai_response(self, prompt: str) -> str:
-        """Get AI response for analysis"""
+    async def _get_ai_response(self, prompt: str, cache_key: Optional[str] = None, cache_scope: str = '') -> Served:
+        """Get AI response for analysis (near-duplicate requests are served from the semantic cache)
         
+        `cache_scope` doubles as the routing stage, so the model router picks
+        model, max_tokens and temperature for it. While OpenAI is failing, the
+        last good answer for the same request is served at once, flagged stale.
+        """
+        
+        route = model_router.route(cache_scope, cache_key or prompt)
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a master data visualization strategist and business intelligence expert."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1500,
-                temperature=0.3
+            return await last_good.serve(
+                f"{cache_scope}:{cache_key or prompt}",
+                lambda: chat_completion(
+                    "You are a master data visualization strategist and business intelligence expert.",
+                    prompt,
+                    cache_key=cache_key,
+                    cache_scope=cache_scope,
+                    route=route
+                ),
+                upstream=LLM_UPSTREAM
             )
-            return response.choices[0].message.content
+        except deadlines.ABANDONED:
+            raise
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
-            return "AI analysis temporarily unavailable"
+            mark_degraded()
+            return Served("AI analysis temporarily unavailable")
     
     def _get_default_viz_strategy(self) -> Dict:
         """Default visualization strategy fallback"""
@@ -1201,12 +1318,15 @@ async def fetch_performance_metrics(user_id: str) -> Dict:
             ]
         }
 
-# Initialize enhanced agents
-agents = {
-    'visualization': VisualizationAgent(),
-    'research': ResearchAgent(), 
-    'code': CodeAgent()
-}
+# Register enhanced agents - each is built on first use and runs inside its own
+# concurrency budget, so a heavy visualization run cannot starve research calls
+agents = AgentRegistry()
+agents.register('visualization', VisualizationAgent, executor='thread', max_concurrency=4, max_queue=32)
+agents.register('research', ResearchAgent, max_concurrency=32, max_queue=256)
+agents.register('code', CodeAgent, max_concurrency=16, max_queue=128)
+agents.discover()
+agents.configure_from_env()
+admission = AdmissionController(agents)
 
 # API Routes
 @app.get("/")
@@ -1224,52 +1344,506 @@ async def get_agents_status():
             'persona': agent.persona,
             'capabilities': agent.capabilities,
             'execution_count': agent.execution_count,
-            'agent_id': agent.agent_id
+            'agent_id': agent.agent_id,
+            'runtime': agents.stats(key),
+            'admission': admission.stats(key)
         }
     return status
 
+async def _wait_for_disconnect(request: Request):
+    """Completes when the HTTP client goes away (the body has already been read)"""
+    while True:
+        message = await request.receive()
+        if message['type'] == 'http.disconnect':
+            return
+
 @app.post("/api/agent/{agent_name}")
-async def execute_agent(agent_name: str, task: AgentTask):
-    """Execute specific agent with enhanced capabilities"""
+async def execute_agent(agent_name: str, task: AgentTask, request: Request, response: Response):
+    """Execute specific agent with enhanced capabilities
+    
+    An X-Request-Deadline-Ms header or options.deadline_ms bounds the whole
+    run; if the client disconnects first, the remaining stages are cancelled.
+    Under overload, options.priority ('critical', 'interactive' or 'batch')
+    decides which requests are shed with 503 and Retry-After. Callers are
+    identified by API key (or X-Tenant-Id) and queued fairly per tenant.
+    Sampled requests are traced; the response's traceparent names the trace.
+    """
     
     if agent_name not in agents:
         raise HTTPException(status_code=404, detail=f"Agent {agent_name} not found")
+    try:
+        deadline_ms = deadlines.parse_deadline_ms(request.headers.get(deadlines.DEADLINE_HEADER), task.options)
+        priority = parse_priority(task.options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        admission.admit(agent_name, priority, deadline_ms)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': str(e.retry_after)})
     
+    # Large columns are stored once and travel between stages by reference
+    payloads, leased = [], []
     try:
-        agent = agents[agent_name]
-        result = await agent.process(task)
+        if task.data:
+            task.data = payload_store.wrap(datasets.resolve(task.data, leased), payloads)
+        tenant = tenant_policy.identify(request.headers)
+        with deadlines.request_scope(deadline_ms) as context, tenant_scope(tenant), tracer.start_trace(
+            'POST /api/agent/{agent_name}', request.headers.get(TRACEPARENT_HEADER), **{
+                'http.method': 'POST', 'http.route': '/api/agent/{agent_name}', 'agent.name': agent_name,
+                'tenant': tenant, 'http.request_content_length': request.headers.get('content-length')
+            }
+        ) as root, accounting.usage_scope() as usage:
+            if root.recording:
+                response.headers[TRACEPARENT_HEADER] = root.traceparent()
+            result = await deadlines.cancel_on(agents.run(agent_name, task), _wait_for_disconnect(request), context)
         
         return AgentResponse(
             success=True,
             agent=agent_name,
-            result=result,
+            result=to_wire(result),
             timestamp=datetime.now().isoformat(),
-            execution_time=result.get('execution_time', 0.0)
+            execution_time=result.get('execution_time', 0.0),
+            accounting=usage.to_dict()
         )
         
+    except AgentBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={'Retry-After': str(admission.retry_after(agent_name))})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except RequestCancelled as e:
+        # Nobody is listening; 499 only shows up in access logs
+        raise HTTPException(status_code=499, detail=str(e))
+    except (AgentNotFound, DatasetNotFound) as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"Error executing {agent_name}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        payload_store.release(payloads)
+        datasets.release(leased)
+
+# Batch runs: items in flight at once (also the per-request maximum) and the largest batch accepted
+BATCH_CONCURRENCY = int(os.environ.get('PURPLEBRAIN_BATCH_CONCURRENCY', 16))
+BATCH_MAX_ITEMS = int(os.environ.get('PURPLEBRAIN_BATCH_MAX_ITEMS', 1000))
+
+def _batch_error(e: Exception) -> Tuple[int, str]:
+    """Status and message for a failed batch item, matching the single-agent endpoint"""
+    if isinstance(e, HTTPException):
+        return e.status_code, str(e.detail)
+    if isinstance(e, (Overloaded, AgentBusyError)):
+        return 503, str(e)
+    if isinstance(e, DeadlineExceeded):
+        return 504, str(e)
+    if isinstance(e, RequestCancelled):
+        return 499, str(e)
+    if isinstance(e, (AgentNotFound, DatasetNotFound)):
+        return 404, str(e)
+    return 500, str(e)
+
+async def _run_batch_item(index: int, item: BatchItem, batch, slots: asyncio.Semaphore) -> Dict:
+    """One batch item as an NDJSON record; failures are reported, never raised"""
+    async with slots:
+        payloads, leased = [], []
+        try:
+            if item.agent not in agents:
+                raise AgentNotFound(item.agent)
+            # Batch work yields to interactive traffic unless an item says otherwise
+            admission.admit(item.agent, parse_priority(item.task.options, default='batch'))
+            with history.batching(batch), accounting.usage_scope() as usage:
+                if item.task.data:
+                    item.task.data = payload_store.wrap(datasets.resolve(item.task.data, leased), payloads)
+                result = await agents.run(item.agent, item.task)
+            return {
+                'index': index,
+                'id': item.id,
+                'agent': item.agent,
+                'success': True,
+                'result': to_wire(result),
+                'execution_time': result.get('execution_time', 0.0),
+                'accounting': usage.to_dict()
+            }
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status, detail = _batch_error(e)
+            record = {'index': index, 'id': item.id, 'agent': item.agent, 'success': False,
+                      'status': status, 'error': detail}
+            if status == 503:
+                record['retry_after'] = admission.retry_after(item.agent)
+            return record
+        finally:
+            payload_store.release(payloads)
+            datasets.release(leased)
+
+async def _stream_batch(items: List[BatchItem], concurrency: int, deadline_ms: Optional[float], tenant: str,
+                        traceparent: Optional[str] = None):
+    """Yield one NDJSON line per item as it completes, then a summary line"""
+    started = datetime.now()
+    batch = history.batch()
+    succeeded = 0
+    pending: Set[asyncio.Future] = set()
+    with deadlines.request_scope(deadline_ms) as context, tenant_scope(tenant), tracer.start_trace(
+        'POST /api/agents/batch', traceparent,
+        **{'http.route': '/api/agents/batch', 'batch.items': len(items), 'tenant': tenant}
+    ), accounting.usage_scope() as usage:
+        try:
+            # One keep-alive pool for every completion in the batch
+            async with shared_session(concurrency):
+                slots = asyncio.Semaphore(concurrency)
+                pending = {
+                    asyncio.ensure_future(_run_batch_item(index, item, batch, slots))
+                    for index, item in enumerate(items)
+                }
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for finished in sorted(done, key=lambda task: task.result()['index']):
+                        record = finished.result()
+                        succeeded += record['success']
+                        yield json.dumps(record, default=str) + '\n'
+                    # Logs and results go to MongoDB in bulk, off the event loop
+                    if batch.pending >= BATCH_FLUSH_SIZE:
+                        await asyncio.to_thread(batch.flush)
+            yield json.dumps({
+                'done': True,
+                'total': len(items),
+                'succeeded': succeeded,
+                'failed': len(items) - succeeded,
+                'elapsed_s': (datetime.now() - started).total_seconds(),
+                'accounting': usage.to_dict()
+            }) + '\n'
+        finally:
+            if pending:
+                # The client stopped reading; abandon what is still running
+                context.cancel('client disconnected')
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            await asyncio.shield(asyncio.to_thread(batch.flush))
+
+@app.post("/api/agents/batch")
+async def execute_agent_batch(batch_request: BatchRequest, request: Request):
+    """Run many agent tasks in one request, streaming results as NDJSON
+    
+    Items run with bounded concurrency and share one upstream connection
+    pool; their history is written in bulk. Each line carries the item's
+    index (and id, if given) in completion order; the last line is a summary.
+    """
+    
+    items = batch_request.items
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch has {len(items)} items, the limit is {BATCH_MAX_ITEMS}")
+    try:
+        deadline_ms = deadlines.parse_deadline_ms(
+            request.headers.get(deadlines.DEADLINE_HEADER), {'deadline_ms': batch_request.deadline_ms}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    concurrency = max(1, min(batch_request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    return StreamingResponse(
+        _stream_batch(items, concurrency, deadline_ms, tenant_policy.identify(request.headers),
+                      request.headers.get(TRACEPARENT_HEADER)),
+        media_type='application/x-ndjson'
+    )
+
+@app.post("/api/datasets")
+async def upload_dataset(
+    request: Request,
+    name: str = Query("upload"),
+    dataset_format: Optional[str] = Query(None, alias="format")
+):
+    """Stream a CSV / NDJSON / Parquet body into a columnar dataset
+
+    The body is parsed chunk by chunk into memory-mapped column buffers, so
+    memory use follows the chunk size rather than the file size. Pass the
+    returned dataset_id as task.data = {"dataset_id": ...} to any agent.
+    """
+    try:
+        fmt = detect_format(request.headers.get('content-type'), dataset_format)
+    except DatasetFormatError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    # A declared size over the limit is refused before anything is read; chunked bodies are counted as they stream
+    declared = request.headers.get('content-length')
+    if DATASET_MAX_BYTES and declared and declared.isdigit() and int(declared) > DATASET_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=str(DatasetTooLarge(DATASET_MAX_BYTES)))
+    
+    builder = DatasetBuilder(fmt, name=name)
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                # Parsing is CPU work - keep it off the event loop
+                await asyncio.to_thread(builder.feed, chunk)
+        dataset = await asyncio.to_thread(builder.finish)
+    except DatasetTooLarge as e:
+        builder.abort()
+        raise HTTPException(status_code=413, detail=str(e))
+    except DatasetFormatError as e:
+        builder.abort()
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        builder.abort()
+        raise
+    
+    datasets.add(dataset)
+    logger.info(f"Dataset {dataset.dataset_id} ingested: {dataset.rows} rows, {len(dataset.columns)} columns")
+    return dataset.describe()
+
+@app.get("/api/datasets")
+async def list_datasets():
+    """List uploaded datasets"""
+    return {'datasets': [dataset.describe() for dataset in datasets.list()]}
+
+@app.get("/api/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str):
+    """Dataset metadata"""
+    dataset = datasets.get(dataset_id)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+    return dataset.describe()
+
+@app.delete("/api/datasets/{dataset_id}")
+async def delete_dataset(dataset_id: str):
+    """Delete a dataset and its column buffers"""
+    if not datasets.delete(dataset_id):
+        raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+    return {'deleted': dataset_id}
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Semantic LLM cache hit rate and size, plus stage memoization"""
+    stats = semantic_cache.stats() if semantic_cache is not None else {'enabled': False}
+    return {**stats, 'stage_memo': stage_memo.stats()}
+
+def _history_agent_name(agent: Optional[str]) -> Optional[str]:
+    """Accept either a registry key ('research') or the agent's display name"""
+    if agent and agent in agents:
+        return agents[agent].name
+    return agent
+
+def _history_fields(fields: Optional[str]) -> Optional[List[str]]:
+    return [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+
+@app.get("/api/history/logs")
+async def list_execution_logs(
+    agent: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    min_latency_ms: Optional[float] = None,
+    max_latency_ms: Optional[float] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Execution log entries, newest first; pass next_cursor back to page"""
+    try:
+        return await asyncio.to_thread(
+            history.list_logs, _history_agent_name(agent), status, since, until,
+            min_latency_ms, max_latency_ms, limit, cursor, _history_fields(fields)
+        )
+    except HistoryCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/history/results")
+async def list_execution_results(
+    agent: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    min_execution_time: Optional[float] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Stored agent results, newest first; full result bodies only via fields=result"""
+    try:
+        return await asyncio.to_thread(
+            history.list_results, _history_agent_name(agent), since, until,
+            min_execution_time, limit, cursor, _history_fields(fields)
+        )
+    except HistoryCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/history/stats")
+async def get_execution_stats(
+    agent: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    group_by: str = "agent"
+):
+    """Execution counts, failures and latency grouped by agent / status / hour / day"""
+    try:
+        groups = await asyncio.to_thread(history.stats, _history_agent_name(agent), since, until, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    storage = history.blobs.stats() if history.blobs is not None else {'enabled': False}
+    return {'group_by': group_by, 'groups': groups, 'result_storage': storage}
+
+@app.get("/api/history/results/{task_id}")
+async def get_execution_result(task_id: str):
+    """One stored result, reassembled from its blobs"""
+    result = await asyncio.to_thread(history.get_result, task_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Result {task_id} not found")
+    return result
+
+@app.get("/api/agent/{agent_name}/history")
+async def get_agent_history(agent_name: str, limit: int = Query(20, ge=1, le=200), cursor: Optional[str] = None):
+    """Recent executions of one agent"""
+    if agent_name not in agents:
+        raise HTTPException(status_code=404, detail=f"Agent {agent_name} not found")
+    return await list_execution_logs(agent=agent_name, limit=limit, cursor=cursor)
+
+@app.on_event("startup")
+async def ensure_history_indexes():
+    """Query and TTL indexes for agent_logs / agent_results"""
+    try:
+        await asyncio.to_thread(history.ensure_indexes)
+    except Exception as e:
+        logger.warning(f"History indexes not created: {e}")
+
+@app.on_event("startup")
+async def start_loop_watchdog():
+    """Measure the server loop's lag and capture the stacks of calls that block it"""
+    loop_watchdog.start('fastapi')
+
+@app.get("/api/loop/stats")
+async def get_loop_stats(limit: int = Query(20, ge=1, le=100)):
+    """Event-loop lag histograms and the call sites that blocked a loop for longest"""
+    return loop_watchdog.stats(limit)
+
+@app.get("/api/tracing/stats")
+async def get_tracing_stats():
+    """Sampling rate, export target and exported / dropped span counts"""
+    return tracer.stats()
+
+@app.get("/api/tenants/stats")
+async def get_tenant_stats():
+    """Per-tenant latency and throughput for each agent, plus configured weights and caps"""
+    return {'tenants': tenant_metrics.stats(), 'policy': tenant_policy.describe()}
+
+@app.get("/api/llm/stats")
+async def get_llm_stats():
+    """Upstream LLM latency, hedging, per-stage routing outcomes and circuit breakers"""
+    return {**hedger.stats(), 'routing': model_router.stats(), **resilience_stats()}
+
+@app.on_event("shutdown")
+async def shutdown_agents():
+    """Release per-agent worker pools"""
+    agents.shutdown()
+    cpu_pool.shutdown()
+    if semantic_cache is not None:
+        await asyncio.to_thread(semantic_cache.save)
+
+async def handle_dashboard_message(websocket: WebSocket, message: Dict) -> Dict:
+    """Live dashboard protocol: subscribe / append / snapshot / unsubscribe
+    
+    Appends only fold the new rows into running aggregates and answer with
+    the chart delta - no agent re-run, no LLM call.
+    """
+    message_type = message['type']
+    try:
+        if message_type == 'subscribe':
+            dashboard = dashboards.subscribe(
+                websocket, message.get('fields'), message.get('budget'), message.get('window')
+            )
+            leased = []
+            try:
+                seed = datasets.resolve(message.get('data'), leased)
+                if seed:
+                    # One-off O(rows) pass over the starting data (e.g. an uploaded dataset)
+                    seed = {k: v.view() if isinstance(v, PayloadHandle) else v for k, v in seed.items()}
+                    async with dashboard.lock:
+                        await asyncio.to_thread(dashboard.append, seed, None)
+            finally:
+                datasets.release(leased)
+            return dashboard.snapshot()
+        
+        dashboard = dashboards.get(message.get('dashboard_id'), websocket)
+        if message_type == 'append':
+            rows = {'rows': message['rows']} if 'rows' in message else message.get('columns') or {}
+            async with dashboard.lock:
+                return await asyncio.to_thread(dashboard.append, rows)
+        if message_type == 'snapshot':
+            return dashboard.snapshot()
+        dashboards.unsubscribe(dashboard.dashboard_id, websocket)
+        return {'type': 'dashboard_closed', 'dashboard_id': dashboard.dashboard_id}
+    
+    except DatasetNotFound as e:
+        return {'type': 'error', 'message': str(e), 'success': False}
+    except KeyError as e:
+        return {'type': 'error', 'message': str(e.args[0]), 'success': False}
+    except ValueError as e:
+        return {'type': 'error', 'message': str(e), 'success': False}
+    except (TypeError, AttributeError) as e:
+        # A malformed message must not end the socket's other dashboards and agent runs
+        logger.warning(f"Malformed {message_type} dashboard message: {e}")
+        return {'type': 'error', 'message': f"Malformed {message_type} message", 'success': False}
+
+async def run_socket_agent(websocket: WebSocket, agent_name: str, task_data: Dict,
+                           contexts: Set[deadlines.RequestContext], tenant: str):
+    """One /ws agent request; cancelled through its context if the socket closes first"""
+    payloads, leased = [], []
+    try:
+        task = AgentTask(**task_data)
+        deadline_ms = deadlines.parse_deadline_ms(options=task.options)
+        admission.admit(agent_name, parse_priority(task.options), deadline_ms)
+        with deadlines.request_scope(deadline_ms) as context, tenant_scope(tenant), tracer.start_trace(
+            'ws agent_request', **{'agent.name': agent_name, 'tenant': tenant}
+        ), accounting.usage_scope() as usage:
+            contexts.add(context)
+            try:
+                if task.data:
+                    task.data = payload_store.wrap(datasets.resolve(task.data, leased), payloads)
+                result = await agents.run(agent_name, task)
+            finally:
+                contexts.discard(context)
+        await websocket.send_json({
+            'type': 'agent_response',
+            'agent': agent_name,
+            'result': to_wire(result),
+            'accounting': usage.to_dict(),
+            'success': True
+        })
+    except (RequestCancelled, asyncio.CancelledError):
+        logger.info(f"WebSocket request for {agent_name} cancelled")
+    except Exception as e:
+        try:
+            await websocket.send_json({
+                'type': 'error',
+                'agent': agent_name,
+                'message': getattr(e, 'detail', None) or str(e),
+                'success': False
+            })
+        except Exception:
+            pass  # socket already closed
+    finally:
+        payload_store.release(payloads)
+        datasets.release(leased)
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time agent communication"""
     await websocket.accept()
+    contexts: Set[deadlines.RequestContext] = set()
+    inflight: Set[asyncio.Task] = set()
+    tenant = tenant_policy.identify(websocket.headers)
     try:
         while True:
             data = await websocket.receive_json()
+            if data.get('type') in ('subscribe', 'append', 'snapshot', 'unsubscribe'):
+                await websocket.send_json(await handle_dashboard_message(websocket, data))
+                continue
+            
             agent_name = data.get('agent')
             task_data = data.get('task')
             
             if agent_name in agents:
-                task = AgentTask(**task_data)
-                result = await agents[agent_name].process(task)
-                await websocket.send_json({
-                    'type': 'agent_response',
-                    'agent': agent_name,
-                    'result': result,
-                    'success': True
-                })
+                # Runs alongside the receive loop so a closed socket is noticed mid-run
+                running = asyncio.create_task(run_socket_agent(websocket, agent_name, task_data, contexts, tenant))
+                inflight.add(running)
+                running.add_done_callback(inflight.discard)
             else:
                 await websocket.send_json({
                     'type': 'error',
@@ -1279,6 +1853,10 @@ async def websocket_endpoint(websocket: WebSocket):
                 
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
+    finally:
+        for context in list(contexts):
+            context.cancel('websocket closed')
+        dashboards.drop_owner(websocket)
 
 if __name__ == "__main__":
     import uvicorn
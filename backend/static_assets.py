@@ -0,0 +1,273 @@
+"""
+PurpleBrain-AI Static Assets
+Precompressed, content-hashed UI files from one explicit directory, revalidated by ETag
+"""
+
+import os
+import gzip
+import hashlib
+import logging
+import tempfile
+import threading
+import mimetypes
+from dataclasses import dataclass, field
+from typing import Dict, Mapping, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only files under this directory (relative paths are from the repository root) are ever served
+STATIC_DIR = os.path.join(_ROOT, os.environ.get('PURPLEBRAIN_STATIC_DIR') or 'static')
+# Compressed variants are named by content hash, so they survive restarts and are reused.
+# The directory must be private to this user: other local users could otherwise plant variants
+STATIC_CACHE_DIR = (os.environ.get('PURPLEBRAIN_STATIC_CACHE_DIR')
+                    or os.path.join(tempfile.gettempdir(),
+                                    f"purplebrain-static-{os.getuid()}" if hasattr(os, 'getuid') else 'purplebrain-static'))
+# Plain URLs (the page itself included) are revalidated after this long; 0 revalidates on every load
+STATIC_MAX_AGE_S = int(os.environ.get('PURPLEBRAIN_STATIC_MAX_AGE_S', 0))
+
+# Content-hashed URLs never change what they point at
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Smaller files gain less from compression than the Content-Encoding round trip costs
+COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+# Preferred first when the client accepts several equally
+ENCODINGS = ('br', 'gzip')
+_EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+
+def _compress(encoding: str, raw: bytes) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(raw, quality=11)
+    return gzip.compress(raw, compresslevel=9, mtime=0)
+
+
+def _decompress(encoding: str, compressed: bytes) -> bytes:
+    if encoding == 'br':
+        return brotli.decompress(compressed)
+    return gzip.decompress(compressed)
+
+
+def _content_digest(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+def _private_directory(path: str) -> bool:
+    """Create `path` owner-only, or check an existing one is ours and writable by no one else"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    getuid = getattr(os, 'getuid', None)
+    return (getuid is None or info.st_uid == getuid()) and not info.st_mode & 0o022
+
+
+def _accepted(accept_encoding: str) -> Dict[str, float]:
+    """Content codings from an Accept-Encoding header with their q-values"""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+@dataclass
+class Asset:
+    """One file, its content hash and its precompressed variants"""
+
+    name: str
+    path: str
+    size: int
+    mimetype: str
+    digest: str
+    variants: Dict[str, Tuple[str, int]] = field(default_factory=dict)  # encoding -> (path, size)
+
+    @property
+    def hashed_name(self) -> str:
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.digest}{ext}"
+
+    def etag(self, encoding: Optional[str]) -> str:
+        # Each encoding is its own representation, so it gets its own strong validator
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+    def describe(self) -> Dict:
+        return {
+            'hashed_name': self.hashed_name,
+            'bytes': self.size,
+            'variants': {encoding: size for encoding, (_, size) in self.variants.items()}
+        }
+
+
+@dataclass
+class AssetResponse:
+    """How to answer one asset request: 304 with headers, or 200 with the file to send"""
+
+    status: int
+    headers: Dict[str, str]
+    path: Optional[str] = None
+    mimetype: Optional[str] = None
+    size: int = 0
+
+
+class StaticAssets:
+    """The files of one directory, indexed (and compressed) once at startup
+
+    Requests are looked up in that index, so nothing outside the directory,
+    and nothing added after startup, can be served. Each file is available
+    under its plain name and under a content-hashed name that may be cached
+    forever.
+    """
+
+    def __init__(self, directory: str = STATIC_DIR, cache_dir: str = STATIC_CACHE_DIR,
+                 max_age: int = STATIC_MAX_AGE_S):
+        self.directory = os.path.realpath(directory)
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self._assets: Dict[str, Asset] = {}
+        self._hashed: Dict[str, Asset] = {}
+        self._cache_usable = False
+        self._lock = threading.Lock()
+        self._stats = {'served': 0, 'not_modified': 0, 'bytes_sent': 0,
+                       'encodings': {encoding: 0 for encoding in (*ENCODINGS, 'identity')}}
+
+    def build(self):
+        """Index the directory and write any missing compressed variants"""
+        try:
+            self._cache_usable = _private_directory(self.cache_dir)
+            reason = 'is shared with other users'
+        except OSError as e:
+            self._cache_usable, reason = False, f"is unavailable ({e})"
+        if not self._cache_usable:
+            logger.warning(f"Static cache directory {self.cache_dir} {reason}; serving uncompressed assets")
+        assets: Dict[str, Asset] = {}
+        for folder, dirs, files in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for filename in files:
+                path = os.path.join(folder, filename)
+                if filename.startswith('.') or not os.path.realpath(path).startswith(self.directory + os.sep):
+                    continue
+                asset = self._load(os.path.relpath(path, self.directory).replace(os.sep, '/'), path)
+                assets[asset.name] = asset
+        self._assets = assets
+        self._hashed = {asset.hashed_name: asset for asset in assets.values()}
+        logger.info(f"Indexed {len(assets)} static assets from {self.directory}")
+
+    def _load(self, name: str, path: str) -> Asset:
+        with open(path, 'rb') as asset_file:
+            raw = asset_file.read()
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        asset = Asset(name, path, len(raw), mimetype, _content_digest(raw))
+        if not self._cache_usable or len(raw) < COMPRESS_MIN_BYTES or not mimetype.startswith(COMPRESSIBLE_TYPES):
+            return asset
+        for encoding in ENCODINGS:
+            if encoding == 'br' and brotli is None:
+                continue
+            variant = os.path.join(self.cache_dir, f"{asset.digest}{_EXTENSIONS[encoding]}")
+            try:
+                if not self._reusable(variant, encoding, asset.digest):
+                    partial = f"{variant}.{os.getpid()}.tmp"
+                    with open(partial, 'wb') as variant_file:
+                        variant_file.write(_compress(encoding, raw))
+                    os.replace(partial, variant)
+                size = os.path.getsize(variant)
+            except OSError as e:
+                logger.warning(f"Could not write {encoding} variant of {name}: {e}")
+                continue
+            if size < len(raw):
+                asset.variants[encoding] = (variant, size)
+        return asset
+
+    @staticmethod
+    def _reusable(variant: str, encoding: str, digest: str) -> bool:
+        """Whether a variant left by an earlier run decompresses to exactly this content"""
+        try:
+            with open(variant, 'rb') as variant_file:
+                return _content_digest(_decompress(encoding, variant_file.read())) == digest
+        except FileNotFoundError:
+            return False
+        except Exception as e:  # truncated or foreign file; rewritten below
+            logger.warning(f"Discarding unusable {encoding} variant {variant}: {e}")
+            return False
+
+    def url_for(self, name: str) -> str:
+        """Content-hashed URL for `name`, safe to cache forever"""
+        return f"/assets/{self._assets[name].hashed_name}"
+
+    def _encoding(self, asset: Asset, accept_encoding: str) -> Optional[str]:
+        if not asset.variants or not accept_encoding:
+            return None
+        accepted = _accepted(accept_encoding)
+        best, best_q = None, 0.0
+        for encoding in ENCODINGS:
+            q = accepted.get(encoding, accepted.get('*', 0.0))
+            if encoding in asset.variants and q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def _cache_control(self, immutable: bool) -> str:
+        if immutable:
+            return IMMUTABLE_CACHE_CONTROL
+        return f"public, max-age={self.max_age}" if self.max_age > 0 else 'no-cache'
+
+    @staticmethod
+    def _matches(asset: Asset, if_none_match: str) -> bool:
+        """Whether the client already holds this content (in any encoding; caches key on Vary)"""
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag == '*':
+                return True
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag.strip('"').split('-')[0] == asset.digest:
+                return True
+        return False
+
+    def resolve(self, name: str, headers: Mapping[str, str]) -> Optional[AssetResponse]:
+        """Response plan for `name` (plain or content-hashed); None if it is not an indexed asset"""
+        asset, immutable = self._assets.get(name), False
+        if asset is None:
+            asset, immutable = self._hashed.get(name), True
+        if asset is None:
+            return None
+        encoding = self._encoding(asset, headers.get('Accept-Encoding') or '')
+        response_headers = {'ETag': asset.etag(encoding), 'Cache-Control': self._cache_control(immutable)}
+        if asset.variants:
+            response_headers['Vary'] = 'Accept-Encoding'
+        if self._matches(asset, headers.get('If-None-Match') or ''):
+            with self._lock:
+                self._stats['not_modified'] += 1
+            return AssetResponse(304, response_headers)
+        path, size = asset.variants[encoding] if encoding else (asset.path, asset.size)
+        if encoding:
+            response_headers['Content-Encoding'] = encoding
+        with self._lock:
+            self._stats['served'] += 1
+            self._stats['bytes_sent'] += size
+            self._stats['encodings'][encoding or 'identity'] += 1
+        return AssetResponse(200, response_headers, path, asset.mimetype, size)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {**self._stats, 'encodings': dict(self._stats['encodings'])}
+        return {
+            'directory': self.directory,
+            'brotli': brotli is not None,
+            **stats,
+            'assets': {name: asset.describe() for name, asset in sorted(self._assets.items())}
+        }
@@ -0,0 +1,185 @@
+"""
+PurpleBrain-AI Tenants
+Caller identification, per-tenant scheduling weights and concurrency caps, and per-tenant metrics
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Mapping, Optional
+
+from backend.hedging import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+TENANT_HEADER = 'X-Tenant-Id'
+API_KEY_HEADER = 'X-API-Key'
+DEFAULT_TENANT = 'anonymous'
+
+# JSON, e.g. {"acme": {"weight": 4, "max_concurrency": 8, "api_keys": ["..."]}, "default": {"weight": 1}}
+TENANTS_ENV_VAR = 'PURPLEBRAIN_TENANTS'
+
+# Throughput is reported over this trailing window
+THROUGHPUT_WINDOW_S = 60.0
+# Tenant ids come from clients, so metrics keep only the most recently active (tenant, agent) pairs
+TENANT_METRICS_MAX_ENTRIES = int(os.environ.get('PURPLEBRAIN_TENANT_METRICS_MAX') or 1024)
+
+_current: contextvars.ContextVar[str] = contextvars.ContextVar('purplebrain_tenant', default=DEFAULT_TENANT)
+
+
+def current() -> str:
+    return _current.get()
+
+
+@contextmanager
+def tenant_scope(tenant: str) -> Iterator[str]:
+    """Attribute everything run inside (including the conductor's sub-agent calls) to `tenant`"""
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+
+class TenantPolicy:
+    """Who a caller is, and how large a share of each agent they get"""
+
+    def __init__(self, tenants: Optional[Dict[str, Dict]] = None):
+        self.tenants: Dict[str, Dict] = {}
+        self._keys: Dict[str, str] = {}
+        self.load(tenants or {})
+
+    def load(self, tenants: Dict[str, Dict]):
+        self.tenants = {name: dict(settings) for name, settings in tenants.items()}
+        self._keys = {
+            key: name for name, settings in self.tenants.items() for key in settings.get('api_keys', ())
+        }
+
+    def configure_from_env(self, env_var: str = TENANTS_ENV_VAR):
+        raw = os.environ.get(env_var)
+        if not raw:
+            return
+        try:
+            self.load(json.loads(open(raw).read() if os.path.isfile(raw) else raw))
+        except (OSError, json.JSONDecodeError, AttributeError) as e:
+            logger.error(f"Invalid {env_var}: {e}")
+
+    def identify(self, headers: Mapping[str, str]) -> str:
+        """Tenant for a request: a known API key, else an opaque id per key, else the tenant header
+
+        The tenant header is only trustworthy behind a gateway that sets it;
+        API keys always take precedence.
+        """
+        api_key = headers.get(API_KEY_HEADER)
+        authorization = headers.get('Authorization') or ''
+        if not api_key and authorization.lower().startswith('bearer '):
+            api_key = authorization[7:].strip()
+        if api_key:
+            return self._keys.get(api_key) or f"key:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]}"
+        return (headers.get(TENANT_HEADER) or '').strip()[:64] or DEFAULT_TENANT
+
+    def _setting(self, tenant: str, name: str):
+        settings = self.tenants.get(tenant) or self.tenants.get('default') or {}
+        return settings.get(name)
+
+    def weight(self, tenant: str) -> float:
+        return max(0.01, float(self._setting(tenant, 'weight') or 1))
+
+    def max_concurrency(self, tenant: str) -> Optional[int]:
+        """Slots of any one agent the tenant may hold at once (None = no cap below the agent's own)"""
+        cap = self._setting(tenant, 'max_concurrency')
+        return max(1, int(cap)) if cap else None
+
+    def describe(self) -> Dict[str, Dict]:
+        """Configured weights and caps (never the API keys)"""
+        return {
+            name: {'weight': self.weight(name), 'max_concurrency': self.max_concurrency(name)}
+            for name in self.tenants
+        }
+
+
+class _TenantAgentStats:
+    """Outcome totals for one (tenant, agent)"""
+
+    def __init__(self):
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.latency = LatencyWindow()
+        self.queue_wait = LatencyWindow()
+        self._finished: deque = deque()
+
+    def finished(self, latency: float):
+        now = time.monotonic()
+        self.completed += 1
+        self.latency.add(latency)
+        self._finished.append(now)
+        self.throughput(now)  # keeps the window bounded between stats calls
+
+    def throughput(self, now: float) -> float:
+        while self._finished and now - self._finished[0] > THROUGHPUT_WINDOW_S:
+            self._finished.popleft()
+        return round(len(self._finished) / THROUGHPUT_WINDOW_S, 3)
+
+    def to_dict(self, now: float) -> Dict:
+        return {
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'throughput_per_s': self.throughput(now),
+            'p50_latency_s': self.latency.percentile(50),
+            'p95_latency_s': self.latency.percentile(95),
+            'p95_queue_wait_s': self.queue_wait.percentile(95)
+        }
+
+
+class TenantMetrics:
+    """Per-tenant, per-agent latency and throughput, for the `max_entries` most recently active pairs"""
+
+    def __init__(self, max_entries: int = TENANT_METRICS_MAX_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self._entries: 'OrderedDict[tuple, _TenantAgentStats]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, tenant: str, agent: str) -> _TenantAgentStats:
+        key = (tenant, agent)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _TenantAgentStats()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    def record(self, tenant: str, agent: str, queue_wait: float, latency: float, success: bool):
+        with self._lock:
+            entry = self._entry(tenant, agent)
+            entry.queue_wait.add(queue_wait)
+            if success:
+                entry.finished(latency)
+            else:
+                entry.failed += 1
+
+    def record_rejected(self, tenant: str, agent: str):
+        with self._lock:
+            self._entry(tenant, agent).rejected += 1
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        tenants: Dict[str, Dict] = {}
+        with self._lock:
+            for (tenant, agent), entry in sorted(self._entries.items()):
+                tenants.setdefault(tenant, {})[agent] = entry.to_dict(now)
+        return tenants
+
+
+tenant_policy = TenantPolicy()
+tenant_policy.configure_from_env()
+tenant_metrics = TenantMetrics()
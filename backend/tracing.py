@@ -0,0 +1,268 @@
+"""
+PurpleBrain-AI Tracing
+OpenTelemetry-compatible spans (W3C traceparent in, OTLP/JSON out) with head sampling
+"""
+
+import os
+import json
+import time
+import random
+import atexit
+import logging
+import threading
+import contextvars
+import urllib.request
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Share of new traces that are recorded; incoming traceparent headers keep their own sampling decision
+TRACE_SAMPLE_RATE = float(os.environ.get('PURPLEBRAIN_TRACE_SAMPLE_RATE', 0))
+# Spans go to a JSONL file (one OTLP/JSON export request per line) and/or an OTLP/HTTP collector
+TRACE_FILE = os.environ.get('PURPLEBRAIN_TRACE_FILE', '')
+TRACE_OTLP_ENDPOINT = os.environ.get('PURPLEBRAIN_TRACE_OTLP_ENDPOINT', '')  # e.g. http://localhost:4318/v1/traces
+SERVICE_NAME = os.environ.get('PURPLEBRAIN_SERVICE_NAME', 'purplebrain')
+
+TRACEPARENT_HEADER = 'traceparent'
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL_S = 2.0
+# Spans waiting for export beyond this are dropped rather than growing memory
+MAX_PENDING_SPANS = 8192
+
+# OTLP enum values
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+_current: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('purplebrain_span', default=None)
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict]:
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class _NoopSpan:
+    """Stands in for a span when the trace is not sampled; every call is free"""
+
+    recording = False
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def traceparent(self) -> Optional[str]:
+        return None
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """One timed operation; ended (and queued for export) when its `with` block exits"""
+
+    recording = True
+
+    def __init__(self, tracer: 'Tracer', name: str, trace_id: str, parent_id: Optional[str],
+                 kind: int = KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_UNSET
+        self.status_message = ''
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self._token = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def __enter__(self) -> 'Span':
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        _current.reset(self._token)
+        if exc is not None:
+            self.status = STATUS_ERROR
+            self.status_message = f"{exc_type.__name__}: {exc}"[:500]
+        self.end_ns = time.time_ns()
+        self.tracer.exporter.add(self)
+        return False
+
+    def to_otlp(self) -> Dict:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': _otlp_attributes(self.attributes),
+            'status': {'code': self.status, **({'message': self.status_message} if self.status_message else {})}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class SpanExporter:
+    """Batches ended spans on a background thread and writes them as OTLP/JSON"""
+
+    def __init__(self, path: str = TRACE_FILE, endpoint: str = TRACE_OTLP_ENDPOINT, service: str = SERVICE_NAME):
+        self.path = path
+        self.endpoint = endpoint
+        self.service = service
+        self._pending: deque = deque()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._stats = {'exported': 0, 'dropped': 0, 'failed_exports': 0}
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.path or self.endpoint)
+
+    def add(self, span: Span):
+        with self._lock:
+            if len(self._pending) >= MAX_PENDING_SPANS:
+                self._stats['dropped'] += 1
+                return
+            self._pending.append(span)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='purplebrain-trace-export', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        if len(self._pending) >= EXPORT_BATCH_SIZE:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(EXPORT_INTERVAL_S)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._export_lock:
+            while True:
+                with self._lock:
+                    spans = [self._pending.popleft() for _ in range(min(EXPORT_BATCH_SIZE, len(self._pending)))]
+                if not spans:
+                    return
+                self._export(spans)
+
+    def _export(self, spans: List[Span]):
+        body = json.dumps({'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': self.service})},
+            'scopeSpans': [{'scope': {'name': 'purplebrain'}, 'spans': [span.to_otlp() for span in spans]}]
+        }]}, separators=(',', ':'), default=str)
+        try:
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as trace_file:
+                    trace_file.write(body + '\n')
+            if self.endpoint:
+                request = urllib.request.Request(self.endpoint, data=body.encode('utf-8'), method='POST',
+                                                 headers={'Content-Type': 'application/json'})
+                urllib.request.urlopen(request, timeout=5).close()
+        except OSError as e:
+            with self._lock:
+                self._stats['failed_exports'] += 1
+            logger.warning(f"Trace export of {len(spans)} spans failed: {e}")
+            return
+        with self._lock:
+            self._stats['exported'] += len(spans)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self._stats, 'pending': len(self._pending)}
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """(trace_id, parent span id, sampled) from a W3C traceparent header, or None if it is invalid"""
+    parts = (header or '').strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class Tracer:
+    """Head-sampled tracer; without a sampled root span, span() costs one contextvar lookup"""
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, exporter: Optional[SpanExporter] = None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter or SpanExporter()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter.configured
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, kind: int = KIND_SERVER,
+                    **attributes) -> Any:
+        """Root span for an API request (a child if a span is already current, e.g. nested scopes)"""
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current.get()
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id, kind, attributes)
+        incoming = parse_traceparent(traceparent)
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled:
+            return NOOP_SPAN
+        return Span(self, name, trace_id, parent_id, kind, attributes)
+
+    def span(self, name: str, kind: int = KIND_INTERNAL, **attributes) -> Any:
+        """Child of the current span; a no-op outside a sampled trace"""
+        parent = _current.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, kind, attributes)
+
+    def current(self) -> Any:
+        return _current.get() or NOOP_SPAN
+
+    def stats(self) -> Dict:
+        return {'enabled': self.enabled, 'sample_rate': self.sample_rate,
+                'file': self.exporter.path or None, 'otlp_endpoint': self.exporter.endpoint or None,
+                **self.exporter.stats()}
+
+
+tracer = Tracer()
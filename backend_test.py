@@ -7,17 +7,19 @@ import os
 from datetime import datetime
 
 class PurpleBrainAPITester:
-    def __init__(self, base_url=None):
+    def __init__(self, base_url=None, workspace_url=None):
         # Get the backend URL from environment or use default
         self.base_url = base_url or os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001')
+        # The Flask server that serves the workspace UI
+        self.workspace_url = workspace_url or os.environ.get('PURPLEBRAIN_WORKSPACE_URL', 'http://localhost:8000')
         print(f"Using backend URL: {self.base_url}")
         self.tests_run = 0
         self.tests_passed = 0
         self.test_results = []
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, headers=None):
+    def run_test(self, name, method, endpoint, expected_status, data=None, headers=None, body=None, base_url=None):
         """Run a single API test"""
-        url = f"{self.base_url}/{endpoint}"
+        url = f"{base_url or self.base_url}/{endpoint}"
         default_headers = {'Content-Type': 'application/json'}
         
         if headers:
@@ -29,8 +31,12 @@ class PurpleBrainAPITester:
         try:
             if method == 'GET':
                 response = requests.get(url, headers=default_headers)
+            elif method == 'POST' and body is not None:
+                response = requests.post(url, data=body, headers=default_headers)
             elif method == 'POST':
                 response = requests.post(url, json=data, headers=default_headers)
+            elif method == 'DELETE':
+                response = requests.delete(url, headers=default_headers)
             
             success = response.status_code == expected_status
             
@@ -68,6 +74,23 @@ class PurpleBrainAPITester:
             })
             return False, None
 
+    def check(self, name, passed, detail=None):
+        """Record a check on a response body as a test of its own"""
+        self.tests_run += 1
+        print(f"\n🔍 Checking {name}...")
+        if passed:
+            self.tests_passed += 1
+            print("✅ Passed")
+        else:
+            print(f"❌ Failed - {detail}")
+        
+        self.test_results.append({
+            "name": name,
+            "success": passed,
+            "detail": detail
+        })
+        return passed
+
     def test_root_endpoint(self):
         """Test the root endpoint"""
         return self.run_test(
@@ -121,13 +144,41 @@ class PurpleBrainAPITester:
             }
         }
         
-        return self.run_test(
+        success, response = self.run_test(
             "Research Agent",
             "POST",
             "api/agent/research",
             200,
             data=data
         )
+        if success:
+            accounting = response.json().get('accounting')
+            self.check(
+                "Research Agent (resource accounting)",
+                bool(accounting) and accounting.get('cpu_ms') is not None and 'accounting' in response.json()['result'],
+                f"Missing resource accounting: {accounting}"
+            )
+        return success, response
+
+    def test_workspace_research(self):
+        """Test the research agent with the body the workspace UI sends"""
+        query = "Research market trends in AI platforms"
+        data = {
+            "query": query,
+            "content": query,
+            "style": "professional",
+            "audience": "general",
+            "data": {"query": query}
+        }
+        
+        return self.run_test(
+            "Research Agent (workspace UI)",
+            "POST",
+            "api/agent/research",
+            200,
+            data=data,
+            base_url=self.workspace_url
+        )
 
     def test_code_agent(self):
         """Test the code agent endpoint"""
@@ -150,6 +201,104 @@ class PurpleBrainAPITester:
             data=data
         )
 
+    def test_dataset_upload(self):
+        """Test streaming a CSV dataset and visualizing it by reference"""
+        def csv_chunks():
+            yield b"month,revenue,region\n"
+            for month in range(1, 13):
+                yield f"{month},{month * 1000.5},{'north' if month % 2 else 'south'}\n".encode()
+        
+        success, response = self.run_test(
+            "Dataset Upload",
+            "POST",
+            "api/datasets?name=revenue",
+            200,
+            headers={'Content-Type': 'text/csv'},
+            body=csv_chunks()
+        )
+        if not success:
+            return success, response
+        
+        dataset_id = response.json()['dataset_id']
+        self.run_test(
+            "Visualization Agent (dataset)",
+            "POST",
+            "api/agent/visualization",
+            200,
+            data={"query": "Revenue by month", "data": {"dataset_id": dataset_id}}
+        )
+        return self.run_test(
+            "Dataset Delete",
+            "DELETE",
+            f"api/datasets/{dataset_id}",
+            200
+        )
+
+    def test_execution_history(self):
+        """Test paging through execution logs after the agent runs"""
+        success, response = self.run_test(
+            "Execution History",
+            "GET",
+            "api/history/logs?agent=code&limit=1",
+            200
+        )
+        if success and response.json().get('next_cursor'):
+            self.run_test(
+                "Execution History (next page)",
+                "GET",
+                f"api/history/logs?agent=code&limit=1&cursor={response.json()['next_cursor']}",
+                200
+            )
+        return self.run_test(
+            "Execution Stats",
+            "GET",
+            "api/history/stats?group_by=status",
+            200
+        )
+
+    def test_batch_execution(self):
+        """Test running several agent tasks in one NDJSON-streamed batch"""
+        data = {
+            "items": [
+                {"agent": "research", "task": {"query": f"Batch research topic {i}"}, "id": f"research-{i}"}
+                for i in range(3)
+            ] + [{"agent": "nonexistent", "task": {"query": "This item should fail"}}],
+            "concurrency": 2
+        }
+        
+        success, response = self.run_test(
+            "Batch Execution",
+            "POST",
+            "api/agents/batch",
+            200,
+            data=data
+        )
+        if success:
+            lines = [json.loads(line) for line in response.text.splitlines() if line]
+            summary = lines[-1] if lines else {}
+            self.check(
+                "Batch Execution (summary)",
+                summary.get('total') == 4 and summary.get('failed') == 1,
+                f"Unexpected batch summary: {summary}"
+            )
+        return success, response
+
+    def test_unknown_priority(self):
+        """Test that an unknown priority class is rejected before admission"""
+        data = {
+            "query": "Priority check",
+            "options": {"priority": "urgent"},
+            "data": {}
+        }
+        
+        return self.run_test(
+            "Unknown Priority",
+            "POST",
+            "api/agent/research",
+            400,
+            data=data
+        )
+
     def test_nonexistent_agent(self):
         """Test a nonexistent agent endpoint"""
         data = {
@@ -177,7 +326,12 @@ class PurpleBrainAPITester:
         # Agent tests
         self.test_visualization_agent()
         self.test_research_agent()
+        self.test_workspace_research()
         self.test_code_agent()
+        self.test_dataset_upload()
+        self.test_execution_history()
+        self.test_batch_execution()
+        self.test_unknown_priority()
         self.test_nonexistent_agent()
         
         # Print summary
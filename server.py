@@ -7,13 +7,33 @@ Built with Flask and Socket.IO for real-time agent communication
 import os
 import asyncio
 import logging
+import threading
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 from dotenv import load_dotenv
 import openai
 
+from backend.registry import AgentRegistry, AgentBusyError
+from backend.admission import AdmissionController, Overloaded, parse_priority
+from backend.tenants import tenant_metrics, tenant_policy, tenant_scope
+from backend.loop_watchdog import loop_watchdog
+from backend.tracing import KIND_CLIENT, TRACEPARENT_HEADER, tracer
+from backend.analysis import segment_claims, score_claims
+from backend.payloads import payload_store, to_wire
+from backend.llm import LLM_UPSTREAM, chat_completion
+from backend.hedging import hedger
+from backend.model_router import model_router
+from backend.prompts import PromptBudget
+from backend.memo import memoized_stage, mark_degraded, independent, stage_memo
+from backend.resilience import Served, breakers, last_good, resilience_stats
+from backend.semantic_cache import semantic_cache
+from backend.memory_store import AgentMemory, memory_store, task_text
+from backend.static_assets import StaticAssets
+from backend import accounting, deadlines
+from backend.deadlines import DeadlineExceeded, RequestCancelled
+
 # Load environment variables
 load_dotenv()
 
@@ -21,12 +41,17 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app
+# Initialize Flask app; static files come only from the asset directory (see /assets below)
 app = Flask(__name__, 
            template_folder='.',
-           static_folder='.',
-           static_url_path='')
+           static_folder=None)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'purplebrain_secret_key')
+# Behind nginx or Apache, let the proxy send asset files itself
+app.config['USE_X_SENDFILE'] = os.environ.get('PURPLEBRAIN_STATIC_X_SENDFILE', '0') == '1'
+
+# Workspace UI files, compressed once at startup
+static_assets = StaticAssets()
+static_assets.build()
 
 # Enable CORS
 CORS(app)
@@ -45,7 +70,8 @@ class PurpleBrainAgent:
         self.persona = persona
         self.capabilities = capabilities
         self.active_tasks = {}
-        self.memory = []
+        # Persistent, searchable results (SQLite + FTS5) shared across restarts
+        self.memory = AgentMemory(memory_store, name)
     
     async def process(self, task, context=None):
         """Process a task using this agent's capabilities"""
@@ -59,9 +85,11 @@ class PurpleBrainAgent:
         
         try:
             result = await self._execute_task(task, context)
+            # Resources this run used (sub-agents included) travel with the result and into memory
+            result = {**result, 'accounting': accounting.snapshot()}
             self.active_tasks[task_id]['status'] = 'completed'
             self.active_tasks[task_id]['result'] = result
-            self.memory.append({'task': task, 'result': result, 'timestamp': datetime.now()})
+            await accounting.to_thread(self.memory.remember, task, result)
             return result
         except Exception as e:
             logger.error(f"Error in {self.name}: {str(e)}")
@@ -73,6 +101,12 @@ class PurpleBrainAgent:
         """Override this method in each agent subclass"""
         raise NotImplementedError
 
+# Circuit breaker name for the search backend
+SEARCH_UPSTREAM = 'exa'
+
+RESEARCH_SYSTEM_PROMPT = "You are a Nobel laureate researcher with expertise across all fields."
+WRITING_SYSTEM_PROMPT = "You are a master wordsmith with expertise in linguistic code-switching and professional writing."
+
 class ResearchAgent(PurpleBrainAgent):
     """Nobel laureate-level research agent powered by Exa.ai"""
     
@@ -86,25 +120,45 @@ class ResearchAgent(PurpleBrainAgent):
     
     async def _execute_task(self, task, context):
         """Execute research task using Exa.ai and advanced analysis"""
+        # The workspace UI sends a JSON object; searches, prompts and cache keys use its query text
+        query = task_text(task)
         
-        # Simulate Exa API call (replace with actual API when available)
-        research_results = await self._search_with_exa(task)
+        # Simulate Exa API call (replace with actual API when available); behind its own circuit breaker
+        search = await last_good.serve(
+            f"search:{query}",
+            lambda: breakers.get(SEARCH_UPSTREAM).call(self._search_with_exa, query),
+            upstream=SEARCH_UPSTREAM
+        )
+        research_results = search.value
         
-        # Synthesize findings using OpenAI
-        synthesis = await self._synthesize_research(task, research_results)
+        # Synthesize findings using OpenAI (model chosen by the router)
+        route = model_router.route('research_synthesis', query)
+        # A re-research after a failed fact check must not be answered from the rejected synthesis
+        fresh = isinstance(task, dict) and task.get('fresh') is True
+        synthesis = await self._synthesize_research(query, research_results, route, fresh=fresh)
         
         return {
             'agent': self.name,
             'query': task,
             'raw_results': research_results,
-            'synthesis': synthesis,
+            'synthesis': synthesis.value,
             'sources_count': len(research_results.get('sources', [])),
             'confidence_score': 0.85,
+            'synthesis_route': route.to_dict(),
+            'freshness': {'search': search.freshness(), 'synthesis': synthesis.freshness()},
             'timestamp': datetime.now().isoformat()
         }
     
     async def _search_with_exa(self, query):
         """Search using Exa.ai API (simulated for now)"""
+        with tracer.span('search.exa', KIND_CLIENT, **{'search.query_chars': len(str(query))}) as span:
+            accounting.count_upstream(SEARCH_UPSTREAM)
+            results = await self._exa_results(query)
+            span.set('search.results', len(results.get('sources', [])))
+            return results
+    
+    async def _exa_results(self, query):
+        """Simulated Exa.ai response"""
         # This would be the actual Exa API call
         # For now, returning structured mock data
         return {
@@ -132,14 +186,49 @@ class ResearchAgent(PurpleBrainAgent):
             'search_time': 0.45
         }
     
-    async def _synthesize_research(self, query, results):
-        """Synthesize research findings using AI"""
-        sources_text = "\n".join([
-            f"Source {i+1}: {source['title']}\n{source['snippet']}"
-            for i, source in enumerate(results.get('sources', []))
-        ])
+    async def _synthesize_research(self, query, results, route=None, fresh=False):
+        """Synthesize research findings using AI (`fresh`: bypass the semantic cache and past findings)"""
+        route = route or model_router.route('research_synthesis', query)
+        budget = PromptBudget.for_route(route, RESEARCH_SYSTEM_PROMPT, self._research_prompt(query, ''))
         
-        prompt = f"""
+        # Earlier syntheses on related questions, so findings build on each other
+        past_findings = None if fresh else await accounting.to_thread(self.memory.context_for, query)
+        if past_findings:
+            past_findings = budget.fit_text(past_findings, query, share=0.25)
+        
+        # Most relevant sources first; the tail is truncated or dropped to stay within budget
+        sources = results.get('sources', [])
+        _, snippets = budget.fit_ranked(
+            [f"{source['title']}\n{source['snippet']}" for source in sources], query
+        )
+        sources_text = "\n".join(f"Source {i+1}: {snippet}" for i, snippet in enumerate(snippets))
+        if past_findings:
+            sources_text += f"\n\nRelevant past findings:\n{past_findings}"
+        prompt = self._research_prompt(query, sources_text)
+        
+        try:
+            # While OpenAI is failing, the last good synthesis for this query is served at once, flagged stale
+            return await last_good.serve(
+                f"research_synthesis:{query}",
+                lambda: chat_completion(
+                    RESEARCH_SYSTEM_PROMPT,
+                    prompt,
+                    cache_key=query,
+                    cache_scope='research_synthesis',
+                    cache=None if fresh else semantic_cache,
+                    route=route
+                ),
+                upstream=LLM_UPSTREAM
+            )
+        except deadlines.ABANDONED:
+            raise
+        except Exception as e:
+            logger.error(f"OpenAI API error: {e}")
+            mark_degraded()
+            return Served(f"Research synthesis for '{query}' completed with {len(results.get('sources', []))} sources analyzed.")
+    
+    def _research_prompt(self, query, sources_text):
+        return f"""
         As a Nobel laureate-level researcher, synthesize the following research on "{query}":
         
         {sources_text}
@@ -152,21 +241,6 @@ class ResearchAgent(PurpleBrainAgent):
         
         Be thorough but concise. Maintain academic rigor.
         """
-        
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a Nobel laureate researcher with expertise across all fields."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1500,
-                temperature=0.3
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            logger.error(f"OpenAI API error: {e}")
-            return f"Research synthesis for '{query}' completed with {len(results.get('sources', []))} sources analyzed."
 
 class FactCheckAgent(PurpleBrainAgent):
     """Truth guardian agent for combating AI hallucinations"""
@@ -181,14 +255,18 @@ class FactCheckAgent(PurpleBrainAgent):
     async def _execute_task(self, task, context):
         """Execute fact-checking task"""
         content_to_check = task.get('content', '')
+        sources = task.get('sources', [])
         
         # Extract claims
         claims = await self._extract_claims(content_to_check)
         
+        # Score claims against the supplied sources (CPU-bound, runs in the process pool)
+        support = await score_claims(claims, sources) if claims and sources else [None] * len(claims)
+        
         # Verify each claim
         verified_claims = []
-        for claim in claims:
-            verification = await self._verify_claim(claim)
+        for claim, claim_support in zip(claims, support):
+            verification = await self._verify_claim(claim, claim_support, len(sources))
             verified_claims.append(verification)
         
         # Calculate overall accuracy score
@@ -206,13 +284,24 @@ class FactCheckAgent(PurpleBrainAgent):
     
     async def _extract_claims(self, content):
         """Extract factual claims from content"""
-        # Simplified claim extraction
-        sentences = content.split('.')
-        claims = [sentence.strip() for sentence in sentences if len(sentence.strip()) > 20]
-        return claims[:5]  # Limit to first 5 claims for demo
+        # Sentence segmentation runs in the process pool; first 5 claims for demo
+        return await segment_claims(content, limit=5)
     
-    async def _verify_claim(self, claim):
+    async def _verify_claim(self, claim, support=None, sources_count=0):
         """Verify a single claim"""
+        if support is not None:
+            # Cross-reference against the supplied sources
+            accuracy = min(0.99, 0.5 + support['similarity'])
+            return {
+                'claim': claim,
+                'accuracy': accuracy,
+                'sources_checked': sources_count,
+                'best_source_index': support['reference_index'],
+                'similarity': support['similarity'],
+                'verification_method': 'tfidf_cross_reference',
+                'flags': [] if accuracy > 0.8 else ['low_confidence']
+            }
+        
         # Simulate fact-checking process
         import random
         accuracy = random.uniform(0.6, 0.95)  # Simulate accuracy score
@@ -269,9 +358,26 @@ class WritingAgent(PurpleBrainAgent):
             'timestamp': datetime.now().isoformat()
         }
     
+    @memoized_stage('writing.code_switching', depends_on=('content', 'style', 'audience'))
     async def _apply_code_switching(self, content, style, audience):
         """Apply linguistic code-switching based on style and audience"""
-        prompt = f"""
+        route = model_router.route('code_switching', content)
+        # Oversized content (e.g. a long upstream synthesis) is compacted to its key sentences
+        budget = PromptBudget.for_route(route, WRITING_SYSTEM_PROMPT, self._writing_prompt('', style, audience))
+        prompt = self._writing_prompt(budget.fit_text(content, f"{style} {audience}"), style, audience)
+        
+        try:
+            # Async gateway call: cancellable and bounded by the request deadline; short content routes to a faster model
+            return await chat_completion(WRITING_SYSTEM_PROMPT, prompt, route=route)
+        except deadlines.ABANDONED:
+            raise
+        except Exception as e:
+            logger.error(f"Writing enhancement error: {e}")
+            mark_degraded()
+            return f"Enhanced version of: {content}"
+    
+    def _writing_prompt(self, content, style, audience):
+        return f"""
         As a gifted code-switcher with NYT and New Yorker caliber writing skills, enhance this content:
         
         Original: {content}
@@ -281,21 +387,6 @@ class WritingAgent(PurpleBrainAgent):
         
         Apply appropriate code-switching techniques while maintaining authenticity and accessibility.
         """
-        
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a master wordsmith with expertise in linguistic code-switching and professional writing."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.7
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            logger.error(f"Writing enhancement error: {e}")
-            return f"Enhanced version of: {content}"
     
     async def _analyze_style(self, content, target_style):
         """Analyze the style characteristics of the content"""
@@ -375,6 +466,11 @@ class VisionaryAgent(PurpleBrainAgent):
             'output_formats': ['3D interactive', 'mixed media', 'sculptural']
         }
 
+# Conductor fact-check gate: downstream stages only ever see research at or above this accuracy
+FACTCHECK_MIN_ACCURACY = float(os.environ.get('PURPLEBRAIN_FACTCHECK_MIN_ACCURACY', 0.7))
+CONDUCTOR_MAX_RERESEARCH = int(os.environ.get('PURPLEBRAIN_CONDUCTOR_MAX_RERESEARCH', 1))
+CONDUCTOR_SPECULATIVE = os.environ.get('PURPLEBRAIN_CONDUCTOR_SPECULATIVE', '1') == '1'
+
 class ConductorAgent(PurpleBrainAgent):
     """Orchestrator agent for multi-agent symphonies"""
     
@@ -384,12 +480,6 @@ class ConductorAgent(PurpleBrainAgent):
             persona="AI Symphony Conductor",
             capabilities=["workflow_orchestration", "agent_coordination", "task_delegation", "result_synthesis"]
         )
-        self.agents = {
-            'research': ResearchAgent(),
-            'factcheck': FactCheckAgent(),
-            'writing': WritingAgent(),
-            'visionary': VisionaryAgent()
-        }
     
     async def _execute_task(self, task, context):
         """Execute orchestrated multi-agent workflow"""
@@ -397,33 +487,73 @@ class ConductorAgent(PurpleBrainAgent):
         query = task.get('query', '')
         
         results = {}
+        gate = None
         
         if workflow_type == 'full_analysis':
-            # Research phase
-            research_result = await self.agents['research'].process(query)
-            results['research'] = research_result
+            speculative = task.get('speculative', CONDUCTOR_SPECULATIVE)
+            presentation = {
+                'style': task.get('style', 'professional'),
+                'audience': task.get('audience', 'general'),
+                'visual_style': task.get('visual_style', 'soulful')
+            }
+            downstream = {}
+            computed = False
             
-            # Fact-check phase
-            factcheck_task = {'content': research_result.get('synthesis', '')}
-            factcheck_result = await self.agents['factcheck'].process(factcheck_task)
-            results['factcheck'] = factcheck_result
+            async def verify():
+                nonlocal downstream, computed
+                computed = True
+                research_result = await agents.run('research', query)
+                gate = {'threshold': FACTCHECK_MIN_ACCURACY, 'speculative': speculative, 'attempts': []}
+                
+                for attempt in range(CONDUCTOR_MAX_RERESEARCH + 1):
+                    # Writing and visualization start alongside the fact check and are
+                    # thrown away if the research does not pass it
+                    downstream = self._start_downstream(research_result, presentation) if speculative else {}
+                    try:
+                        factcheck_result = await agents.run('factcheck', self._factcheck_task(research_result))
+                    except BaseException:
+                        await self._discard_downstream(downstream, 'fact check failed')
+                        raise
+                    accuracy = factcheck_result.get('overall_accuracy', 0)
+                    gate['attempts'].append({'attempt': attempt + 1, 'overall_accuracy': accuracy})
+                    synthesis_route = research_result.get('synthesis_route')
+                    if synthesis_route:
+                        # Fact-check accuracy is the quality signal for the synthesis model
+                        model_router.record_quality('research_synthesis', synthesis_route['model'], accuracy)
+                    if accuracy >= FACTCHECK_MIN_ACCURACY:
+                        break
+                    await self._discard_downstream(downstream, f"accuracy {accuracy:.2f} below gate")
+                    downstream = {}
+                    if attempt < CONDUCTOR_MAX_RERESEARCH:
+                        # Re-research, bypassing the semantic cache so the rejected synthesis is not replayed
+                        research_result = await agents.run('research', {
+                            'query': self._reresearch_query(query, factcheck_result), 'fresh': True
+                        })
+                
+                gate['passed'] = accuracy >= FACTCHECK_MIN_ACCURACY
+                return {'research': research_result, 'factcheck': factcheck_result, 'gate': gate}
             
-            # Writing phase
-            writing_task = {
-                'content': research_result.get('synthesis', ''),
-                'style': 'professional',
-                'audience': 'general'
-            }
-            writing_result = await self.agents['writing'].process(writing_task)
-            results['writing'] = writing_result
+            # Research and the fact-check gate depend on the query alone, so a re-run
+            # that only changes style or audience goes straight to the writer
+            verified = await stage_memo.run('conductor.verified_research', {
+                'query': query,
+                'threshold': FACTCHECK_MIN_ACCURACY,
+                'max_reresearch': CONDUCTOR_MAX_RERESEARCH
+            }, verify)
             
-            # Visualization phase
-            viz_task = {
-                'data': research_result,
-                'style': 'soulful'
-            }
-            viz_result = await self.agents['visionary'].process(viz_task)
-            results['visualization'] = viz_result
+            research_result, gate = verified['research'], verified['gate']
+            results['research'] = research_result
+            results['factcheck'] = verified['factcheck']
+            gate['memoized'] = not computed
+            gate['speculation_used'] = bool(downstream)
+            
+            if gate['passed']:
+                downstream = downstream or self._start_downstream(research_result, presentation)
+                results.update(await self._finish_downstream(downstream))
+            else:
+                # Low-accuracy content never reaches the writer
+                logger.info(f"Conductor gate withheld writing for '{query}' "
+                            f"(accuracy {results['factcheck'].get('overall_accuracy', 0):.2f})")
         
         # Synthesize final output
         final_synthesis = await self._synthesize_workflow_results(results)
@@ -433,11 +563,64 @@ class ConductorAgent(PurpleBrainAgent):
             'workflow_type': workflow_type,
             'query': query,
             'agent_results': results,
+            'factcheck_gate': gate,
             'final_synthesis': final_synthesis,
             'execution_time': 'simulated_fast',
             'timestamp': datetime.now().isoformat()
         }
     
+    def _factcheck_task(self, research_result):
+        return {
+            'content': research_result.get('synthesis', ''),
+            'sources': [
+                f"{source.get('title', '')}. {source.get('snippet', '')}"
+                for source in research_result.get('raw_results', {}).get('sources', [])
+            ]
+        }
+    
+    def _reresearch_query(self, query, factcheck_result):
+        """Ask again, pointing research at the claims that failed verification"""
+        flagged = [
+            claim['claim'] for claim in factcheck_result.get('verified_claims', [])
+            if 'low_confidence' in claim.get('flags', [])
+        ]
+        if not flagged:
+            return f"{query} (primary sources only)"
+        return f"{query} (verify with primary sources: {'; '.join(flagged[:3])})"
+    
+    def _start_downstream(self, research_result, presentation):
+        """Launch writing and visualization on the research synthesis"""
+        writing_task = {
+            'content': research_result.get('synthesis', ''),
+            'style': presentation['style'],
+            'audience': presentation['audience']
+        }
+        viz_task = {
+            'data': research_result,
+            'style': presentation['visual_style']
+        }
+        # Branches have their own memoized stages; a fallback in them must not un-memoize the research
+        with independent():
+            return {
+                'writing': deadlines.start_branch(agents.run('writing', writing_task)),
+                'visualization': deadlines.start_branch(agents.run('visionary', viz_task))
+            }
+    
+    async def _finish_downstream(self, downstream):
+        try:
+            outputs = await asyncio.gather(*(running for running, _ in downstream.values()))
+        except BaseException:
+            await self._discard_downstream(downstream, 'sibling stage failed')
+            raise
+        return dict(zip(downstream, outputs))
+    
+    async def _discard_downstream(self, downstream, reason):
+        for running, branch in downstream.values():
+            if not running.done():
+                await deadlines.abandon_branch(running, branch, reason)
+            elif not running.cancelled():
+                running.exception()  # retrieved, so a failed discarded stage is not reported as unhandled
+    
     async def _synthesize_workflow_results(self, results):
         """Synthesize results from all agents into cohesive output"""
         return {
@@ -449,48 +632,112 @@ class ConductorAgent(PurpleBrainAgent):
             'overall_rating': 0.92
         }
 
-# Initialize agents
-agents = {
-    'research': ResearchAgent(),
-    'factcheck': FactCheckAgent(),
-    'writing': WritingAgent(),
-    'visionary': VisionaryAgent(),
-    'conductor': ConductorAgent()
-}
+# Register agents - built on first use, each with its own concurrency budget.
+# The conductor delegates through this registry, so its sub-agent calls share
+# the same limits as direct requests.
+agents = AgentRegistry()
+agents.register('research', ResearchAgent, max_concurrency=16, max_queue=128)
+agents.register('factcheck', FactCheckAgent, executor='thread', max_concurrency=4, max_queue=64)
+agents.register('writing', WritingAgent, max_concurrency=16, max_queue=128)
+agents.register('visionary', VisionaryAgent, executor='thread', max_concurrency=4, max_queue=64)
+agents.register('conductor', ConductorAgent, max_concurrency=4, max_queue=16)
+agents.discover()
+agents.configure_from_env()
+# Direct requests only; the conductor's sub-agent calls belong to an already admitted request
+admission = AdmissionController(agents)
+
+def _send_asset(name):
+    """Precompressed asset with ETag revalidation; the file itself goes out via the server's sendfile path"""
+    served = static_assets.resolve(name, request.headers)
+    if served is None:
+        return jsonify({'error': 'Not found'}), 404
+    if served.status == 304:
+        return '', 304, served.headers
+    response = send_file(served.path, mimetype=served.mimetype, conditional=False, etag=False)
+    response.headers.update(served.headers)
+    return response
 
 @app.route('/')
 def index():
     """Serve the main PurpleBrain interface"""
-    return app.send_static_file('app.html')
+    return _send_asset('app.html')
+
+@app.route('/assets/<path:name>')
+def get_asset(name):
+    """Files from the asset directory, by plain or content-hashed name"""
+    return _send_asset(name)
 
 @app.route('/api/agent/<agent_name>', methods=['POST'])
 def activate_agent(agent_name):
-    """Activate a specific agent with a task"""
+    """Activate a specific agent with a task (options.priority decides who is shed under overload)"""
     if agent_name not in agents:
         return jsonify({'error': f'Agent {agent_name} not found'}), 404
     
     task_data = request.json
-    agent = agents[agent_name]
+    options = task_data.get('options') if isinstance(task_data, dict) else None
+    try:
+        deadline_ms = deadlines.parse_deadline_ms(request.headers.get(deadlines.DEADLINE_HEADER), options)
+        priority = parse_priority(options)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    try:
+        admission.admit(agent_name, priority, deadline_ms)
+    except Overloaded as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503, {'Retry-After': str(e.retry_after)}
+    # Large data columns are stored once and passed between agents by reference
+    payloads = []
     
     try:
-        # Run async task in sync context
+        if isinstance(task_data, dict) and isinstance(task_data.get('data'), dict):
+            task_data['data'] = payload_store.wrap(task_data['data'], payloads)
+        
+        # Run async task in sync context; the deadline covers every sub-agent and LLM call
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(agent.process(task_data))
-        loop.close()
+        try:
+            tenant = tenant_policy.identify(request.headers)
+            with deadlines.request_scope(deadline_ms), tenant_scope(tenant), tracer.start_trace(
+                'POST /api/agent/<agent_name>', request.headers.get(TRACEPARENT_HEADER), **{
+                    'http.method': 'POST', 'http.route': '/api/agent/<agent_name>', 'agent.name': agent_name,
+                    'tenant': tenant, 'http.request_content_length': request.content_length
+                }
+            ) as root, accounting.usage_scope() as usage:
+                trace_header = root.traceparent()
+                result = loop.run_until_complete(
+                    loop_watchdog.monitored(agents.run(agent_name, task_data), 'flask-request')
+                )
+        finally:
+            loop.close()
         
         return jsonify({
             'success': True,
             'agent': agent_name,
-            'result': result
-        })
+            'result': to_wire(result),
+            'accounting': usage.to_dict()
+        }), 200, ({TRACEPARENT_HEADER: trace_header} if trace_header else {})
     
+    except AgentBusyError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503, {'Retry-After': str(admission.retry_after(agent_name))}
+    except DeadlineExceeded as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 504
     except Exception as e:
         logger.error(f"Error processing task for {agent_name}: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
+    
+    finally:
+        payload_store.release(payloads)
 
 @app.route('/api/agents/status')
 def get_agents_status():
@@ -502,35 +749,113 @@ def get_agents_status():
             'persona': agent.persona,
             'capabilities': agent.capabilities,
             'active_tasks': len(agent.active_tasks),
-            'memory_size': len(agent.memory)
+            'memory_size': len(agent.memory),
+            'runtime': agents.stats(name),
+            'admission': admission.stats(name)
         }
     return jsonify(status)
 
+@app.route('/api/agent/<agent_name>/memory')
+def search_agent_memory(agent_name):
+    """Past results of an agent, most relevant to ?q= (or most recent without it)"""
+    if agent_name not in agents:
+        return jsonify({'error': f'Agent {agent_name} not found'}), 404
+    
+    memory = agents[agent_name].memory
+    limit = min(request.args.get('k', 5, type=int), 50)
+    query = request.args.get('q')
+    results = memory.recall(query, k=limit) if query else memory_store.recent(memory.agent, limit)
+    return jsonify({'agent': agent_name, 'total': len(memory), 'results': results})
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """Semantic LLM cache hit rate and size, plus stage memoization"""
+    stats = semantic_cache.stats() if semantic_cache is not None else {'enabled': False}
+    return jsonify({**stats, 'stage_memo': stage_memo.stats()})
+
+@app.route('/api/loop/stats')
+def get_loop_stats():
+    """Event-loop lag histograms and the call sites that blocked a loop for longest"""
+    return jsonify(loop_watchdog.stats(min(request.args.get('limit', 20, type=int), 100)))
+
+@app.route('/api/tracing/stats')
+def get_tracing_stats():
+    """Sampling rate, export target and exported / dropped span counts"""
+    return jsonify(tracer.stats())
+
+@app.route('/api/tenants/stats')
+def get_tenant_stats():
+    """Per-tenant latency and throughput for each agent, plus configured weights and caps"""
+    return jsonify({'tenants': tenant_metrics.stats(), 'policy': tenant_policy.describe()})
+
+@app.route('/api/static/stats')
+def get_static_stats():
+    """Indexed assets with their compressed sizes, and responses by encoding"""
+    return jsonify(static_assets.stats())
+
+@app.route('/api/llm/stats')
+def get_llm_stats():
+    """Upstream LLM latency, hedging, per-stage routing outcomes and circuit breakers"""
+    return jsonify({**hedger.stats(), 'routing': model_router.stats(), **resilience_stats()})
+
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
     logger.info('Client connected')
     emit('status', {'message': 'Connected to PurpleBrain'})
 
+# In-flight Socket.IO requests per client, cancelled when the client disconnects
+socket_requests = {}
+socket_requests_lock = threading.Lock()
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    """Abandon the client's in-flight agent work"""
+    with socket_requests_lock:
+        contexts = socket_requests.pop(request.sid, set())
+    for context in contexts:
+        context.cancel('socket disconnected')
+
 @socketio.on('agent_request')
 def handle_agent_request(data):
     """Handle real-time agent requests"""
     agent_name = data.get('agent')
     task = data.get('task')
+    sid = request.sid
     
     if agent_name in agents:
         try:
+            options = task.get('options') if isinstance(task, dict) else None
+            deadline_ms = deadlines.parse_deadline_ms(options=options)
+            admission.admit(agent_name, parse_priority(options), deadline_ms)
             # Process task asynchronously
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(agents[agent_name].process(task))
-            loop.close()
+            try:
+                tenant = tenant_policy.identify(request.headers)
+                with deadlines.request_scope(deadline_ms) as context, tenant_scope(tenant), tracer.start_trace(
+                    'socketio agent_request', **{'agent.name': agent_name, 'tenant': tenant}
+                ), accounting.usage_scope() as usage:
+                    with socket_requests_lock:
+                        socket_requests.setdefault(sid, set()).add(context)
+                    try:
+                        result = loop.run_until_complete(
+                            loop_watchdog.monitored(agents.run(agent_name, task), 'socketio-request')
+                        )
+                    finally:
+                        with socket_requests_lock:
+                            socket_requests.get(sid, set()).discard(context)
+            finally:
+                loop.close()
             
             emit('agent_response', {
                 'agent': agent_name,
-                'result': result,
+                'result': to_wire(result),
+                'accounting': usage.to_dict(),
                 'success': True
             })
+        except RequestCancelled:
+            logger.info(f"Socket request for {agent_name} cancelled after disconnect")
         except Exception as e:
             emit('agent_response', {
                 'agent': agent_name,
@@ -0,0 +1,122 @@
+"""
+PurpleBrain-AI Bulk Runner Tests
+Bad input fails one item; a run cut off mid-chunk resumes without duplicates or gaps
+"""
+
+import os
+import glob
+import gzip
+import json
+import asyncio
+
+import pytest
+
+from backend.bulk_cli import INVALID, Checkpoint, JsonlSink, ParquetSink, read_items, run_item
+
+KEYS = [f"item-{i}" for i in range(7)]
+CHUNK = 3
+
+
+def _header(tmp_path, output_format):
+    return {'input': str(tmp_path / 'queries.jsonl'), 'output': str(tmp_path / 'out'),
+            'format': output_format, 'agent': 'research'}
+
+
+def _records(keys):
+    return [{'id': key, 'agent': 'research', 'query': key, 'success': not key.endswith('3'),
+             'execution_time': 0.1, 'result': {'synthesis': key}} for key in keys]
+
+
+def _run(log, header, open_sink, output, crash_after=None, tear=None):
+    """The runner's commit loop over whatever is not done yet; stops mid-chunk after `crash_after` chunks"""
+    checkpoint = Checkpoint(log, header)
+    sink = open_sink(output, checkpoint.sink_state)
+    pending = [key for key in KEYS if key not in checkpoint.done | checkpoint.failed]
+    for chunks, start in enumerate(range(0, len(pending), CHUNK)):
+        records = _records(pending[start:start + CHUNK])
+        state = sink.write(records)
+        if chunks == crash_after:
+            # The chunk reached the output (maybe partly) but its log line was torn
+            tear(output)
+            with open(log, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'done': [r['id'] for r in records], 'failed': [], 'sink': state})[:25])
+            sink.close()
+            return
+        checkpoint.commit([r['id'] for r in records if r['success']],
+                          [r['id'] for r in records if not r['success']], state)
+    sink.close()
+
+
+def _tear_jsonl(output):
+    size = os.path.getsize(output)
+    with open(output, 'r+b') as f:
+        f.truncate(size - 10)
+
+
+def _jsonl_ids(output):
+    with gzip.open(output, 'rt', encoding='utf-8') as f:
+        return [json.loads(line)['id'] for line in f]
+
+
+@pytest.mark.parametrize('tear', [_tear_jsonl, lambda output: None])
+def test_jsonl_resume_after_crash_mid_chunk(tmp_path, tear):
+    log, output, header = str(tmp_path / 'run.checkpoint'), str(tmp_path / 'out.jsonl.gz'), _header(tmp_path, 'jsonl')
+
+    _run(log, header, JsonlSink, output, crash_after=1, tear=tear)
+    assert Checkpoint(log, header).done == set(KEYS[:CHUNK])
+
+    _run(log, header, JsonlSink, output)
+    assert _jsonl_ids(output) == KEYS
+    checkpoint = Checkpoint(log, header)
+    assert checkpoint.done | checkpoint.failed == set(KEYS)
+    assert checkpoint.failed == {'item-3'}
+
+
+def test_parquet_resume_after_crash_mid_chunk(tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet as parquet
+
+    def tear(output):
+        # A later part's write was cut off before its rename
+        with open(os.path.join(output, 'part-00002.parquet.tmp'), 'wb') as f:
+            f.write(b'PAR1')
+
+    log, output, header = str(tmp_path / 'run.checkpoint'), str(tmp_path / 'out'), _header(tmp_path, 'parquet')
+
+    _run(log, header, ParquetSink, output, crash_after=1, tear=tear)
+    assert len(glob.glob(os.path.join(output, 'part-*'))) == 3
+
+    _run(log, header, ParquetSink, output)
+    parts = sorted(glob.glob(os.path.join(output, 'part-*')))
+    assert [os.path.basename(part) for part in parts] == [f"part-{i:05d}.parquet" for i in range(3)]
+    ids = [key for part in parts for key in parquet.read_table(part).column('id').to_pylist()]
+    assert ids == KEYS
+
+
+def test_unparseable_lines_and_cells_become_invalid_items(tmp_path):
+    jsonl = tmp_path / 'queries.jsonl'
+    jsonl.write_text('"plain query"\n{"id": "a", "query": "object query"}\n{not json\n42\n\n{"query": "last"}\n')
+    items = dict(read_items(str(jsonl)))
+    assert list(items) == ['#1', 'a', '#3', '#4', '#6']
+    assert INVALID in items['#3'] and INVALID in items['#4']
+    assert not any(INVALID in items[key] for key in ('#1', 'a', '#6'))
+
+    csv_path = tmp_path / 'queries.csv'
+    csv_path.write_text('id,query,data,options\n'
+                        'good,q1,"{""x"": [1, 2]}","{""priority"": ""low""}"\n'
+                        'bad,q2,,"{priority: low}"\n')
+    items = dict(read_items(str(csv_path)))
+    assert items['good']['data'] == {'x': [1, 2]} and items['good']['options'] == {'priority': 'low'}
+    assert INVALID in items['bad']
+
+
+@pytest.mark.parametrize('item', [
+    {INVALID: 'line 3 is not valid JSON'},
+    {'data': {'x': [1]}},
+    {'query': {'nested': 'object'}},
+    {'query': 'q', 'options': 'not an object'},
+])
+def test_bad_items_fail_without_stopping_the_run(item):
+    record = asyncio.run(run_item('#3', item, 'research', None))
+    assert record['success'] is False and record['error']
+    assert record['query'] is None or isinstance(record['query'], str)
@@ -0,0 +1,61 @@
+"""
+PurpleBrain-AI Chart Data Tests
+Client render budgets are clamped to server-side limits
+"""
+
+import numpy as np
+
+from backend.chart_data import BUDGET_LIMITS, DEFAULT_BUDGET, resolve_budget, shape_chart_data
+from backend.live_dashboards import LiveDashboard
+
+
+def test_budget_keys_are_clamped_to_server_limits():
+    budget = resolve_budget({'pixel_width': 10 ** 9, 'heatmap_cells': 100000, 'max_slices': -5,
+                             'histogram_bins': 'lots', 'heatmap_tile': float('inf'), 'unknown': 1})
+    assert budget['pixel_width'] == BUDGET_LIMITS['pixel_width'][1]
+    assert budget['heatmap_cells'] == BUDGET_LIMITS['heatmap_cells'][1]
+    assert budget['max_slices'] == BUDGET_LIMITS['max_slices'][0]
+    assert budget['histogram_bins'] == DEFAULT_BUDGET['histogram_bins']
+    assert budget['heatmap_tile'] == DEFAULT_BUDGET['heatmap_tile']
+    assert 'unknown' not in budget
+    assert resolve_budget('not a budget') == DEFAULT_BUDGET
+    assert resolve_budget({'pixel_width': '600'})['pixel_width'] == 600
+
+
+def test_oversized_budget_still_downsamples_and_bounds_the_heatmap():
+    rows = 20000
+    data = {
+        'ts': np.arange(rows, dtype=np.float64).tolist(),
+        'revenue': np.random.default_rng(7).normal(100, 10, rows).tolist(),
+        'region': [f"r{i % 40}" for i in range(rows)],
+    }
+    profile = {'numeric_columns': ['ts', 'revenue'], 'categorical_columns': ['region']}
+    charts = shape_chart_data.__wrapped__(data, profile, {'pixel_width': 10 ** 7, 'heatmap_cells': 10 ** 5})
+    line = next(chart for chart in charts.values() if 'points' in chart)
+    assert line['rendered_points'] <= BUDGET_LIMITS['pixel_width'][1] < rows
+    heatmap = charts['performance_matrix']
+    assert len(heatmap['x_labels']) <= BUDGET_LIMITS['heatmap_cells'][1]
+    assert all(len(tile['cells']) <= BUDGET_LIMITS['heatmap_tile'][1] for tile in heatmap['tiles'])
+
+
+def test_live_dashboard_budget_is_clamped():
+    assert LiveDashboard(budget={'pixel_width': 1}).budget['pixel_width'] == BUDGET_LIMITS['pixel_width'][0]
+
+
+def test_non_numeric_cells_in_a_numeric_column_become_gaps():
+    data = {'revenue': [10, 20, 30, 'n/a', 50, None, {'nested': 1}, 10 ** 400], 'region': list('abababab')}
+    profile = {'numeric_columns': ['revenue'], 'categorical_columns': ['region']}
+    charts = shape_chart_data.__wrapped__(data, profile)
+    assert charts['processed_data']['source_points'] == 4
+    assert charts['category_data']['categories'] == ['a', 'b']
+    assert charts['category_data']['values'] == [90.0, 20.0]
+
+
+def test_columns_of_different_lengths_are_not_paired():
+    data = {'a': [1, 2, 3], 'b': ['x', 'y']}
+    profile = {'numeric_columns': ['a'], 'categorical_columns': ['b']}
+    charts = shape_chart_data.__wrapped__(data, profile)
+    assert charts['processed_data']['source_points'] == 3
+    assert charts['category_data']['aggregation'] == 'count'
+    assert charts['category_data']['measure'] is None
+    assert charts['category_data']['values'] == [1.0, 1.0]
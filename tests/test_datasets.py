@@ -0,0 +1,146 @@
+"""
+PurpleBrain-AI Dataset Registry Tests
+Datasets in use survive deletion and expiry until their requests are done
+"""
+
+import os
+import json
+import math
+import time
+
+import numpy as np
+import pytest
+
+from backend.datasets import DatasetBuilder, DatasetNotFound, DatasetRegistry, DatasetTooLarge, dataset_store
+from backend.payloads import PayloadStore, payload_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PayloadStore(directory=str(tmp_path))
+
+
+@pytest.fixture
+def registry(store):
+    return DatasetRegistry(store)
+
+
+def _upload(registry, store, rows=5):
+    builder = DatasetBuilder('csv', name='sales', store=store)
+    builder.feed(b"month,revenue\n" + b"".join(f"{i},{i * 10.5}\n".encode() for i in range(rows)))
+    return registry.add(builder.finish())
+
+
+def test_delete_while_leased_keeps_files_until_release(registry, store):
+    dataset = _upload(registry, store)
+    leased = []
+    data = registry.resolve({'dataset_id': dataset.dataset_id, 'columns': ['revenue']}, leased)
+    revenue = np.frombuffer(data['revenue'].view(), dtype=np.float64)
+
+    assert registry.delete(dataset.dataset_id)
+    assert registry.list() == []
+    with pytest.raises(DatasetNotFound):
+        registry.resolve({'dataset_id': dataset.dataset_id}, [])
+    assert revenue.sum() == pytest.approx(105.0)
+    assert os.listdir(store.directory)
+
+    registry.release(leased)
+    assert leased == [] and os.listdir(store.directory) == []
+
+
+def test_delete_of_an_unused_dataset_removes_files(registry, store):
+    dataset = _upload(registry, store)
+    registry.release([registry.acquire(dataset.dataset_id)])
+    assert registry.delete(dataset.dataset_id)
+    assert not registry.delete(dataset.dataset_id)
+    assert os.listdir(store.directory) == []
+
+
+def test_sweep_skips_datasets_in_use(registry, store):
+    in_use, idle = _upload(registry, store), _upload(registry, store)
+    leased = []
+    registry.resolve({'dataset_id': in_use.dataset_id}, leased)
+    in_use.expires_at = idle.expires_at = time.time() - 1
+
+    assert registry.list() == [in_use]
+    registry.release(leased)
+    in_use.expires_at = time.time() - 1
+    assert registry.list() == []
+
+
+def test_sweep_failures_do_not_reach_uploads_or_listings(registry, store, monkeypatch):
+    broken = _upload(registry, store)
+    broken.expires_at = time.time() - 1
+
+    def fail(dataset_id):
+        raise RuntimeError('disk went away')
+    monkeypatch.setattr(registry, 'delete', fail)
+
+    fresh = _upload(registry, store)
+    assert fresh in registry.list()
+
+
+def test_column_files_that_cannot_be_removed_do_not_keep_the_others(registry, store, monkeypatch):
+    dataset = _upload(registry, store)
+    month = dataset.columns['month'].payload_id
+    delete = store.delete
+
+    def flaky(payload_id):
+        if payload_id == month:
+            raise PermissionError('read-only')
+        delete(payload_id)
+    monkeypatch.setattr(store, 'delete', flaky)
+
+    assert registry.delete(dataset.dataset_id)
+    assert all(name.startswith(month) for name in os.listdir(store.directory))
+
+
+def test_uploads_over_the_limit_are_rejected(store):
+    builder = DatasetBuilder('csv', store=store, max_bytes=64)
+    builder.feed(b"month,revenue\n" + b"1,10.5\n" * 4)
+    with pytest.raises(DatasetTooLarge):
+        builder.feed(b"2,20.5\n" * 8)
+    builder.abort()
+    assert os.listdir(store.directory) == []
+
+
+def test_unbalanced_quote_cannot_buffer_the_rest_of_the_file(store):
+    builder = DatasetBuilder('csv', store=store, max_record_bytes=1024)
+    builder.feed(b'name,notes\nacme,"unterminated\n')
+    with pytest.raises(DatasetTooLarge):
+        for _ in range(100):
+            builder.feed(b"widget,42\n" * 10)
+    builder.abort()
+
+
+def test_line_without_a_newline_is_bounded(store):
+    builder = DatasetBuilder('ndjson', store=store, max_record_bytes=1024)
+    with pytest.raises(DatasetTooLarge):
+        for _ in range(100):
+            builder.feed(b'{"key": "' + b"x" * 100)
+    builder.abort()
+
+
+def test_new_column_per_line_is_capped(store):
+    builder = DatasetBuilder('ndjson', store=store, chunk_rows=4, max_columns=8)
+    with pytest.raises(DatasetTooLarge):
+        builder.feed(b"".join(json.dumps({f"key_{i}": i}).encode() + b"\n" for i in range(20)))
+        builder.finish()
+    builder.abort()
+    assert os.listdir(store.directory) == []
+
+
+def test_columns_first_seen_mid_stream_are_backfilled(store):
+    builder = DatasetBuilder('ndjson', store=store, chunk_rows=3)
+    builder.feed(b"".join(json.dumps({'a': i}).encode() + b"\n" for i in range(7)) + b'{"a": 7, "b": 1}\n')
+    dataset = builder.finish()
+    assert dataset.rows == 8
+    column = list(dataset.columns['b'].view())
+    assert all(math.isnan(value) for value in column[:7]) and column[7] == 1.0
+    for handle in dataset.columns.values():
+        handle.close()
+
+
+def test_dataset_columns_are_not_stored_with_request_payloads():
+    assert dataset_store.directory != payload_store.directory
+    assert DatasetBuilder('csv').store is dataset_store and DatasetRegistry().store is dataset_store
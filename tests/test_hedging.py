@@ -0,0 +1,67 @@
+"""
+PurpleBrain-AI Request Hedging Tests
+Failed calls are retried on the fallback model only when retrying can help, and only within the hedge budget
+"""
+
+import asyncio
+
+import pytest
+
+from backend.deadlines import DeadlineExceeded
+from backend.hedging import HedgeBudget, RequestHedger, is_retryable
+
+
+class UpstreamError(Exception):
+    def __init__(self, http_status=None):
+        super().__init__(f"upstream failed with {http_status}")
+        self.http_status = http_status
+
+
+def _hedger(credit: float = 1.0) -> RequestHedger:
+    budget = HedgeBudget(ratio=0.0, burst=1.0)
+    budget.credit = credit
+    return RequestHedger(enabled=False, budget=budget)
+
+
+def _failing_primary(error: BaseException, calls: list):
+    async def call(model):
+        calls.append(model)
+        if len(calls) == 1:
+            raise error
+        return f"answer from {model}"
+    return call
+
+
+@pytest.mark.parametrize('status', [400, 401, 403, 404])
+def test_client_errors_are_not_retried(status):
+    hedger, calls = _hedger(), []
+    with pytest.raises(UpstreamError):
+        asyncio.run(hedger.run(_failing_primary(UpstreamError(status), calls), 'primary', 'backup'))
+    assert calls == ['primary']
+    assert hedger.budget.credit == 1.0
+    assert hedger.stats()['not_retryable'] == 1
+    assert hedger.stats()['fallbacks'] == 0
+
+
+@pytest.mark.parametrize('error', [UpstreamError(429), UpstreamError(503), UpstreamError(), ConnectionError()])
+def test_transient_errors_are_retried_on_the_fallback_model(error):
+    hedger, calls = _hedger(), []
+    result = asyncio.run(hedger.run(_failing_primary(error, calls), 'primary', 'backup'))
+    assert result == 'answer from backup'
+    assert calls == ['primary', 'backup']
+    assert hedger.budget.credit == 0.0
+    assert hedger.stats()['fallbacks'] == 1
+
+
+def test_retry_is_denied_without_budget():
+    hedger, calls = _hedger(credit=0.0), []
+    with pytest.raises(UpstreamError):
+        asyncio.run(hedger.run(_failing_primary(UpstreamError(503), calls), 'primary', 'backup'))
+    assert calls == ['primary']
+    stats = hedger.stats()
+    assert (stats['budget_denied'], stats['fallbacks'], stats['failures']) == (1, 0, 1)
+
+
+def test_abandoned_requests_are_not_retryable():
+    assert not is_retryable(DeadlineExceeded(1.0))
+    assert not is_retryable(asyncio.CancelledError())
@@ -0,0 +1,56 @@
+"""
+PurpleBrain-AI Execution History Tests
+Results stored before created_at existed page, sort and expire alongside new ones
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.history import HistoryStore
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture
+def store():
+    return HistoryStore(mongomock.MongoClient().purplebrain)
+
+
+def _seed(store):
+    now = datetime.now()
+    for hours in (50, 49, 48):
+        # Baseline documents: an ISO-string timestamp only
+        store.db.agent_results.insert_one({
+            'agent': 'research', 'task_id': f"old-{hours}", 'timestamp': (now - timedelta(hours=hours)).isoformat()
+        })
+    store.db.agent_results.insert_one({'agent': 'research', 'task_id': 'old-unparseable', 'timestamp': 'yesterday'})
+    for n in range(2):
+        store.store_result({'agent': 'research', 'task_id': f"new-{n}", 'timestamp': now.isoformat()})
+
+
+def test_results_without_created_at_do_not_break_paging(store):
+    _seed(store)
+    page = store.list_results(limit=3)
+    assert [item['task_id'] for item in page['items']] == ['new-1', 'new-0']
+    assert not page['has_more']
+
+
+def test_ensure_indexes_backfills_created_at(store):
+    _seed(store)
+    store.ensure_indexes()
+    assert store.db.agent_results.count_documents({'created_at': {'$exists': False}}) == 0
+    old = store.db.agent_results.find_one({'task_id': 'old-48'})
+    # BSON dates keep milliseconds
+    assert abs(old['created_at'] - datetime.fromisoformat(old['timestamp'])) < timedelta(milliseconds=1)
+
+    task_ids, cursor = [], None
+    while True:
+        page = store.list_results(limit=2, cursor=cursor)
+        task_ids += [item['task_id'] for item in page['items']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert task_ids[:2] == ['new-1', 'new-0']
+    assert sorted(task_ids) == sorted(['new-0', 'new-1', 'old-48', 'old-49', 'old-50', 'old-unparseable'])
+    assert task_ids.index('old-48') < task_ids.index('old-49') < task_ids.index('old-50')
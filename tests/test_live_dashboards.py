@@ -0,0 +1,43 @@
+"""
+PurpleBrain-AI Live Dashboard Tests
+Subscribe and append messages from clients are validated and bounded
+"""
+
+import pytest
+
+from backend.live_dashboards import DEFAULT_WINDOW, MAX_WINDOW, DashboardHub, LiveDashboard
+
+
+@pytest.fixture
+def hub():
+    return DashboardHub()
+
+
+@pytest.mark.parametrize('window, expected', [(None, DEFAULT_WINDOW), (10, 10), (10 ** 10, MAX_WINDOW), (-3, 1)])
+def test_window_is_clamped(hub, window, expected):
+    assert hub.subscribe('owner', window=window).window.size == expected
+
+
+@pytest.mark.parametrize('window', ['5', 2.5, True, [10]])
+def test_non_integer_window_is_rejected(hub, window):
+    with pytest.raises(ValueError):
+        hub.subscribe('owner', window=window)
+
+
+@pytest.mark.parametrize('fields', [['x'], 'revenue', {'measure': ['revenue']}, {'time': {'column': 'ts'}}])
+def test_malformed_fields_are_rejected(hub, fields):
+    with pytest.raises(ValueError):
+        hub.subscribe('owner', fields=fields)
+
+
+def test_append_rejects_non_object_columns():
+    dashboard = LiveDashboard(fields={'measure': 'revenue'})
+    with pytest.raises(ValueError):
+        dashboard.append([1, 2, 3])
+
+
+def test_records_that_are_not_objects_count_as_empty_rows():
+    dashboard = LiveDashboard(fields={'measure': 'revenue', 'dimension': 'region'})
+    dashboard.append({'rows': [{'revenue': 10, 'region': 'west'}, 'oops', {'revenue': 5, 'region': 'east'}]})
+    assert dashboard.rows == 3
+    assert dashboard.count == 2
@@ -0,0 +1,83 @@
+"""
+PurpleBrain-AI Payload Handle Tests
+Deleting a payload never breaks a reader that still holds its buffers; only floats and strings are wrapped
+"""
+
+import os
+import gc
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.payloads import PayloadStore, leased, to_wire
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PayloadStore(directory=str(tmp_path), min_items=4)
+
+
+def _files(store, handle):
+    return [name for name in os.listdir(store.directory) if name.startswith(handle.payload_id)]
+
+
+def test_delete_while_leased_defers_the_unmap(store):
+    handle = store.put([1.0, 2.0, 3.0, 4.0])
+    text = store.put(['a', 'bb', 'ccc', 'dddd'])
+    with leased({'task': SimpleNamespace(data={'x': handle, 'labels': [text]})}) as handles:
+        assert handles == [handle, text]
+        values, labels = handle.view(), text.view()
+        store.release([handle, text])
+        # The files are gone at once, the mappings are not
+        assert not _files(store, handle) and not _files(store, text)
+        assert list(values) == [1.0, 2.0, 3.0, 4.0] and list(labels) == ['a', 'bb', 'ccc', 'dddd']
+    assert handle._maps == [] and text._maps == []
+    with pytest.raises(ValueError):
+        values[0]
+
+
+def test_delete_without_leases_unmaps_at_once(store):
+    handle = store.put([1.0, 2.0, 3.0, 4.0])
+    handle.view()
+    store.delete(handle.payload_id)
+    assert handle._maps == [] and not _files(store, handle)
+
+
+@pytest.mark.parametrize('export', [
+    lambda view: np.frombuffer(view, dtype=np.float64),
+    lambda view: view[1:3],
+])
+def test_delete_with_exported_buffers_does_not_raise(store, export):
+    handle = store.put([1.0, 2.0, 3.0, 4.0])
+    exported = export(handle.view())
+    store.delete(handle.payload_id)
+    assert handle._maps == [] and not _files(store, handle)
+    del exported
+    gc.collect()
+
+
+def test_nested_leases_unmap_after_the_last_one(store):
+    handle = store.put([1.0, 2.0, 3.0, 4.0])
+    handle.acquire()
+    handle.acquire()
+    handle.view()
+    handle.close()
+    handle.release()
+    assert handle._maps
+    handle.release()
+    assert handle._maps == []
+
+
+def test_int_and_bool_lists_are_not_stored_as_floats(store):
+    ids = [2 ** 53 + 1, 2 ** 63, 10 ** 400, None]
+    assert store.put(ids) is None
+    assert store.put([True, False, None]) is None
+    assert store.put([1, 2.5, 3]) is None
+
+    created = []
+    data = store.wrap({'ids': ids * 2500, 'score': [0.5, None] * 5000}, created)
+    assert data['ids'][0] == 2 ** 53 + 1 and isinstance(data['ids'][0], int)
+    assert to_wire(data)['score'][:2] == [0.5, None]
+    assert len(created) == 1
+    store.release(created)
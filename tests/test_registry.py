@@ -0,0 +1,161 @@
+"""
+PurpleBrain-AI Agent Registry Tests
+Agent lookup errors, and fair, capped and leak-free slot scheduling per tenant
+"""
+
+import asyncio
+
+import pytest
+
+from backend.datasets import DatasetNotFound, DatasetRegistry
+from backend.registry import AgentBusyError, AgentNotFound, AgentRegistry, _Slots
+from backend.tenants import TenantPolicy
+
+
+class FailingAgent:
+    async def process(self, task):
+        return task['missing']
+
+
+def test_unknown_agent_raises_agent_not_found():
+    registry = AgentRegistry()
+    with pytest.raises(AgentNotFound) as raised:
+        asyncio.run(registry.run('nonexistent', {}))
+    assert str(raised.value) == 'Agent nonexistent not found'
+
+
+def test_agent_key_errors_are_not_reported_as_not_found():
+    registry = AgentRegistry()
+    registry.register('failing', FailingAgent)
+    with pytest.raises(KeyError) as raised:
+        asyncio.run(registry.run('failing', {}))
+    assert raised.value.args == ('missing',)
+    assert not isinstance(raised.value, (AgentNotFound, DatasetNotFound))
+
+
+def test_unknown_dataset_raises_dataset_not_found():
+    with pytest.raises(DatasetNotFound):
+        DatasetRegistry().resolve({'dataset_id': 'missing'}, [])
+
+
+async def _settle():
+    """Let slot grants scheduled with call_soon_threadsafe run"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_freed_slots_are_shared_by_tenant_weight():
+    async def scenario():
+        slots = _Slots(1, 100, TenantPolicy({'heavy': {'weight': 2}, 'light': {'weight': 1}}))
+        await slots.acquire('agent', 'holder')
+        order = []
+
+        async def request(tenant):
+            await slots.acquire('agent', tenant)
+            order.append(tenant)
+            slots.release(tenant)
+
+        tasks = [asyncio.ensure_future(request(tenant)) for tenant in ['heavy'] * 6 + ['light'] * 6]
+        await _settle()
+        assert slots.queued == 12
+        slots.release('holder')
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(scenario())
+    assert order[:9] == ['heavy', 'heavy', 'light'] * 3
+    assert order[9:] == ['light'] * 3
+
+
+def test_tenant_cap_queues_behind_free_slots():
+    async def scenario():
+        slots = _Slots(3, 10, TenantPolicy({'bulk': {'max_concurrency': 1}}))
+        await slots.acquire('agent', 'bulk')
+        second = asyncio.ensure_future(slots.acquire('agent', 'bulk'))
+        await _settle()
+        assert not second.done()
+        await slots.acquire('agent', 'acme')
+        assert slots.tenants() == {'acme': {'in_flight': 1, 'queued': 0}, 'bulk': {'in_flight': 1, 'queued': 1}}
+        slots.release('bulk')
+        await _settle()
+        assert second.done()
+        assert (slots.in_use, slots.queued) == (2, 0)
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_pushes_out_the_tenant_most_over_its_share():
+    async def scenario():
+        slots = _Slots(1, 2)
+        await slots.acquire('agent', 'holder')
+        bulk = [asyncio.ensure_future(slots.acquire('agent', 'bulk')) for _ in range(2)]
+        await _settle()
+        other = asyncio.ensure_future(slots.acquire('agent', 'other'))
+        await _settle()
+        with pytest.raises(AgentBusyError):
+            await bulk[1]
+        assert not bulk[0].done() and not other.done()
+        assert slots.tenants()['bulk']['queued'] == 1
+        assert slots.tenants()['other']['queued'] == 1
+        # With the backlogs even, a full queue turns the next request away
+        with pytest.raises(AgentBusyError):
+            await slots.acquire('agent', 'bulk')
+        for task in (bulk[0], other):
+            task.cancel()
+        await _settle()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        slots = _Slots(1, 10)
+        await slots.acquire('agent', 'holder')
+        waiting = asyncio.ensure_future(slots.acquire('agent', 'client'))
+        await _settle()
+        waiting.cancel()
+        await _settle()
+        assert (slots.in_use, slots.queued) == (1, 0)
+        slots.release('holder')
+        assert slots.in_use == 0
+
+    asyncio.run(scenario())
+
+
+def test_waiter_cancelled_after_its_grant_gives_the_slot_back():
+    async def scenario():
+        slots = _Slots(1, 10)
+        await slots.acquire('agent', 'holder')
+        waiting = asyncio.ensure_future(slots.acquire('agent', 'client'))
+        await _settle()
+        # The slot is handed over, then the request is cancelled before it wakes up
+        slots.release('holder')
+        assert slots.in_use == 1
+        waiting.cancel()
+        await _settle()
+        assert waiting.cancelled()
+        assert (slots.in_use, slots.queued) == (0, 0)
+        assert slots.tenants() == {}
+        await slots.acquire('agent', 'next')
+        assert slots.in_use == 1
+
+    asyncio.run(scenario())
+
+
+def test_finish_tags_of_idle_tenants_are_forgotten():
+    async def scenario():
+        slots = _Slots(1, 1000)
+        await slots.acquire('agent', 'holder')
+
+        async def request(tenant):
+            await slots.acquire('agent', tenant)
+            slots.release(tenant)
+
+        tasks = [asyncio.ensure_future(request(f"client-{n}")) for n in range(200)]
+        await _settle()
+        assert len(slots._finish) == 200
+        slots.release('holder')
+        await asyncio.gather(*tasks)
+        assert slots._finish == {} and slots._virtual == 0.0
+
+    asyncio.run(scenario())
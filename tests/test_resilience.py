@@ -0,0 +1,236 @@
+"""
+PurpleBrain-AI Upstream Resilience Tests
+Circuit breaker state changes and stale-while-revalidate serving, on a controlled clock
+"""
+
+import time
+import asyncio
+
+import pytest
+
+from backend import accounting, deadlines, resilience
+from backend.deadlines import DeadlineExceeded
+from backend.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, LastGoodCache, breakers
+
+
+class Clock:
+    """Stands in for the time module; only moves when told to"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class Refresher:
+    """Collects background revalidations instead of running them on a thread"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, coroutine):
+        self.submitted.append(coroutine)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience, 'time', clock)
+    return clock
+
+
+def _breaker(**overrides) -> CircuitBreaker:
+    settings = {'failure_rate': 0.5, 'slow_call_s': 5.0, 'min_calls': 4, 'open_s': 30.0, 'window': 10}
+    return CircuitBreaker('upstream', **{**settings, **overrides})
+
+
+def _trip(breaker: CircuitBreaker):
+    for _ in range(breaker.min_calls):
+        assert breaker.allow()
+        breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+
+
+def test_breaker_opens_once_enough_recent_calls_fail(clock):
+    breaker = _breaker()
+    for success in (True, False, True):
+        breaker.record(success, 0.1)
+    assert breaker.state == CLOSED
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+    assert breaker.is_open() and not breaker.allow()
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = _breaker()
+    for _ in range(2):
+        breaker.record(True, 0.1)
+        breaker.record(True, 5.0)
+    assert breaker.state == OPEN
+    assert breaker.stats()['slow_calls'] == 2
+
+
+def test_half_open_lets_exactly_one_probe_through_and_closes_on_success(clock):
+    breaker = _breaker()
+    _trip(breaker)
+    clock.advance(29.9)
+    assert not breaker.allow()
+    clock.advance(0.1)
+    assert not breaker.is_open()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert breaker.is_open() and not breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.stats()['recent_failure_rate'] == 0.0
+
+
+def test_failed_or_slow_probe_reopens_for_a_full_period(clock):
+    for latency, success in ((0.1, False), (5.0, True)):
+        breaker = _breaker()
+        _trip(breaker)
+        clock.advance(30)
+        assert breaker.allow()
+        breaker.record(success, latency)
+        assert breaker.state == OPEN and breaker.opened_at == clock.now
+        assert breaker.stats()['opened'] == 2
+        clock.advance(29)
+        assert not breaker.allow()
+        clock.advance(1)
+        assert breaker.allow()
+
+
+@pytest.mark.parametrize('abandoned', [asyncio.CancelledError, lambda: DeadlineExceeded('deadline passed')])
+def test_abandoned_probe_releases_its_slot_without_a_verdict(clock, abandoned):
+    breaker = _breaker()
+    _trip(breaker)
+    clock.advance(30)
+
+    async def give_up():
+        raise abandoned()
+
+    with pytest.raises((asyncio.CancelledError, DeadlineExceeded)):
+        asyncio.run(breaker.call(give_up))
+    assert breaker.state == HALF_OPEN
+    assert breaker.stats()['calls'] == breaker.min_calls
+    # The next caller gets the probe instead of waiting for another open period
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_call_fails_fast_while_open(clock):
+    breaker = _breaker()
+    _trip(breaker)
+    attempted = []
+
+    async def upstream():
+        attempted.append(True)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(breaker.call(upstream))
+    assert attempted == []
+
+
+@pytest.fixture
+def cache(clock):
+    cache = LastGoodCache(max_entries=2, max_age=600.0)
+    cache._refresher = Refresher()
+    yield cache
+    for coroutine in cache._refresher.submitted:
+        coroutine.close()
+
+
+def _failing():
+    async def compute():
+        raise ConnectionError('upstream down')
+    return compute
+
+
+def _answer(value):
+    async def compute():
+        return value
+    return compute
+
+
+def test_stale_result_is_served_when_the_upstream_fails(cache, clock):
+    served = asyncio.run(cache.serve('query', _answer('fresh'), 'test-stale-on-failure'))
+    assert (served.value, served.stale) == ('fresh', False)
+    clock.advance(120)
+    served = asyncio.run(cache.serve('query', _failing(), 'test-stale-on-failure'))
+    assert (served.value, served.stale, served.age_s) == ('fresh', True, 120.0)
+    assert len(cache._refresher.submitted) == 1
+    assert cache.stats()['stale_served'] == 1
+
+
+def test_results_older_than_max_age_are_not_served(cache, clock):
+    asyncio.run(cache.serve('query', _answer('fresh'), 'test-max-age'))
+    clock.advance(600.1)
+    with pytest.raises(ConnectionError):
+        asyncio.run(cache.serve('query', _failing(), 'test-max-age'))
+    assert cache.get('query') is None
+    assert cache.stats()['unavailable'] == 1
+
+
+def test_open_circuit_serves_stale_without_waiting_and_refreshes_in_the_background(cache, clock):
+    breaker = breakers.get('test-open-circuit')
+    asyncio.run(cache.serve('query', _answer('old'), 'test-open-circuit'))
+    for _ in range(breaker.min_calls):
+        breaker.record(False, 0.1)
+    attempted = []
+
+    async def compute():
+        attempted.append(True)
+        return 'new'
+
+    served = asyncio.run(cache.serve('query', compute, 'test-open-circuit'))
+    assert (served.value, served.stale) == ('old', True)
+    assert attempted == []
+    # Repeated stale hits within the refresh interval share one revalidation
+    asyncio.run(cache.serve('query', compute, 'test-open-circuit'))
+    assert len(cache._refresher.submitted) == 1
+    asyncio.run(cache._refresher.submitted.pop())
+    assert cache.get('query')[1] == 'new'
+    assert cache.stats()['refreshes'] == 1
+
+
+def test_least_recently_used_entries_are_dropped(cache):
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a')[1] == 1 and cache.get('c')[1] == 3
+
+
+def test_background_refresh_runs_outside_the_request_context():
+    cache = LastGoodCache()
+    seen = {}
+
+    async def compute():
+        await asyncio.sleep(0.2)  # longer than the request's deadline
+        seen['deadline'] = deadlines.remaining()
+        seen['usage'] = accounting.current()
+        return 'refreshed'
+
+    async def request():
+        with deadlines.request_scope(100), accounting.usage_scope():
+            cache._refresher.submit(cache._refresh('query', compute))
+
+    asyncio.run(request())
+    waited = time.monotonic() + 5
+    while cache.get('query') is None and time.monotonic() < waited:
+        time.sleep(0.01)
+    assert cache.get('query')[1] == 'refreshed'
+    assert seen == {'deadline': None, 'usage': None}
+    assert cache.stats()['refresh_failures'] == 0
@@ -0,0 +1,81 @@
+"""
+PurpleBrain-AI Semantic Cache Tests
+Paraphrases share an entry; different questions about the same subject do not
+"""
+
+import json
+import asyncio
+
+import pytest
+
+from backend.llm import chat_completion
+from backend.semantic_cache import SemanticCache, normalize_prompt
+
+DIFFERENT_QUESTIONS = [
+    ("Why does the checkout service fail under load?", "How does the checkout service fail under load?"),
+    ("What changed in the billing pipeline?", "When changed in the billing pipeline?"),
+    ("Can we shard the events table?", "Should we shard the events table?"),
+    ("Which regions does the outage affect?", "Where does the outage affect?"),
+]
+
+
+@pytest.mark.parametrize('first, second', DIFFERENT_QUESTIONS)
+def test_interrogatives_and_modals_do_not_collide(first, second):
+    assert normalize_prompt(first) != normalize_prompt(second)
+
+    cache = SemanticCache(path='')
+    cache.store('ns', first, 'first answer')
+    assert cache.lookup('ns', second) is None
+    assert cache.lookup('ns', first) == 'first answer'
+
+
+ENTITY_SWAPS = [
+    ("Research market trends in AI platforms for Europe", "Research market trends in AI platforms for Asia"),
+    ("Research remote work productivity and employee engagement trends in Germany",
+     "Research remote work productivity and employee engagement trends in Japan"),
+    ("Compare pricing and churn of the premium subscription tier for enterprise customers",
+     "Compare pricing and churn of the basic subscription tier for enterprise customers"),
+]
+
+
+@pytest.mark.parametrize('first, second', ENTITY_SWAPS)
+def test_questions_about_different_entities_do_not_collide(first, second):
+    cache = SemanticCache(path='')
+    cache.store('ns', first, 'first answer')
+    # Close enough in embedding space that only the content-word check keeps them apart
+    assert cache.vectorizer.embed(normalize_prompt(first)) @ cache.vectorizer.embed(normalize_prompt(second)) \
+        >= cache.threshold
+    assert cache.lookup('ns', second) is None
+
+
+def test_paraphrases_still_share_an_entry():
+    assert normalize_prompt("What's the revenue by region?") == normalize_prompt("what is the revenue by region")
+
+    cache = SemanticCache(path='')
+    cache.store('ns', 'Please explain why the checkout service fails under load', 'answer')
+    assert cache.lookup('ns', 'Why the checkout service fails under load?') == 'answer'
+    assert cache.lookup('ns', 'Why is the checkout service failing under load?') == 'answer'
+    assert cache.stats()['exact_hits'] == 1
+
+
+def test_entries_saved_under_older_normalization_are_not_loaded(tmp_path):
+    path = tmp_path / 'cache.jsonl'
+    cache = SemanticCache(path=str(path))
+    cache.store('ns', 'why does x fail', 'current')
+    cache.save()
+    with open(path, 'a', encoding='utf-8') as f:
+        entry = json.loads(path.read_text().splitlines()[0])
+        del entry['normalization']
+        f.write(json.dumps({**entry, 'prompt': 'x fail', 'response': 'old'}) + '\n')
+        f.write(json.dumps({**entry, 'prompt': 'y fail', 'response': 'old', 'normalization': 1}) + '\n')
+
+    loaded = SemanticCache(path=str(path))
+    loaded.load()
+    assert loaded.lookup('ns', 'why does x fail') == 'current'
+    assert loaded.lookup('ns', 'x fail') is None
+    assert loaded.lookup('ns', 'y fail') is None
+
+
+def test_chat_completion_rejects_a_task_dict_as_cache_key():
+    with pytest.raises(TypeError):
+        asyncio.run(chat_completion('system', 'prompt', cache_key={'query': 'x'}, cache=SemanticCache(path='')))
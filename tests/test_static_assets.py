@@ -0,0 +1,58 @@
+"""
+PurpleBrain-AI Static Asset Tests
+Compressed variants are only reused from a private cache directory and only when they match the file
+"""
+
+import os
+import gzip
+
+import pytest
+
+from backend.static_assets import StaticAssets
+
+SCRIPT = 'console.log("purplebrain");\n' * 200
+
+
+@pytest.fixture
+def directory(tmp_path):
+    static = tmp_path / 'static'
+    static.mkdir()
+    (static / 'app.js').write_text(SCRIPT)
+    return static
+
+
+def _served(assets):
+    response = assets.resolve('app.js', {'Accept-Encoding': 'gzip'})
+    with open(response.path, 'rb') as served:
+        body = served.read()
+    return gzip.decompress(body) if response.headers.get('Content-Encoding') == 'gzip' else body
+
+
+def test_planted_variant_is_rebuilt_not_served(directory, tmp_path):
+    cache = tmp_path / 'cache'
+    assets = StaticAssets(str(directory), str(cache))
+    assets.build()
+    variant = assets._assets['app.js'].variants['gzip'][0]
+    with open(variant, 'wb') as planted:
+        planted.write(gzip.compress(b'alert("planted")'))
+
+    rebuilt = StaticAssets(str(directory), str(cache))
+    rebuilt.build()
+    assert _served(rebuilt) == SCRIPT.encode()
+
+
+def test_cache_directory_is_created_owner_only(directory, tmp_path):
+    cache = tmp_path / 'cache'
+    StaticAssets(str(directory), str(cache)).build()
+    assert os.stat(cache).st_mode & 0o077 == 0
+
+
+def test_shared_cache_directory_is_not_used(directory, tmp_path):
+    cache = tmp_path / 'shared'
+    cache.mkdir()
+    os.chmod(cache, 0o777)
+    assets = StaticAssets(str(directory), str(cache))
+    assets.build()
+    assert assets._assets['app.js'].variants == {}
+    assert os.listdir(cache) == []
+    assert _served(assets) == SCRIPT.encode()
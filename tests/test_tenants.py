@@ -0,0 +1,33 @@
+"""
+PurpleBrain-AI Tenant Tests
+Caller identification and bounded per-tenant metrics
+"""
+
+from backend.tenants import DEFAULT_TENANT, TenantMetrics, TenantPolicy
+
+
+def test_identify_prefers_api_keys_over_the_tenant_header():
+    policy = TenantPolicy({'acme': {'api_keys': ['secret']}})
+    assert policy.identify({'X-API-Key': 'secret', 'X-Tenant-Id': 'other'}) == 'acme'
+    assert policy.identify({'Authorization': 'Bearer unknown'}).startswith('key:')
+    assert policy.identify({'X-Tenant-Id': 'x' * 100}) == 'x' * 64
+    assert policy.identify({}) == DEFAULT_TENANT
+
+
+def test_metrics_keep_only_the_most_recently_active_tenants():
+    metrics = TenantMetrics(max_entries=3)
+    for n in range(1000):
+        metrics.record(f"client-{n}", 'research', 0.0, 0.1, True)
+    assert sorted(metrics.stats()) == ['client-997', 'client-998', 'client-999']
+
+
+def test_active_tenants_survive_a_flood_of_new_ids():
+    metrics = TenantMetrics(max_entries=2)
+    metrics.record('acme', 'research', 0.0, 0.1, True)
+    for n in range(10):
+        metrics.record(f"client-{n}", 'research', 0.0, 0.1, True)
+        metrics.record_rejected('acme', 'research')
+    stats = metrics.stats()
+    assert set(stats) == {'acme', 'client-9'}
+    assert stats['acme']['research']['completed'] == 1
+    assert stats['acme']['research']['rejected'] == 10